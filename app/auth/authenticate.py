@@ -2,6 +2,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .jwt_handler import verify_access_token
+from database.config import get_settings
 
 # Схема OAuth2 для получения токена из заголовка Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
@@ -50,4 +51,26 @@ async def authenticate_cookie(token: str = Depends(oauth2_scheme)) -> str:
         )
     token = token.removeprefix('Bearer ')
     decoded_token = verify_access_token(token)
-    return decoded_token["user"]
\ No newline at end of file
+    return decoded_token["user"]
+
+def is_admin(user_id: str) -> bool:
+    """Входит ли пользователь в ADMIN_USER_IDS"""
+    try:
+        return int(user_id) in get_settings().ADMIN_USER_IDS
+    except (TypeError, ValueError):
+        return False
+
+
+async def authenticate_admin(user_id: str = Depends(authenticate)) -> str:
+    """
+    Проверяет, что пользователь из токена является администратором.
+
+    Raises:
+        HTTPException: Если пользователь не входит в ADMIN_USER_IDS
+    """
+    if not is_admin(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return user_id
@@ -1,15 +1,47 @@
 # app/auth/hash_password.py
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from passlib.context import CryptContext
+from database.config import get_settings
 
-# Создаем контекст с использованием bcrypt алгоритма
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+settings = get_settings()
+
+# Создаем контекст с использованием bcrypt алгоритма.
+# Хеши с другой стоимостью считаются устаревшими и пересчитываются при входе.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
+
+# bcrypt отпускает GIL, поэтому потоков достаточно, чтобы не блокировать event loop
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS or max(1, (os.cpu_count() or 2) // 2),
+    thread_name_prefix="bcrypt"
+)
+
+
+class HashPoolBusyError(Exception):
+    """Очередь хеширования переполнена, запрос нужно повторить позже"""
 
 
 class HashPassword:
     """
     Класс для хеширования и верификации паролей с использованием bcrypt.
+
+    Асинхронные методы выполняют bcrypt в ограниченном пуле потоков и
+    отклоняют запросы сверх PASSWORD_HASH_QUEUE_LIMIT, чтобы шторм входов
+    не занимал event loop и не копил бесконечную очередь.
     """
 
+    _pending = 0
+    _pending_lock = threading.Lock()
+
     def create_hash(self, password: str) -> str:
         """
         Создает хеш из переданного пароля.
@@ -33,4 +65,39 @@ class HashPassword:
         Returns:
             bool: True если пароль соответствует хешу, False в противном случае
         """
-        return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+        return pwd_context.verify(plain_password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Проверяет, создан ли хеш с устаревшими параметрами"""
+        return pwd_context.needs_update(hashed_password)
+
+    async def _run(self, func, *args):
+        """Выполнение bcrypt в пуле с ограничением очереди"""
+        cls = type(self)
+        with cls._pending_lock:
+            if cls._pending >= settings.PASSWORD_HASH_QUEUE_LIMIT:
+                raise HashPoolBusyError("Слишком много одновременных операций с паролями")
+            cls._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+        finally:
+            with cls._pending_lock:
+                cls._pending -= 1
+
+    async def acreate_hash(self, password: str) -> str:
+        """Асинхронный create_hash в пуле хеширования"""
+        return await self._run(pwd_context.hash, password)
+
+    async def averify_hash(self, plain_password: str, hashed_password: str) -> bool:
+        """Асинхронный verify_hash в пуле хеширования"""
+        return await self._run(pwd_context.verify, plain_password, hashed_password)
+
+    async def averify_and_update(self, plain_password: str,
+                                 hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет пароль и, если хеш устарел, возвращает новый.
+
+        Returns:
+            Tuple: (пароль верен, новый хеш или None)
+        """
+        return await self._run(pwd_context.verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,382 @@
+# app/benchmarks/load_test.py
+"""
+Нагрузочный тест HTTP API со смесью действий, как у фронтенда.
+
+Генератор открытого цикла: запросы отправляются по расписанию с целевым
+RPS независимо от того, успели ли ответить предыдущие, а задержка
+считается от запланированного момента, поэтому очередь перед сервером
+тоже попадает в перцентили. Смесь повторяет фронтенд: просмотр каталога,
+поиск, карточка товара с добавлением в корзину (корзина живет на клиенте),
+оформление заказа, персональные и популярные рекомендации, вход.
+
+По умолчанию приложение запускается в этом же процессе через
+ASGITransport на файловой SQLite с синтетическими данными, RabbitMQ
+заменяется очередью в памяти, Redis - fakeredis (если установлен).
+--database-url подключает пустую локальную БД (например Postgres), --url
+направляет нагрузку на уже запущенный сервер.
+
+Запуск:
+    python -m benchmarks.load_test [--rps=50] [--duration=30] [--users=500] [--products=2000]
+        [--max-inflight=256] [--timeout=10] [--database-url=URL] [--url=http://localhost:8080]
+"""
+import sys
+import time
+import random
+import asyncio
+import logging
+import tempfile
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import insert, update
+from sqlmodel import SQLModel, Session, create_engine, select, func
+
+# Добавляем путь к проекту
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from main import app
+from auth.hash_password import HashPassword
+from auth.jwt_handler import create_access_token
+from benchmarks.stats import percentiles
+from benchmarks.standins import InProcessQueue, fake_redis, install
+from benchmarks.synthetic import SyntheticConfig, generate, populate, interaction_matrix, create_sqlite_engine
+from database.database import get_session
+from models.product import Product
+from models.recommendation import ModelType, Recommendation
+from models.user import User
+
+PASSWORD = "loadtest123"
+
+# Доли действий в смеси
+MIX: Dict[str, float] = {
+    "browse": 30,
+    "search": 15,
+    "add_to_cart": 20,
+    "order": 5,
+    "recommendations": 20,
+    "popular": 8,
+    "login": 2,
+}
+
+SEARCH_TERMS = ["Product 1", "Product 2", "Product 3", "Product 42", "Product 7", "Product 99"]
+
+
+@dataclass
+class VirtualUser:
+    """Пользователь нагрузки с токеном и корзиной на клиенте"""
+    user_id: int
+    email: str
+    token: str
+    cart: List[int] = field(default_factory=list)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class LoadStats:
+    """Задержки и статусы по эндпоинтам"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, label: str, latency: float, status: str) -> None:
+        self.latencies[label].append(latency)
+        self.statuses[label][status] += 1
+
+    def report(self) -> Dict[str, Dict]:
+        result = {}
+        for label in sorted(self.latencies):
+            statuses = self.statuses[label]
+            total = sum(statuses.values())
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "4")))
+            client_errors = sum(count for status, count in statuses.items() if status.startswith("4"))
+            result[label] = {
+                **percentiles(self.latencies[label]),
+                "requests": total,
+                "error_rate": errors / total,
+                "client_error_rate": client_errors / total,
+                "statuses": dict(statuses),
+            }
+        return result
+
+
+class LoadContext:
+    """Общее состояние сценариев одного прогона"""
+
+    def __init__(self, client: httpx.AsyncClient, products: int, departments: int, seed: int):
+        self.client = client
+        self.products = products
+        self.departments = departments
+        self.rng = random.Random(seed)
+        self.stats = LoadStats()
+
+    async def request(self, label: str, method: str, url: str, started: Optional[float] = None,
+                      **kwargs) -> Optional[httpx.Response]:
+        """Запрос с записью задержки; started - запланированный момент отправки"""
+        started = started if started is not None else time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.TimeoutException:
+            self.stats.record(label, time.perf_counter() - started, "timeout")
+            return None
+        except Exception as e:
+            self.stats.record(label, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.stats.record(label, time.perf_counter() - started, str(response.status_code))
+        return response
+
+
+async def _browse(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    params = {"limit": 20}
+    if ctx.rng.random() < 0.5:
+        params["department_id"] = ctx.rng.randint(1, ctx.departments)
+    elif ctx.rng.random() < 0.5:
+        params["cursor"] = ctx.rng.randint(0, ctx.products)
+    await ctx.request("GET /products/", "GET", "/products/", scheduled, params=params)
+
+
+async def _search(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    params = {"search": ctx.rng.choice(SEARCH_TERMS), "limit": 20}
+    await ctx.request("GET /products/?search", "GET", "/products/", scheduled, params=params)
+
+
+async def _add_to_cart(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    # Корзина хранится на клиенте, на сервер уходит только просмотр карточки
+    product_id = ctx.rng.randint(1, ctx.products)
+    response = await ctx.request("GET /products/{id}", "GET", f"/products/{product_id}", scheduled)
+    if response is not None and response.status_code == 200:
+        user.cart.append(product_id)
+
+
+async def _order(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    product_ids = list(dict.fromkeys(user.cart)) or ctx.rng.sample(range(1, ctx.products + 1), 3)
+    user.cart = []
+    payload = {"items": [{"product_id": pid, "quantity": 1} for pid in product_ids]}
+    response = await ctx.request("POST /orders/", "POST", "/orders/", scheduled, json=payload, headers=user.headers)
+    if response is not None and response.status_code == 200:
+        # После заказа фронтенд перечитывает рекомендации
+        await ctx.request("GET /recommendations/?collaborative", "GET", "/recommendations/",
+                          params={"model_type": "collaborative", "limit": 10}, headers=user.headers)
+
+
+async def _recommendations(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    await ctx.request("GET /recommendations/?collaborative", "GET", "/recommendations/", scheduled,
+                      params={"model_type": "collaborative", "limit": 10}, headers=user.headers)
+    await ctx.request("GET /recommendations/preferences", "GET", "/recommendations/preferences",
+                      headers=user.headers)
+
+
+async def _popular(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    await ctx.request("GET /recommendations/?popular", "GET", "/recommendations/", scheduled,
+                      params={"model_type": "popular", "limit": 10}, headers=user.headers)
+
+
+async def _login(ctx: LoadContext, user: VirtualUser, scheduled: float) -> None:
+    await ctx.request("POST /auth/login", "POST", "/auth/login", scheduled,
+                      json={"email": user.email, "password": PASSWORD})
+
+
+SCENARIOS: Dict[str, Callable[[LoadContext, VirtualUser, float], Awaitable[None]]] = {
+    "browse": _browse,
+    "search": _search,
+    "add_to_cart": _add_to_cart,
+    "order": _order,
+    "recommendations": _recommendations,
+    "popular": _popular,
+    "login": _login,
+}
+
+
+async def run_load(client: httpx.AsyncClient, users: List[VirtualUser], products: int, departments: int,
+                   rps: float, duration: float, max_inflight: int = 256,
+                   mix: Optional[Dict[str, float]] = None, seed: int = 42) -> Dict:
+    """
+    Нагрузка открытого цикла с целевым RPS.
+
+    Действия, пришедшие при max_inflight незавершенных, отбрасываются и
+    считаются отдельно, чтобы перегруженный сервер не копил бесконечную очередь.
+    """
+    mix = {name: weight for name, weight in (mix or MIX).items() if weight > 0}
+    names, weights = list(mix), list(mix.values())
+    ctx = LoadContext(client, products, departments, seed)
+
+    tasks = set()
+    dropped = 0
+    actions = Counter()
+    total = int(rps * duration)
+    started = time.perf_counter()
+    for i in range(total):
+        scheduled = started + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_inflight:
+            dropped += 1
+            continue
+
+        name = ctx.rng.choices(names, weights)[0]
+        actions[name] += 1
+        task = asyncio.create_task(SCENARIOS[name](ctx, ctx.rng.choice(users), scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    endpoints = ctx.stats.report()
+    requests = sum(stats["requests"] for stats in endpoints.values())
+    errors = sum(stats["error_rate"] * stats["requests"] for stats in endpoints.values())
+    return {
+        "target_rps": rps,
+        "duration": elapsed,
+        "actions": dict(actions),
+        "dropped_actions": dropped,
+        "requests": requests,
+        "achieved_rps": requests / elapsed if elapsed > 0 else 0.0,
+        "error_rate": errors / requests if requests else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def _seed_recommendations(engine, data) -> None:
+    """Персональные рекомендации для всех пользователей, как после генерации воркером"""
+    from services.recommendation_service import RecommendationService
+
+    matrix, user_ids, product_ids = interaction_matrix(data)
+    service = RecommendationService(session=None)
+    service.redis = None
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.train_model()
+
+    rows = []
+    created_at = datetime.utcnow()
+    ids = user_ids.tolist()
+    for start in range(0, len(ids), 256):
+        batch = service.generate_recommendations_batch(ids[start:start + 256])
+        for user_id, (products, scores) in batch.items():
+            rows.extend({"user_id": user_id, "product_id": product_id, "score": max(0.0, min(score, 1.0)),
+                         "model_type": ModelType.COLLABORATIVE.value, "created_at": created_at}
+                        for product_id, score in zip(products, scores))
+
+    with Session(engine) as session:
+        session.execute(insert(Recommendation.__table__), rows)
+        session.commit()
+
+
+def prepare_database(config: SyntheticConfig, workdir, database_url: Optional[str] = None):
+    """
+    БД с синтетическими каталогом, заказами, паролями и рекомендациями.
+
+    Внешняя БД должна быть пустой: в уже заполненной данные не генерируются.
+    """
+    if database_url:
+        engine = create_engine(database_url)
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            if session.exec(select(func.count(Product.id))).one() > 0:
+                logging.getLogger(__name__).warning("БД уже заполнена, используем существующие данные")
+                return engine
+    else:
+        engine = create_sqlite_engine(str(Path(workdir) / "load_test.db"))
+
+    data = generate(config)
+    populate(engine, data)
+    # Один хеш на всех: bcrypt на каждого пользователя занял бы минуты
+    password_hash = HashPassword().create_hash(PASSWORD)
+    with Session(engine) as session:
+        session.execute(update(User.__table__).values(password_hash=password_hash))
+        session.commit()
+    _seed_recommendations(engine, data)
+    return engine
+
+
+def virtual_users(count: int) -> List[VirtualUser]:
+    """Пользователи 1..count с заранее выданными токенами"""
+    return [
+        VirtualUser(user_id=user_id, email=f"user{user_id}@example.com", token=create_access_token(str(user_id)))
+        for user_id in range(1, count + 1)
+    ]
+
+
+async def run_in_process(config: SyntheticConfig, rps: float, duration: float, max_inflight: int = 256,
+                         timeout: float = 10.0, database_url: Optional[str] = None,
+                         mix: Optional[Dict[str, float]] = None, seed: int = 42) -> Dict:
+    """Прогон против приложения в этом процессе с локальными заменителями сервисов"""
+    with tempfile.TemporaryDirectory() as workdir:
+        engine = prepare_database(config, workdir, database_url)
+
+        def get_session_override():
+            with Session(engine) as session:
+                yield session
+
+        queue = InProcessQueue()
+        app.dependency_overrides[get_session] = get_session_override
+        try:
+            with install(queue, redis=fake_redis()):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://loadtest",
+                                             timeout=timeout) as client:
+                    result = await run_load(client, virtual_users(config.users), config.products,
+                                            config.departments, rps, duration, max_inflight, mix, seed)
+        finally:
+            app.dependency_overrides.clear()
+            engine.dispose()
+
+    result["queued_tasks"] = dict(queue.published)
+    return result
+
+
+def _print_report(result: Dict) -> None:
+    print(f"🚦 Цель {result['target_rps']:.0f} RPS, получено {result['achieved_rps']:.1f} RPS "
+          f"за {result['duration']:.1f}s: {result['requests']} запросов, "
+          f"ошибок {result['error_rate']:.2%}, отброшено действий {result['dropped_actions']}")
+    print(f"   {'Эндпоинт':<38} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'5xx/сбои':>9} {'4xx':>6}")
+    for label, stats in result["endpoints"].items():
+        print(f"   {label:<38} {stats['requests']:>6} {stats['p50']:>7.1f}ms {stats['p90']:>7.1f}ms "
+              f"{stats['p99']:>7.1f}ms {stats['max']:>7.1f}ms {stats['error_rate']:>9.2%} "
+              f"{stats['client_error_rate']:>6.1%}")
+    if result.get("queued_tasks"):
+        print(f"📨 Задачи в очереди: {result['queued_tasks']}")
+
+
+async def _run_remote(url: str, options: Dict[str, str]) -> Dict:
+    """Прогон против запущенного сервера; токены выпускаются с локальным SECRET_KEY"""
+    users = int(options.get("users", 100))
+    mix = dict(MIX)
+    # Пароли пользователей внешней БД неизвестны
+    mix["login"] = 0
+    async with httpx.AsyncClient(base_url=url, timeout=float(options.get("timeout", 10))) as client:
+        return await run_load(
+            client, virtual_users(users), int(options.get("products", 2000)), 21,
+            rps=float(options.get("rps", 50)), duration=float(options.get("duration", 30)),
+            max_inflight=int(options.get("max-inflight", 256)), mix=mix
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+
+    if "url" in options:
+        result = asyncio.run(_run_remote(options["url"], options))
+    else:
+        result = asyncio.run(run_in_process(
+            SyntheticConfig(users=int(options.get("users", 500)), products=int(options.get("products", 2000))),
+            rps=float(options.get("rps", 50)),
+            duration=float(options.get("duration", 30)),
+            max_inflight=int(options.get("max-inflight", 256)),
+            timeout=float(options.get("timeout", 10)),
+            database_url=options.get("database-url"),
+        ))
+    _print_report(result)
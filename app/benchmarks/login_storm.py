@@ -0,0 +1,133 @@
+# app/benchmarks/login_storm.py
+"""
+Бенчмарк шторма входов.
+
+Параллельно с потоком логинов опрашивает легкий эндпоинт (/health) и
+сравнивает его задержку до и во время шторма. Работает в одном event
+loop через ASGITransport на SQLite в памяти, внешние сервисы не нужны.
+
+Запуск:
+    python -m benchmarks.login_storm [--logins=200] [--concurrency=32] [--inline]
+
+--inline выполняет bcrypt прямо в обработчике (поведение до выноса в пул)
+для сравнения.
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.pool import StaticPool
+
+# Добавляем путь к проекту
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from main import app
+from benchmarks.stats import percentiles
+from database.database import get_session
+from auth.hash_password import HashPassword
+from models.user import User
+
+EMAIL = "storm@example.com"
+PASSWORD = "storm123"
+PROBE_INTERVAL = 0.01
+
+
+async def _probe(client: httpx.AsyncClient, stop: asyncio.Event, samples: List[float]) -> None:
+    """
+    Опрос /health по расписанию.
+
+    Задержка считается от запланированного момента отправки, поэтому
+    время, пока event loop был занят и запрос не мог уйти, тоже учитывается.
+    """
+    scheduled = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        await client.get("/health")
+        samples.append(time.perf_counter() - scheduled)
+        scheduled += PROBE_INTERVAL
+
+
+async def _storm(client: httpx.AsyncClient, logins: int, concurrency: int) -> Dict:
+    """Шторм логинов с ограничением параллельности"""
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: Dict[int, int] = {}
+
+    async def login() -> None:
+        async with semaphore:
+            response = await client.post("/auth/login", json={"email": EMAIL, "password": PASSWORD})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    return {"elapsed": elapsed, "logins_per_second": logins / elapsed, "statuses": statuses}
+
+
+async def run(logins: int = 200, concurrency: int = 32, baseline_seconds: float = 1.0) -> Dict:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(User(email=EMAIL, name="Storm", password_hash=HashPassword().create_hash(PASSWORD)))
+        session.commit()
+
+    def get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_session] = get_session_override
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            baseline: List[float] = []
+            stop = asyncio.Event()
+            probe = asyncio.create_task(_probe(client, stop, baseline))
+            await asyncio.sleep(baseline_seconds)
+            stop.set()
+            await probe
+
+            during: List[float] = []
+            stop = asyncio.Event()
+            probe = asyncio.create_task(_probe(client, stop, during))
+            storm = await _storm(client, logins, concurrency)
+            stop.set()
+            await probe
+    finally:
+        app.dependency_overrides.clear()
+
+    return {"baseline": percentiles(baseline), "during": percentiles(during), **storm}
+
+
+def _print_report(result: Dict, mode: str) -> None:
+    print(f"🔐 Режим bcrypt: {mode}")
+    print(f"   Логинов/с: {result['logins_per_second']:.1f} за {result['elapsed']:.2f}s, статусы {result['statuses']}")
+    for name in ["baseline", "during"]:
+        stats = result[name]
+        label = "до шторма" if name == "baseline" else "во время"
+        print(f"   /health {label}: n={stats['n']} p50={stats['p50']:.1f}ms p95={stats['p95']:.1f}ms "
+              f"p99={stats['p99']:.1f}ms max={stats['max']:.1f}ms")
+
+
+if __name__ == "__main__":
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = int(value)
+
+    mode = "пул потоков"
+    if "--inline" in sys.argv:
+        async def _inline(self, func, *args):
+            return func(*args)
+
+        HashPassword._run = _inline
+        mode = "inline (в event loop)"
+
+    result = asyncio.run(run(
+        logins=options.get("logins", 200),
+        concurrency=options.get("concurrency", 32)
+    ))
+    _print_report(result, mode)
@@ -0,0 +1,251 @@
+# app/benchmarks/recommendation_engine.py
+"""
+Бенчмарк движка рекомендаций на синтетических данных.
+
+Для каждого масштаба генерирует заказы (benchmarks.synthetic), заливает
+их в SQLite в памяти или собирает в артефакт и замеряет время и пиковую
+память этапов: load_data (или load_model), train_model, построения графа
+соседей, generate_recommendations_tfidf, generate_recommendations_batch и
+get_recommendations. Время и память меряются разными прогонами: tracemalloc
+замедляет Python код в разы и исказил бы время.
+
+Результат сравнивается с сохраненным baseline.json; этап, ставший
+медленнее в --tolerance раз или тяжелее в --memory-tolerance раз,
+считается регрессией, и процесс завершается с кодом 1.
+
+Запуск:
+    python -m benchmarks.recommendation_engine [--scales=small,medium] [--source=sqlite|arrays]
+        [--sample-users=50] [--tolerance=1.5] [--memory-tolerance=1.25] [--update-baseline]
+"""
+import sys
+import json
+import time
+import logging
+import platform
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session
+
+# Добавляем путь к проекту
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.synthetic import SyntheticConfig, generate, populate, build_artifact, create_sqlite_engine
+from models.recommendation import ModelType
+from services.recommendation_service import RecommendationService
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+SCALES: Dict[str, SyntheticConfig] = {
+    "tiny": SyntheticConfig(users=200, products=500),
+    "small": SyntheticConfig(users=1000, products=2000),
+    "medium": SyntheticConfig(users=5000, products=10000),
+    "large": SyntheticConfig(users=20000, products=30000, orders_per_user=8.0),
+}
+
+# Ниже этих порогов разница считается шумом, а не регрессией
+MIN_SECONDS_DELTA = 0.05
+MIN_MEMORY_DELTA_MB = 1.0
+
+
+def _measure(func: Callable, trace_memory: bool) -> Tuple[object, float, Optional[float]]:
+    """Выполнение этапа: (результат, секунды, пик памяти в МБ)"""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _pipeline(service: RecommendationService, artifact: Optional[Path],
+              sample_users: List[int]) -> List[Tuple[str, Callable]]:
+    """Этапы в порядке выполнения, каждый опирается на состояние предыдущего"""
+    def recommend_each():
+        for user_id in sample_users:
+            service.generate_recommendations_tfidf(user_id)
+
+    def get_each():
+        for user_id in sample_users:
+            service.get_recommendations(user_id, ModelType.COLLABORATIVE, count=10, use_cache=True)
+
+    load = ("load_model", lambda: service.load_model(artifact)) if artifact else ("load_data", service.load_data)
+    # Граф соседей пишется рядом с временным артефактом, а не в MODEL_ARTIFACT_DIR
+    directory = artifact.parent if artifact else None
+    return [
+        load,
+        ("train_model", service.train_model),
+        ("knn_graph", lambda: service.train_knn_graph(directory=directory)),
+        ("recommend_tfidf", recommend_each),
+        ("recommend_batch", lambda: service.generate_recommendations_batch(sample_users)),
+        ("get_recommendations", get_each),
+    ]
+
+
+def _run_pass(config: SyntheticConfig, source: str, sample_size: int,
+              trace_memory: bool) -> Tuple[Dict[str, Dict], Dict]:
+    """Один прогон всех этапов на свежей БД; возвращает этапы и размер модели в памяти"""
+    data = generate(config)
+    engine = create_sqlite_engine()
+    populate(engine, data, with_orders=source == "sqlite")
+
+    rng = np.random.default_rng(config.seed)
+    sample_users = rng.choice(data.user_ids, size=min(sample_size, config.users), replace=False).tolist()
+
+    phases = {}
+    with tempfile.TemporaryDirectory() as tmp, Session(engine) as session:
+        artifact = build_artifact(data, tmp) if source == "arrays" else None
+        service = RecommendationService(session)
+        # Redis не участвует, чтобы результат не зависел от окружения
+        service.redis = None
+        # Граф соседей замеряется отдельным этапом
+        service.knn_k = 0
+
+        for name, func in _pipeline(service, artifact, sample_users):
+            _, seconds, peak = _measure(func, trace_memory)
+            phases[name] = {"seconds": seconds, "peak_mb": peak}
+            if name in ("recommend_tfidf", "get_recommendations"):
+                phases[name]["per_user_ms"] = seconds * 1000 / len(sample_users)
+        footprint = service.memory_footprint()
+
+    engine.dispose()
+    return phases, footprint
+
+
+def run_scale(config: SyntheticConfig, source: str = "sqlite", sample_size: int = 50,
+              trace_memory: bool = True) -> Dict:
+    """
+    Замер этапов на одном масштабе.
+
+    Returns:
+        Dict: Сводка данных, этапы {имя: {seconds, peak_mb[, per_user_ms]}} и размер модели model_mb
+    """
+    phases, footprint = _run_pass(config, source, sample_size, trace_memory=False)
+    if trace_memory:
+        for name, stats in _run_pass(config, source, sample_size, trace_memory=True)[0].items():
+            phases[name]["peak_mb"] = stats["peak_mb"]
+
+    return {"data": generate(config).summary(), "source": source, "phases": phases,
+            "model_mb": footprint["total_mb"]}
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float = 1.5,
+            memory_tolerance: float = 1.25) -> List[str]:
+    """
+    Сравнение с baseline.
+
+    Returns:
+        List[str]: Описания регрессий, пустой список - регрессий нет
+    """
+    regressions = []
+    for scale, result in results.items():
+        reference = baseline.get(scale)
+        if reference is None or reference.get("source") != result["source"]:
+            continue
+        for phase, stats in result["phases"].items():
+            expected = reference["phases"].get(phase)
+            if expected is None:
+                continue
+
+            seconds, base_seconds = stats["seconds"], expected["seconds"]
+            if seconds > base_seconds * tolerance and seconds - base_seconds > MIN_SECONDS_DELTA:
+                regressions.append(
+                    f"{scale}/{phase}: время {seconds:.3f}s против {base_seconds:.3f}s "
+                    f"(x{seconds / base_seconds:.2f}, допуск x{tolerance})"
+                )
+
+            peak, base_peak = stats.get("peak_mb"), expected.get("peak_mb")
+            if peak is not None and base_peak is not None \
+                    and peak > base_peak * memory_tolerance and peak - base_peak > MIN_MEMORY_DELTA_MB:
+                regressions.append(
+                    f"{scale}/{phase}: память {peak:.1f}MB против {base_peak:.1f}MB "
+                    f"(x{peak / base_peak:.2f}, допуск x{memory_tolerance})"
+                )
+    return regressions
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Dict[str, Dict]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8")).get("scales", {})
+
+
+def save_baseline(results: Dict[str, Dict], path: Path = BASELINE_PATH) -> None:
+    """Запись результатов в baseline вместе с описанием машины"""
+    scales = load_baseline(path)
+    for scale, result in results.items():
+        scales[scale] = {**result, "phases": {
+            phase: {key: round(value, 4) if value is not None else None for key, value in stats.items()}
+            for phase, stats in result["phases"].items()
+        }}
+    path.write_text(json.dumps({
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.processor() or platform.machine()},
+        "scales": scales
+    }, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def _print_report(scale: str, result: Dict, reference: Optional[Dict]) -> None:
+    data = result["data"]
+    print(f"\n📊 {scale}: {data['users']} пользователей, {data['products']} товаров, "
+          f"{data['items']} позиций ({result['source']}), модель {result['model_mb']:.1f}MB")
+    for phase, stats in result["phases"].items():
+        line = f"   {phase:<20} {stats['seconds'] * 1000:>10.1f}ms"
+        if stats.get("peak_mb") is not None:
+            line += f" {stats['peak_mb']:>9.1f}MB"
+        if "per_user_ms" in stats:
+            line += f"  ({stats['per_user_ms']:.2f}ms/польз.)"
+        expected = (reference or {}).get("phases", {}).get(phase)
+        if expected and expected["seconds"] > 0:
+            line += f"  x{stats['seconds'] / expected['seconds']:.2f} к baseline"
+        print(line)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+
+    scales = options.get("scales", "small,medium").split(",")
+    source = options.get("source", "sqlite")
+    baseline = load_baseline()
+
+    results = {}
+    for scale in scales:
+        results[scale] = run_scale(
+            SCALES[scale], source=source,
+            sample_size=int(options.get("sample-users", 50)),
+            trace_memory="--no-memory" not in sys.argv
+        )
+        reference = baseline.get(scale)
+        if reference and reference.get("source") != source:
+            reference = None
+        _print_report(scale, results[scale], reference)
+
+    if "--update-baseline" in sys.argv:
+        save_baseline(results)
+        print(f"\n💾 Baseline обновлен: {BASELINE_PATH}")
+        sys.exit(0)
+
+    regressions = compare(
+        results, baseline,
+        tolerance=float(options.get("tolerance", 1.5)),
+        memory_tolerance=float(options.get("memory-tolerance", 1.25))
+    )
+    if regressions:
+        print("\n❌ РЕГРЕССИЯ ПРОИЗВОДИТЕЛЬНОСТИ:")
+        for line in regressions:
+            print(f"   {line}")
+        sys.exit(1)
+    print("\n✅ Регрессий относительно baseline нет")
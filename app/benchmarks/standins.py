@@ -0,0 +1,71 @@
+# app/benchmarks/standins.py
+"""
+Локальные заменители внешних сервисов для нагрузочных тестов.
+
+RabbitMQ заменяется очередью в памяти процесса, Redis - fakeredis, если он
+установлен (иначе сервис работает без кеша, как при недоступном Redis).
+"""
+import sys
+import logging
+import importlib
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class InProcessQueue:
+    """Очередь задач в памяти с тем же интерфейсом, что и publish_task"""
+
+    def __init__(self, maxlen: int = 100_000):
+        self._lock = threading.Lock()
+        self.messages: Deque[Tuple[str, Dict]] = deque(maxlen=maxlen)
+        self.published: Counter = Counter()
+
+    def publish(self, task_data: Dict, queue: str = "ml_task_queue") -> bool:
+        with self._lock:
+            self.messages.append((queue, task_data))
+            self.published[queue] += 1
+        return True
+
+
+def fake_redis():
+    """Клиент fakeredis в обертке приложения или None, если пакет не установлен"""
+    if fakeredis is None:
+        logger.warning("fakeredis не установлен, сервис рекомендаций работает без кеша")
+        return None
+    from database.redis_client import ResilientRedis
+    return ResilientRedis(client=fakeredis.FakeRedis(decode_responses=False))
+
+
+@contextmanager
+def install(queue: InProcessQueue, redis=None):
+    """
+    Подмена RabbitMQ и Redis в модулях приложения на время теста.
+
+    routes/__init__ экспортирует роутеры под именами модулей, поэтому
+    модули берутся из sys.modules, а не через атрибуты пакета.
+    """
+    importlib.import_module("routes.orders")
+    importlib.import_module("services.recommendation_service")
+    targets = [
+        (sys.modules["routes.orders"], "publish_task", queue.publish),
+        (sys.modules["services.task_queue"], "publish_task", queue.publish),
+        (sys.modules["services.recommendation_service"], "redis_client", redis),
+    ]
+
+    originals = [(module, name, getattr(module, name)) for module, name, _ in targets]
+    for module, name, value in targets:
+        setattr(module, name, value)
+    try:
+        yield queue
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
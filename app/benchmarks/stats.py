@@ -0,0 +1,24 @@
+# app/benchmarks/stats.py
+"""Общие расчеты для бенчмарков"""
+import statistics
+from typing import Dict, List
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Перцентили задержек в миллисекундах (samples - в секундах)"""
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pick(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+
+    return {
+        "n": len(samples),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": samples[-1] * 1000,
+        "mean": statistics.fmean(samples) * 1000,
+    }
@@ -0,0 +1,197 @@
+# app/benchmarks/synthetic.py
+"""
+Синтетические данные в духе Instacart для бенчмарков.
+
+Популярность товаров подчиняется закону Ципфа (вес товара ранга r
+пропорционален 1 / r^zipf_s), размеры корзин и число заказов -
+пуассоновские. Данные можно залить в SQLite в памяти для полного пути
+через БД или собрать сразу в артефакт модели без БД.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from sqlalchemy import event, insert
+from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.engine import Engine
+
+from models.department import Department
+from models.aisle import Aisle
+from models.product import Product
+from models.user import User
+from models.orders import Order
+from models.order_item import OrderItem
+from services.model_artifact import save_artifact
+
+INSERT_BATCH = 50_000
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    """Параметры генератора"""
+    users: int = 1000
+    products: int = 2000
+    orders_per_user: float = 5.0
+    mean_basket: float = 8.0
+    zipf_s: float = 1.1
+    departments: int = 21
+    aisles: int = 134
+    seed: int = 42
+
+
+@dataclass
+class SyntheticData:
+    """Сгенерированные заказы: по строке на заказ и на позицию заказа"""
+    config: SyntheticConfig
+    order_user: np.ndarray
+    item_order: np.ndarray
+    item_product: np.ndarray
+    item_quantity: np.ndarray
+
+    @property
+    def user_ids(self) -> np.ndarray:
+        return np.arange(1, self.config.users + 1, dtype=np.int64)
+
+    @property
+    def product_ids(self) -> np.ndarray:
+        return np.arange(1, self.config.products + 1, dtype=np.int64)
+
+    def summary(self) -> dict:
+        return {
+            "users": self.config.users,
+            "products": self.config.products,
+            "orders": len(self.order_user),
+            "items": len(self.item_product),
+        }
+
+
+def zipf_weights(n: int, s: float) -> np.ndarray:
+    """Нормированные веса Ципфа для рангов 1..n"""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** s
+    return weights / weights.sum()
+
+
+def generate(config: SyntheticConfig) -> SyntheticData:
+    """Генерация заказов по конфигурации, детерминирована seed"""
+    rng = np.random.default_rng(config.seed)
+
+    # Ранги популярности перемешаны, чтобы популярность не совпадала с порядком id
+    popularity = np.empty(config.products, dtype=np.float64)
+    popularity[rng.permutation(config.products)] = zipf_weights(config.products, config.zipf_s)
+
+    orders_count = np.maximum(1, rng.poisson(config.orders_per_user, config.users))
+    order_user = np.repeat(np.arange(1, config.users + 1, dtype=np.int64), orders_count)
+
+    basket = np.minimum(config.products, 1 + rng.poisson(max(0.0, config.mean_basket - 1), len(order_user)))
+    item_order = np.repeat(np.arange(1, len(order_user) + 1, dtype=np.int64), basket)
+    item_product = rng.choice(config.products, size=len(item_order), p=popularity).astype(np.int64) + 1
+
+    # Повторы товара внутри корзины схлопываются в количество
+    keys = np.unique((item_order << 32) | item_product)
+    item_order = keys >> 32
+    item_product = keys & 0xFFFFFFFF
+    item_quantity = 1 + rng.poisson(0.3, len(keys))
+
+    return SyntheticData(config, order_user, item_order, item_product, item_quantity.astype(np.int64))
+
+
+def create_sqlite_engine(path: Optional[str] = None) -> Engine:
+    """
+    SQLite со схемой приложения.
+
+    Без path - БД в памяти на одном соединении. С path - файловая БД в
+    режиме WAL с обычным пулом: у каждой сессии свое соединение, поэтому
+    параллельные запросы не делят транзакцию.
+    """
+    if path is None:
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+
+        @event.listens_for(engine, "connect")
+        def _set_wal(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def _insert(session: Session, table, rows) -> None:
+    for start in range(0, len(rows), INSERT_BATCH):
+        session.execute(insert(table), rows[start:start + INSERT_BATCH])
+
+
+def populate(engine: Engine, data: SyntheticData, with_orders: bool = True) -> None:
+    """
+    Заливка каталога, пользователей и заказов в БД пакетными INSERT.
+
+    with_orders=False заливает только каталог и пользователей - этого
+    достаточно, когда модель загружается из артефакта.
+    """
+    config = data.config
+    rng = np.random.default_rng(config.seed + 1)
+    departments = rng.integers(1, config.departments + 1, config.products)
+    aisles = rng.integers(1, config.aisles + 1, config.products)
+    created_at = datetime.utcnow()
+
+    with Session(engine) as session:
+        _insert(session, Department.__table__,
+                [{"id": i, "name": f"Department {i}"} for i in range(1, config.departments + 1)])
+        _insert(session, Aisle.__table__,
+                [{"id": i, "name": f"Aisle {i}"} for i in range(1, config.aisles + 1)])
+        _insert(session, Product.__table__, [
+            {"id": int(pid), "name": f"Product {pid}", "aisle_id": int(aisle),
+             "department_id": int(dept), "is_active": True}
+            for pid, aisle, dept in zip(data.product_ids, aisles, departments)
+        ])
+        _insert(session, User.__table__, [
+            {"id": int(uid), "email": f"user{uid}@example.com", "name": f"User {uid}",
+             "is_active": True, "created_at": created_at}
+            for uid in data.user_ids
+        ])
+        if not with_orders:
+            session.commit()
+            return
+        _insert(session, Order.__table__, [
+            {"id": order_id, "user_id": int(uid), "created_at": created_at}
+            for order_id, uid in enumerate(data.order_user, start=1)
+        ])
+        _insert(session, OrderItem.__table__, [
+            {"order_id": int(oid), "product_id": int(pid), "quantity": int(qty)}
+            for oid, pid, qty in zip(data.item_order, data.item_product, data.item_quantity)
+        ])
+        session.commit()
+
+
+def interaction_matrix(data: SyntheticData) -> Tuple[csr_matrix, np.ndarray, np.ndarray]:
+    """
+    User-product матрица количеств из сгенерированных массивов.
+
+    Как и в офлайн обучении, в нее попадают только строки и столбцы с покупками.
+
+    Returns:
+        Tuple: (матрица, user_ids по строкам, product_ids по столбцам)
+    """
+    users = data.order_user[data.item_order - 1]
+    matrix = coo_matrix(
+        (data.item_quantity, (users - 1, data.item_product - 1)),
+        shape=(data.config.users, data.config.products)
+    ).tocsr()
+    matrix.sum_duplicates()
+
+    rows = np.flatnonzero(np.diff(matrix.indptr))
+    cols = np.flatnonzero(np.bincount(matrix.indices, minlength=matrix.shape[1]))
+    return matrix[rows][:, cols], data.user_ids[rows], data.product_ids[cols]
+
+
+def build_artifact(data: SyntheticData, directory, version: Optional[str] = None) -> Path:
+    """Артефакт модели из сгенерированных массивов, минуя БД"""
+    matrix, user_ids, product_ids = interaction_matrix(data)
+    return save_artifact(
+        directory, matrix, user_ids, product_ids,
+        meta={"source": "synthetic", **data.summary()}, version=version
+    )
@@ -0,0 +1,260 @@
+# app/database/columnar_cache.py
+"""
+Колоночный кеш CSV файлов Instacart.
+
+Однократная конвертация после download_data.py записывает типизированные
+сжатые файлы (int32 идентификаторы, категориальные названия) в data/columnar/.
+Загрузчики читают кеш, если он есть и не устарел, иначе - исходный CSV.
+
+Формат: Parquet при наличии pyarrow, иначе NPZ (numpy) по колонкам.
+
+Запуск:
+    python -m database.columnar_cache [data_dir]
+"""
+import sys
+import json
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = "columnar"
+MANIFEST = "manifest.json"
+
+# Схемы таблиц: все колонки CSV, включая не используемые при импорте
+SCHEMAS: Dict[str, Dict[str, str]] = {
+    "departments": {"department_id": "int32", "department": "category"},
+    "aisles": {"aisle_id": "int32", "aisle": "category"},
+    "products": {
+        "product_id": "int32",
+        "product_name": "object",
+        "aisle_id": "int32",
+        "department_id": "int32",
+    },
+    "orders": {
+        "order_id": "int32",
+        "user_id": "int32",
+        "eval_set": "category",
+        "order_number": "int16",
+        "order_dow": "int8",
+        "order_hour_of_day": "int8",
+        "days_since_prior_order": "float32",
+    },
+    "order_products__prior": {
+        "order_id": "int32",
+        "product_id": "int32",
+        "add_to_cart_order": "int16",
+        "reordered": "int8",
+    },
+    "order_products__train": {
+        "order_id": "int32",
+        "product_id": "int32",
+        "add_to_cart_order": "int16",
+        "reordered": "int8",
+    },
+}
+
+try:
+    import pyarrow  # noqa: F401
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    pq = None
+    HAS_PARQUET = False
+
+
+def _cache_dir(data_dir) -> Path:
+    return Path(data_dir) / CACHE_DIR
+
+
+def _source_signature(path: Path) -> Dict:
+    """Размер и время изменения CSV для проверки актуальности кеша"""
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def _load_manifest(data_dir) -> Dict:
+    path = _cache_dir(data_dir) / MANIFEST
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def cached_path(data_dir, name: str) -> Optional[Path]:
+    """
+    Путь к актуальному колоночному файлу таблицы или None.
+
+    Кеш считается устаревшим, если исходный CSV изменился после конвертации.
+    """
+    entry = _load_manifest(data_dir).get(name)
+    if entry is None:
+        return None
+
+    path = _cache_dir(data_dir) / entry["file"]
+    if not path.exists():
+        return None
+    if entry["format"] == "parquet" and not HAS_PARQUET:
+        return None
+
+    source = Path(data_dir) / f"{name}.csv"
+    if source.exists() and _source_signature(source) != entry["source"]:
+        logger.warning(f"Колоночный кеш {name} устарел, читаем CSV")
+        return None
+
+    return path
+
+
+def _csv_dtypes(name: str, columns: Optional[List[str]]) -> Dict[str, str]:
+    schema = SCHEMAS.get(name, {})
+    wanted = columns or list(schema)
+    return {c: schema[c] for c in wanted if c in schema}
+
+
+def _frame_from_npz(path: Path, columns: Optional[List[str]]) -> pd.DataFrame:
+    """Чтение колонок из NPZ (категориальные хранятся как коды + категории)"""
+    with np.load(path, allow_pickle=False) as npz:
+        available = [key for key in npz.files if not key.endswith("__categories")]
+        data = {}
+        for column in columns or available:
+            values = npz[column]
+            if f"{column}__categories" in npz.files:
+                values = pd.Categorical.from_codes(values, categories=npz[f"{column}__categories"])
+            elif values.dtype.kind == "U":
+                values = values.astype(object)
+            data[column] = values
+    return pd.DataFrame(data)
+
+
+def read_table(data_dir, name: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Чтение таблицы Instacart из колоночного кеша или CSV.
+
+    Args:
+        data_dir: Директория с данными
+        name: Имя таблицы (имя CSV без расширения)
+        columns: Нужные колонки (по умолчанию все)
+    """
+    path = cached_path(data_dir, name)
+    if path is not None:
+        if path.suffix == ".parquet":
+            df = pd.read_parquet(path, columns=columns)
+        else:
+            df = _frame_from_npz(path, columns)
+        return df[columns] if columns else df
+
+    df = pd.read_csv(Path(data_dir) / f"{name}.csv", usecols=columns, dtype=_csv_dtypes(name, columns))
+    return df[columns] if columns else df
+
+
+def iter_table(data_dir, name: str, columns: Optional[List[str]] = None,
+               chunksize: int = 500_000) -> Iterator[pd.DataFrame]:
+    """Чтение таблицы чанками из колоночного кеша или CSV"""
+    path = cached_path(data_dir, name)
+
+    if path is not None and path.suffix == ".parquet":
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    if path is not None:
+        # Колонки NPZ распаковываются целиком, поэтому читаем их один раз
+        df = _frame_from_npz(path, columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+
+    for chunk in pd.read_csv(Path(data_dir) / f"{name}.csv", usecols=columns,
+                             dtype=_csv_dtypes(name, columns), chunksize=chunksize):
+        yield chunk[columns] if columns else chunk
+
+
+def _read_csv_typed(path: Path, name: str) -> pd.DataFrame:
+    """Чтение CSV чанками с приведением типов, чтобы не держать текстовые колонки"""
+    schema = SCHEMAS[name]
+    chunks = []
+    for chunk in pd.read_csv(path, chunksize=2_000_000):
+        for column, dtype in schema.items():
+            if column not in chunk:
+                continue
+            if dtype == "category" or dtype == "object":
+                continue
+            if chunk[column].isna().any() and not dtype.startswith("float"):
+                raise ValueError(f"{name}.{column}: пропуски в целочисленной колонке")
+            chunk[column] = chunk[column].astype(dtype)
+        chunks.append(chunk)
+    df = pd.concat(chunks, ignore_index=True)
+    for column, dtype in schema.items():
+        if dtype == "category" and column in df:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def _write_npz(df: pd.DataFrame, path: Path) -> None:
+    arrays = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            arrays[column] = series.cat.codes.to_numpy()
+            arrays[f"{column}__categories"] = series.cat.categories.to_numpy(dtype=str)
+        elif series.dtype == object:
+            arrays[column] = series.to_numpy(dtype=str)
+        else:
+            arrays[column] = series.to_numpy()
+    np.savez_compressed(path, **arrays)
+
+
+def convert(data_dir="data", force: bool = False) -> Dict[str, Dict]:
+    """
+    Конвертация всех CSV Instacart в колоночный кеш.
+
+    Args:
+        data_dir: Директория с CSV
+        force: Перезаписать актуальные файлы
+
+    Returns:
+        Dict: Манифест кеша
+    """
+    data_dir = Path(data_dir)
+    cache_dir = _cache_dir(data_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(data_dir)
+    fmt = "parquet" if HAS_PARQUET else "npz"
+
+    for name in SCHEMAS:
+        source = data_dir / f"{name}.csv"
+        if not source.exists():
+            print(f"⏭️ {source.name}: файл не найден")
+            continue
+        if not force and cached_path(data_dir, name) is not None and manifest[name]["format"] == fmt:
+            print(f"✅ {name}: кеш актуален")
+            continue
+
+        df = _read_csv_typed(source, name)
+        target = cache_dir / f"{name}.{fmt}"
+        if fmt == "parquet":
+            df.to_parquet(target, compression="zstd", index=False)
+        else:
+            _write_npz(df, target)
+
+        manifest[name] = {
+            "file": target.name,
+            "format": fmt,
+            "rows": len(df),
+            "source": _source_signature(source),
+        }
+        (cache_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+        size_mb = target.stat().st_size / (1024 * 1024)
+        source_mb = source.stat().st_size / (1024 * 1024)
+        print(f"✅ {name}: {len(df):,} строк, {source_mb:.1f} MB -> {size_mb:.1f} MB ({fmt})")
+
+    return manifest
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    convert(args[0] if args else "data", force="--force" in sys.argv)
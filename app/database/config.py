@@ -1,6 +1,7 @@
 # app/database/config.py
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
+from typing import List
 
 
 class Settings(BaseSettings):
@@ -17,6 +18,8 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "recommendations_db"
 
     # RabbitMQ (если используется)
+    RABBITMQ_HOST: str = "rabbitmq"
+    RABBITMQ_PORT: int = 5672
     RABBITMQ_USER: str = "rmuser"
     RABBITMQ_PASS: str = "rmpassword"
 
@@ -24,6 +27,11 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    REDIS_SOCKET_TIMEOUT: float = 0.1  # Таймаут команды (сек)
+    REDIS_CONNECT_TIMEOUT: float = 0.25  # Таймаут подключения (сек)
+    REDIS_MAX_CONNECTIONS: int = 32  # Размер пула соединений
+    REDIS_FAILURE_THRESHOLD: int = 3  # Ошибок подряд до отключения кеша
+    REDIS_RETRY_INTERVAL: float = 5.0  # Период фоновой проверки отключенного Redis (сек)
 
     # Настройки приложения
     APP_NAME: str = "Recommendation System API"
@@ -35,10 +43,53 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "your-secret-key-here"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    BCRYPT_ROUNDS: int = 12  # Стоимость bcrypt, хеши с другой стоимостью пересчитываются при входе
+    PASSWORD_HASH_WORKERS: int = 0  # Потоков для bcrypt, 0 - половина ядер (ядро остается event loop)
+    PASSWORD_HASH_QUEUE_LIMIT: int = 64  # Максимум ожидающих операций, сверх - 503
+    ADMIN_USER_IDS: List[int] = []  # Пользователи с доступом к /admin, JSON список: [1, 2]
 
     # Настройки ML
     MODEL_UPDATE_INTERVAL: int = 3600  # Обновление модели каждый час
     MIN_ORDERS_FOR_TRAINING: int = 100  # Минимум заказов для обучения
+    MODEL_ARTIFACT_DIR: str = "data/model_artifacts"  # Артефакты офлайн обучения
+    MODEL_COMPACT: bool = True  # float32/int32 представление модели в памяти
+    FACTOR_RANK: int = 64  # Число факторов SVD модели
+    KNN_GRAPH_K: int = 30  # Соседей пользователя в предрасчитанном графе (0 - сходство на лету)
+    # Прореживание матрицы при обучении (значения по умолчанию ничего не удаляют)
+    PRUNE_MIN_PRODUCT_BUYERS: int = 1  # Минимум покупателей товара
+    PRUNE_MIN_USER_ITEMS: int = 1  # Минимум разных товаров пользователя
+    PRUNE_MAX_USER_ITEMS: int = 0  # Максимум товаров пользователя (0 - без ограничения)
+    PRUNE_MAX_PRODUCT_SHARE: float = 0.0  # Максимальная доля покупателей товара (0 - без ограничения)
+    # Кеш популярных товаров
+    POPULAR_CACHE_SOFT_TTL: int = 3600  # Свежесть списка, после - отдается устаревшим и обновляется в фоне (сек)
+    POPULAR_CACHE_HARD_TTL: int = 21600  # Время жизни ключа в Redis (сек)
+    POPULAR_CACHE_JITTER: float = 0.1  # Случайный разброс сроков (доля)
+    POPULAR_CACHE_LOCK_TTL: float = 30.0  # Блокировка пересчета между процессами (сек)
+    POPULAR_CACHE_WAIT: float = 2.0  # Ожидание пересчета другим процессом при промахе (сек)
+    RECOMMENDATION_RPC_QUEUE: str = "rpc_queue"  # Очередь воркера инференса
+    RECOMMENDATION_RPC_TIMEOUT: float = 0.5  # Ожидание ответа воркера до fallback (сек)
+
+    # Настройки запуска
+    STARTUP_DB_RETRIES: int = 10  # Попыток подключения к БД при старте
+    STARTUP_DB_RETRY_DELAY: float = 0.5  # Начальная задержка между попытками (сек)
+    STARTUP_DB_RETRY_MAX_DELAY: float = 8.0  # Максимальная задержка между попытками (сек)
+    STARTUP_MODEL_RETRIES: int = 5  # Попыток предзагрузки модели (после ошибки API готов в режиме degraded)
+    STARTUP_IMPORT_USERS: int = 100  # Пользователей в первичном импорте пустой БД
+
+    # Настройки профилирования
+    PROFILER_ENABLED: bool = False  # Постоянное семплирование стеков с запуска
+    PROFILER_INTERVAL_MS: float = 10.0  # Период постоянного семплирования (мс)
+    PROFILER_REQUEST_INTERVAL_MS: float = 1.0  # Период семплирования запроса с X-Profile (мс)
+    PROFILER_OUTPUT_DIR: str = "data/profiles"  # Каталог collapsed файлов
+    PROFILER_FLUSH_SECONDS: int = 300  # Окно постоянного профиля до записи в файл (сек), 0 - не писать
+    PROFILER_KEEP_FILES: int = 48  # Сколько последних файлов профиля хранить
+    PROFILER_REQUEST_HISTORY: int = 50  # Сколько профилей запросов держать в памяти
+
+    # Настройки каталога
+    CATALOG_COUNT_CACHE_TTL: int = 300  # Время жизни кеша количества товаров (сек)
+    CATALOG_COUNT_CACHE_SIZE: int = 10000  # Максимум комбинаций фильтров в кеше
+    CATALOG_RESPONSE_CACHE_SIZE: int = 60000  # Максимум закешированных ответов каталога
+    CATALOG_VERSION_CHECK_INTERVAL: int = 5  # Как часто перечитывать версию каталога из БД (сек)
 
     @property
     def DATABASE_URL_asyncpg(self):
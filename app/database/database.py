@@ -3,8 +3,9 @@ from sqlmodel import SQLModel, Session, create_engine
 from sqlalchemy.engine import Engine
 from sqlalchemy.pool import NullPool
 from typing import Generator
-import redis
 from .config import get_settings
+from .redis_client import ResilientRedis
+from .instrumentation import InstrumentedQueuePool
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,6 +33,7 @@ def get_database_engine() -> Engine:
         engine = create_engine(
             url=settings.DATABASE_URL_psycopg,
             echo=False,  # Отключаем вывод SQL запросов
+            poolclass=InstrumentedQueuePool,  # Замер ожидания соединения для /metrics
             pool_size=10,
             max_overflow=20,
             pool_pre_ping=True,
@@ -41,28 +43,27 @@ def get_database_engine() -> Engine:
     return engine
 
 
-def get_redis_client() -> redis.Redis:
+def get_redis_client() -> ResilientRedis:
     """
     Получение клиента Redis для кеширования.
 
+    Подключение ленивое: клиент создается всегда, а недоступный Redis
+    отключает кеш предохранителем до восстановления (database.redis_client).
+    Значения хранятся байтами (services.serialization), поэтому ответы
+    не декодируются в строки.
+
     Returns:
-        redis.Redis: Клиент Redis или None если недоступен
+        ResilientRedis: Клиент Redis с пулом соединений
     """
     settings = get_settings()
-    try:
-        client = redis.from_url(
-            settings.REDIS_URL,
-            decode_responses=True,
-            socket_connect_timeout=5,
-            socket_timeout=5
-        )
-        # Проверяем соединение
-        client.ping()
-        logger.info("Redis подключен успешно")
-        return client
-    except Exception as e:
-        logger.warning(f"Redis недоступен: {e}. Работаем без кеша.")
-        return None
+    return ResilientRedis(
+        settings.REDIS_URL,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        failure_threshold=settings.REDIS_FAILURE_THRESHOLD,
+        retry_interval=settings.REDIS_RETRY_INTERVAL,
+    )
 
 
 # Глобальные экземпляры
@@ -1,24 +1,196 @@
 # app/database/import_fast.py
 import sys
+import io
+import uuid
+import hashlib
+import time
+import threading
 import pandas as pd
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 
 # Добавляем путь к проекту
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from sqlmodel import Session, text, SQLModel
 import psycopg
 from database.config import get_settings
-from database.database import engine
 from auth.hash_password import HashPassword
+from database.columnar_cache import read_table, iter_table
+
+# Размер чанка order_products__prior.csv, передаваемого в один COPY
+CHUNK_SIZE = 500_000
+# Количество параллельных соединений для загрузки
+DEFAULT_WORKERS = 4
+
+# Таблицы без индексов и внешних ключей: ограничения создаются после загрузки.
+# Имена ограничений совпадают с именами по умолчанию в PostgreSQL, поэтому
+# их можно снять и в базе, созданной прежней версией импорта.
+TABLES = {
+    "department": """
+        CREATE TABLE department (
+            id SERIAL,
+            name VARCHAR(100) NOT NULL
+        )
+    """,
+    "aisle": """
+        CREATE TABLE aisle (
+            id SERIAL,
+            name VARCHAR(100) NOT NULL
+        )
+    """,
+    "product": """
+        CREATE TABLE product (
+            id SERIAL,
+            name VARCHAR(255) NOT NULL,
+            aisle_id INTEGER,
+            department_id INTEGER,
+            is_active BOOLEAN DEFAULT TRUE
+        )
+    """,
+    # Связь отдел -> проход, заполняется после загрузки товаров
+    "department_aisle": """
+        CREATE TABLE department_aisle (
+            department_id INTEGER NOT NULL,
+            aisle_id INTEGER NOT NULL,
+            product_count INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+    "users": """
+        CREATE TABLE users (
+            id SERIAL,
+            email VARCHAR(255) NOT NULL,
+            password_hash VARCHAR(255),
+            name VARCHAR(255),
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """,
+    "orders": """
+        CREATE TABLE orders (
+            id SERIAL,
+            user_id INTEGER,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """,
+    "orderitem": """
+        CREATE TABLE orderitem (
+            id SERIAL,
+            order_id INTEGER,
+            product_id INTEGER,
+            quantity INTEGER DEFAULT 1
+        )
+    """,
+    "recommendation": """
+        CREATE TABLE recommendation (
+            id SERIAL,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            score FLOAT NOT NULL CHECK (score >= 0.0 AND score <= 1.0),
+            model_type VARCHAR(20) NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """,
+}
+
+# Первичные ключи и уникальные ограничения (таблицы независимы, строятся параллельно)
+KEYS = {
+    "department": [
+        "ALTER TABLE department ADD CONSTRAINT department_pkey PRIMARY KEY (id)",
+        "ALTER TABLE department ADD CONSTRAINT department_name_key UNIQUE (name)",
+    ],
+    "aisle": [
+        "ALTER TABLE aisle ADD CONSTRAINT aisle_pkey PRIMARY KEY (id)",
+        "ALTER TABLE aisle ADD CONSTRAINT aisle_name_key UNIQUE (name)",
+    ],
+    "product": [
+        "ALTER TABLE product ADD CONSTRAINT product_pkey PRIMARY KEY (id)",
+        "CREATE INDEX IF NOT EXISTS idx_product_department_id_id ON product(department_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_product_aisle_id_id ON product(aisle_id, id)",
+    ],
+    "department_aisle": [
+        "ALTER TABLE department_aisle ADD CONSTRAINT department_aisle_pkey PRIMARY KEY (department_id, aisle_id)",
+    ],
+    "users": [
+        "ALTER TABLE users ADD CONSTRAINT users_pkey PRIMARY KEY (id)",
+        "ALTER TABLE users ADD CONSTRAINT users_email_key UNIQUE (email)",
+    ],
+    "orders": [
+        "ALTER TABLE orders ADD CONSTRAINT orders_pkey PRIMARY KEY (id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)",
+    ],
+    "orderitem": [
+        "ALTER TABLE orderitem ADD CONSTRAINT orderitem_pkey PRIMARY KEY (id)",
+        "CREATE INDEX IF NOT EXISTS idx_orderitem_order_id ON orderitem(order_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orderitem_product_id ON orderitem(product_id)",
+    ],
+    "recommendation": [
+        "ALTER TABLE recommendation ADD CONSTRAINT recommendation_pkey PRIMARY KEY (id)",
+        "ALTER TABLE recommendation ADD CONSTRAINT recommendation_user_id_product_id_model_type_key "
+        "UNIQUE (user_id, product_id, model_type)",
+        "CREATE INDEX IF NOT EXISTS idx_recommendation_user_id ON recommendation(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_recommendation_model_type ON recommendation(model_type)",
+        "CREATE INDEX IF NOT EXISTS idx_recommendation_score ON recommendation(score DESC)",
+    ],
+}
+
+# Внешние ключи: добавляются последовательно, т.к. блокировки родительских
+# таблиц конфликтуют между собой
+FOREIGN_KEYS = [
+    ("product", "product_aisle_id_fkey", "FOREIGN KEY (aisle_id) REFERENCES aisle(id)"),
+    ("product", "product_department_id_fkey", "FOREIGN KEY (department_id) REFERENCES department(id)"),
+    ("department_aisle", "department_aisle_department_id_fkey", "FOREIGN KEY (department_id) REFERENCES department(id)"),
+    ("department_aisle", "department_aisle_aisle_id_fkey", "FOREIGN KEY (aisle_id) REFERENCES aisle(id)"),
+    ("orders", "orders_user_id_fkey", "FOREIGN KEY (user_id) REFERENCES users(id)"),
+    ("orderitem", "orderitem_order_id_fkey", "FOREIGN KEY (order_id) REFERENCES orders(id)"),
+    ("orderitem", "orderitem_product_id_fkey", "FOREIGN KEY (product_id) REFERENCES product(id)"),
+    ("recommendation", "recommendation_user_id_fkey", "FOREIGN KEY (user_id) REFERENCES users(id)"),
+    ("recommendation", "recommendation_product_id_fkey", "FOREIGN KEY (product_id) REFERENCES product(id)"),
+]
+
+# Порядок удаления: сначала зависимые таблицы
+DROP_ORDER = ["recommendation", "orderitem", "orders", "users", "department_aisle", "product", "aisle", "department"]
+
+
+@dataclass
+class StageStats:
+    """Статистика этапа импорта"""
+    name: str
+    rows: int = 0
+    seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, rows: int) -> None:
+        with self._lock:
+            self.rows += rows
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+@contextmanager
+def stage(name: str, report: List[StageStats]):
+    """Замер этапа импорта с выводом скорости загрузки"""
+    stats = StageStats(name)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.seconds = time.perf_counter() - start
+        report.append(stats)
+        if stats.rows:
+            print(f"✅ {name}: {stats.rows:,} строк за {stats.seconds:.1f}s ({stats.rows_per_second:,.0f} строк/с)")
+        else:
+            print(f"✅ {name}: {stats.seconds:.1f}s")
 
 
-def import_fast(data_dir="data", max_users=None, recreate=True):
-    data_dir = Path(data_dir)
+def connect():
+    """Прямое подключение к PostgreSQL"""
     settings = get_settings()
-
-    # Прямое подключение к PostgreSQL
-    conn = psycopg.connect(
+    return psycopg.connect(
         host=settings.DB_HOST,
         port=settings.DB_PORT,
         user=settings.DB_USER,
@@ -26,209 +198,521 @@ def import_fast(data_dir="data", max_users=None, recreate=True):
         dbname=settings.DB_NAME
     )
 
+
+def frame_to_csv(df: pd.DataFrame) -> bytes:
+    """Сериализация DataFrame в CSV для COPY ... WITH (FORMAT csv)"""
+    buffer = io.StringIO()
+    df.to_csv(buffer, header=False, index=False)
+    return buffer.getvalue().encode("utf-8")
+
+
+def copy_frame(conn, table: str, columns: List[str], df: pd.DataFrame) -> int:
+    """
+    Загрузка DataFrame в таблицу через COPY FROM STDIN.
+
+    Порядок колонок DataFrame должен совпадать с columns.
+
+    Returns:
+        int: Количество загруженных строк
+    """
+    payload = frame_to_csv(df)
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)") as copy:
+            copy.write(payload)
+    conn.commit()
+    return len(df)
+
+
+class ConnectionPool:
+    """Пул соединений по одному на поток загрузки"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.close()
+
+
+# Служебные таблицы: не удаляются при пересоздании схемы
+SERVICE_TABLES = [
+    # Версия каталога переживает пересоздание таблиц, иначе клиенты
+    # со старым ETag получили бы 304 на новые данные
+    """
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """,
+    # Водяные знаки источников для дельта-импорта
+    """
+        CREATE TABLE IF NOT EXISTS import_watermark (
+            source VARCHAR(100) PRIMARY KEY,
+            checksum VARCHAR(64) NOT NULL,
+            max_id BIGINT,
+            rows_loaded BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """,
+]
+
+# Источники данных в порядке загрузки
+SOURCES = ["departments.csv", "aisles.csv", "products.csv", "orders.csv", "order_products__prior.csv"]
+
+
+def file_checksum(path: Path) -> str:
+    """SHA-256 файла, читается блоками"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _ensure_service_tables(conn) -> None:
     with conn.cursor() as cur:
-        if recreate:
-            print("🗑️ Удаление всех таблиц...")
-            cur.execute("DROP TABLE IF EXISTS recommendation CASCADE")
-            cur.execute("DROP TABLE IF EXISTS orderitem CASCADE")
-            cur.execute("DROP TABLE IF EXISTS orders CASCADE")
-            cur.execute("DROP TABLE IF EXISTS users CASCADE")
-            cur.execute("DROP TABLE IF EXISTS product CASCADE")
-            cur.execute("DROP TABLE IF EXISTS aisle CASCADE")
-            cur.execute("DROP TABLE IF EXISTS department CASCADE")
-
-            print("🏗️ Создание новых таблиц...")
-            # Создаём таблицы вручную
-            cur.execute("""
-                CREATE TABLE department (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) UNIQUE NOT NULL
-                )
-            """)
-
-            cur.execute("""
-                CREATE TABLE aisle (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) UNIQUE NOT NULL
-                )
-            """)
-
-            cur.execute("""
-                CREATE TABLE product (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    aisle_id INTEGER REFERENCES aisle(id),
-                    department_id INTEGER REFERENCES department(id),
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            """)
-
-            cur.execute("""
-                CREATE TABLE users (
-                    id SERIAL PRIMARY KEY,
-                    email VARCHAR(255) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255),
-                    name VARCHAR(255),
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-
-            cur.execute("""
-                CREATE TABLE orders (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER REFERENCES users(id),
-                    created_at TIMESTAMP DEFAULT NOW()
-                )
-            """)
-
-            cur.execute("""
-                CREATE TABLE orderitem (
-                    id SERIAL PRIMARY KEY,
-                    order_id INTEGER REFERENCES orders(id),
-                    product_id INTEGER REFERENCES product(id),
-                    quantity INTEGER DEFAULT 1
-                )
-            """)
-
-            # Создаем таблицу рекомендаций
-            cur.execute("""
-                CREATE TABLE recommendation (
-                    id SERIAL PRIMARY KEY,
-                    user_id INTEGER NOT NULL REFERENCES users(id),
-                    product_id INTEGER NOT NULL REFERENCES product(id),
-                    score FLOAT NOT NULL CHECK (score >= 0.0 AND score <= 1.0),
-                    model_type VARCHAR(20) NOT NULL,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    UNIQUE(user_id, product_id, model_type)
-                )
-            """)
-
-            # Создаем индексы для оптимизации
-            cur.execute("CREATE INDEX idx_recommendation_user_id ON recommendation(user_id)")
-            cur.execute("CREATE INDEX idx_recommendation_model_type ON recommendation(model_type)")
-            cur.execute("CREATE INDEX idx_recommendation_score ON recommendation(score DESC)")
+        for ddl in SERVICE_TABLES:
+            cur.execute(ddl)
+    conn.commit()
 
-            conn.commit()
-        else:
-            # Очистка только при не-пересоздании
-            cur.execute(
-                'TRUNCATE TABLE recommendation, orderitem, orders, users, product, aisle, department RESTART IDENTITY CASCADE')
-            conn.commit()
-            print("✅ БД очищена")
 
-        # Отделы
-        df = pd.read_csv(data_dir / "departments.csv")
-        for _, row in df.iterrows():
-            cur.execute("INSERT INTO department (id, name) VALUES (%s, %s)",
-                        (int(row['department_id']), row['department']))
-        conn.commit()
-        print(f"✅ Отделы: {len(df)}")
+def _get_watermarks(cur) -> Dict[str, Tuple[str, Optional[int]]]:
+    """Водяные знаки: источник -> (checksum, max_id)"""
+    cur.execute("SELECT source, checksum, max_id FROM import_watermark")
+    return {source: (checksum, max_id) for source, checksum, max_id in cur.fetchall()}
 
-        # Проходы
-        df = pd.read_csv(data_dir / "aisles.csv")
-        for _, row in df.iterrows():
-            cur.execute("INSERT INTO aisle (id, name) VALUES (%s, %s)",
-                        (int(row['aisle_id']), row['aisle']))
-        conn.commit()
-        print(f"✅ Проходы: {len(df)}")
-
-        # Товары
-        df = pd.read_csv(data_dir / "products.csv")
-        cur.executemany(
-            "INSERT INTO product (id, name, aisle_id, department_id, is_active) VALUES (%s, %s, %s, %s, %s)",
-            [(int(row['product_id']), row['product_name'], int(row['aisle_id']), int(row['department_id']), True)
-             for _, row in df.iterrows()])
-        conn.commit()
-        print(f"✅ Товары: {len(df)}")
 
-        # Заказы
-        df_orders = pd.read_csv(data_dir / "orders.csv")
-        if max_users:
-            users = df_orders['user_id'].unique()[:max_users]
-            df_orders = df_orders[df_orders['user_id'].isin(users)]
+def _save_watermark(cur, source: str, checksum: str, max_id: Optional[int], rows: int) -> None:
+    cur.execute("""
+        INSERT INTO import_watermark (source, checksum, max_id, rows_loaded, updated_at)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (source) DO UPDATE SET
+            checksum = EXCLUDED.checksum,
+            max_id = EXCLUDED.max_id,
+            rows_loaded = import_watermark.rows_loaded + EXCLUDED.rows_loaded,
+            updated_at = NOW()
+    """, (source, checksum, max_id, rows))
 
-        # Пользователи
-        hash_pwd = HashPassword().create_hash("instacart123")
-        unique_users = df_orders['user_id'].unique()
 
-        # Добавляем специального пользователя с ID=0 для популярных товаров
+def _fix_sequences(cur) -> None:
+    """Исправляем последовательности для всех таблиц с SERIAL"""
+    for table in ["users", "department", "aisle", "product", "orders", "orderitem", "recommendation"]:
         cur.execute(
-            "INSERT INTO users (id, email, password_hash, name, is_active, created_at) VALUES (%s, %s, %s, %s, %s, NOW()) ON CONFLICT (id) DO NOTHING",
-            (0, "system@internal.com", hash_pwd, "System", True)
+            f"SELECT setval('{table}_id_seq', COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
         )
 
-        cur.executemany(
-            "INSERT INTO users (id, email, password_hash, name, is_active, created_at) VALUES (%s, %s, %s, %s, %s, NOW())",
-            [(int(uid), f"user{uid}@test.com", hash_pwd, f"User {uid}", True) for uid in unique_users])
-        conn.commit()
-        print(f"✅ Пользователи: {len(unique_users) + 1}")
 
-        # Заказы
-        cur.executemany("INSERT INTO orders (id, user_id, created_at) VALUES (%s, %s, NOW())",
-                        [(int(row['order_id']), int(row['user_id'])) for _, row in df_orders.iterrows()])
-        conn.commit()
-        print(f"✅ Заказы: {len(df_orders)}")
+def _bump_catalog_version(cur) -> int:
+    """Каталог изменился - сбрасываем кеши и ETag в приложении"""
+    cur.execute("""
+        INSERT INTO catalog_version (id, version, updated_at) VALUES (1, 1, NOW())
+        ON CONFLICT (id) DO UPDATE SET version = catalog_version.version + 1, updated_at = NOW()
+        RETURNING version
+    """)
+    return cur.fetchone()[0]
+
+
+def _refresh_department_aisles(cur) -> int:
+    """Материализуем связь отдел -> проход для навигации по категориям"""
+    cur.execute("DELETE FROM department_aisle")
+    cur.execute("""
+        INSERT INTO department_aisle (department_id, aisle_id, product_count)
+        SELECT department_id, aisle_id, COUNT(*)
+        FROM product
+        WHERE is_active
+        GROUP BY department_id, aisle_id
+    """)
+    return cur.rowcount
+
+
+def _make_users(user_ids) -> pd.DataFrame:
+    """Строки таблицы users для пользователей Instacart"""
+    hash_pwd = HashPassword().create_hash("instacart123")
+    return pd.DataFrame({
+        "id": list(user_ids),
+        "email": [f"user{uid}@test.com" for uid in user_ids],
+        "password_hash": hash_pwd,
+        "name": [f"User {uid}" for uid in user_ids],
+        "is_active": True
+    })
+
+
+def _recreate_tables(conn) -> None:
+    """Удаление и создание таблиц без ограничений"""
+    with conn.cursor() as cur:
+        print("🗑️ Удаление всех таблиц...")
+        for table in DROP_ORDER:
+            cur.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
+
+        print("🏗️ Создание новых таблиц...")
+        for ddl in TABLES.values():
+            cur.execute(ddl)
+    conn.commit()
+
+
+def _truncate_tables(conn) -> None:
+    """Очистка таблиц и снятие ограничений перед загрузкой"""
+    with conn.cursor() as cur:
+        # Таблицы, появившиеся в новых версиях импорта, могут отсутствовать
+        for ddl in TABLES.values():
+            cur.execute(ddl.replace("CREATE TABLE", "CREATE TABLE IF NOT EXISTS"))
+        cur.execute(f"TRUNCATE TABLE {', '.join(DROP_ORDER)} RESTART IDENTITY CASCADE")
+
+        # Снимаем внешние ключи и ключи, чтобы не проверять их построчно
+        for table, name, _ in FOREIGN_KEYS:
+            cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+        for table, statements in KEYS.items():
+            for statement in statements:
+                if statement.startswith("ALTER TABLE"):
+                    name = statement.split("ADD CONSTRAINT ")[1].split()[0]
+                    cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name} CASCADE")
+                else:
+                    name = statement.split("IF NOT EXISTS ")[1].split()[0]
+                    cur.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    print("✅ БД очищена")
+
+
+def _run_statements(pool: ConnectionPool, statements: List[str]) -> None:
+    """Последовательное выполнение DDL на соединении потока"""
+    conn = pool.get()
+    with conn.cursor() as cur:
+        for statement in statements:
+            cur.execute(statement)
+    conn.commit()
+
 
-        # Позиции заказов
+def _create_constraints(conn, pool: ConnectionPool, executor: ThreadPoolExecutor) -> None:
+    """Создание ключей и индексов (параллельно по таблицам), затем внешних ключей"""
+    futures = [executor.submit(_run_statements, pool, statements) for statements in KEYS.values()]
+    for future in futures:
+        future.result()
+
+    with conn.cursor() as cur:
+        for table, name, definition in FOREIGN_KEYS:
+            cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        cur.execute("ANALYZE")
+    conn.commit()
+
+
+def _load_order_items(
+        data_dir: Path,
+        valid_orders: Optional[set],
+        pool: ConnectionPool,
+        executor: ThreadPoolExecutor,
+        workers: int,
+        stats: StageStats
+) -> int:
+    """
+    Потоковая загрузка позиций заказов чанками через параллельные COPY.
+
+    Чтение следующего чанка идет в основном потоке, пока предыдущие
+    загружаются; число чанков в работе ограничено, чтобы память не росла
+    с размером файла.
+
+    Returns:
+        int: Максимальный order_id в файле (водяной знак источника)
+    """
+    in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def load(chunk: pd.DataFrame) -> None:
+        try:
+            stats.add(copy_frame(pool.get(), "orderitem", ["order_id", "product_id", "quantity"], chunk))
+        finally:
+            in_flight.release()
+
+    futures = []
+    max_order_id = 0
+    for chunk in iter_table(data_dir, "order_products__prior", ["order_id", "product_id"], CHUNK_SIZE):
+        max_order_id = max(max_order_id, int(chunk["order_id"].max()))
+        if valid_orders is not None:
+            chunk = chunk[chunk["order_id"].isin(valid_orders)]
+        if chunk.empty:
+            continue
+
+        chunk = chunk.assign(quantity=1)
+        in_flight.acquire()
+        futures.append(executor.submit(load, chunk))
+
+    for future in futures:
+        future.result()
+
+    return max_order_id
+
+
+def import_fast(data_dir="data", max_users=None, recreate=True, workers=DEFAULT_WORKERS):
+    data_dir = Path(data_dir)
+    report: List[StageStats] = []
+    started = time.perf_counter()
+
+    conn = connect()
+    pool = ConnectionPool()
+    _ensure_service_tables(conn)
+
+    if recreate:
+        _recreate_tables(conn)
+    else:
+        _truncate_tables(conn)
+
+    # Заказы нужны заранее: по ним отбираются пользователи и позиции
+    df_orders = read_table(data_dir, "orders", ["order_id", "user_id"])
+    max_order_id = int(df_orders['order_id'].max())
+    valid_orders = None
+    if max_users:
+        users = df_orders['user_id'].unique()[:max_users]
+        df_orders = df_orders[df_orders['user_id'].isin(users)]
         valid_orders = set(df_orders['order_id'])
-        total = 0
 
-        for chunk in pd.read_csv(data_dir / "order_products__prior.csv", chunksize=50000):
-            chunk = chunk[chunk['order_id'].isin(valid_orders)]
-            if len(chunk) > 0:
-                cur.executemany("INSERT INTO orderitem (order_id, product_id, quantity) VALUES (%s, %s, %s)",
-                                [(int(row['order_id']), int(row['product_id']), 1) for _, row in chunk.iterrows()])
-                conn.commit()
-                total += len(chunk)
+    # Специальный пользователь с ID=0 для популярных товаров
+    df_users = _make_users([0, *df_orders['user_id'].unique()])
+    df_users.loc[0, ["email", "name"]] = ["system@internal.com", "System"]
+
+    df_departments = read_table(data_dir, "departments")
+    df_aisles = read_table(data_dir, "aisles")
+    df_products = read_table(data_dir, "products").assign(is_active=True)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        # Справочники, пользователи и заказы независимы без внешних ключей
+        with stage("Справочники, товары, пользователи, заказы", report) as stats:
+            jobs = [
+                ("department", ["id", "name"], df_departments[["department_id", "department"]]),
+                ("aisle", ["id", "name"], df_aisles[["aisle_id", "aisle"]]),
+                ("product", ["id", "name", "aisle_id", "department_id", "is_active"],
+                 df_products[["product_id", "product_name", "aisle_id", "department_id", "is_active"]]),
+                ("users", ["id", "email", "password_hash", "name", "is_active"], df_users),
+                ("orders", ["id", "user_id"], df_orders[["order_id", "user_id"]]),
+            ]
+            futures = [
+                executor.submit(lambda table, columns, df: stats.add(copy_frame(pool.get(), table, columns, df)), *job)
+                for job in jobs
+            ]
+            for future in futures:
+                future.result()
+
+        with stage("Позиции заказов", report) as stats:
+            max_item_order_id = _load_order_items(data_dir, valid_orders, pool, executor, workers, stats)
+
+        with conn.cursor() as cur:
+            with stage("Связи отдел -> проход", report) as stats:
+                stats.add(_refresh_department_aisles(cur))
+            conn.commit()
 
-        print(f"✅ Позиции: {total}")
+        print("🔧 Создание ключей, индексов и внешних ключей...")
+        with stage("Ограничения и индексы", report):
+            _create_constraints(conn, pool, executor)
+    finally:
+        executor.shutdown(wait=True)
+        pool.close()
 
-        # Исправляем последовательности для всех таблиц с SERIAL
+    with conn.cursor() as cur:
         print("🔧 Настройка последовательностей...")
+        _fix_sequences(cur)
+        conn.commit()
+        print("✅ Последовательности настроены")
+
+        # Водяные знаки для последующих дельта-импортов
+        max_ids = {"orders.csv": max_order_id, "order_products__prior.csv": max_item_order_id}
+        for source in SOURCES:
+            _save_watermark(cur, source, file_checksum(data_dir / source), max_ids.get(source), 0)
+        catalog_version = _bump_catalog_version(cur)
+        conn.commit()
+        print(f"✅ Версия каталога: {catalog_version}")
+
+    conn.close()
 
-        # Для users
-        cur.execute("""
-            SELECT setval('users_id_seq', COALESCE((SELECT MAX(id) FROM users), 0) + 1, false);
-        """)
+    total_rows = sum(s.rows for s in report)
+    total_time = time.perf_counter() - started
+    print(f"🏁 Импорт завершен: {total_rows:,} строк за {total_time:.1f}s")
+    return report
 
-        # Для других таблиц тоже на всякий случай
-        cur.execute("""
-            SELECT setval('department_id_seq', COALESCE((SELECT MAX(id) FROM department), 0) + 1, false);
-        """)
 
-        cur.execute("""
-            SELECT setval('aisle_id_seq', COALESCE((SELECT MAX(id) FROM aisle), 0) + 1, false);
-        """)
+def _merge_frame(cur, table: str, columns: List[str], df: pd.DataFrame, on_conflict: str) -> int:
+    """
+    Слияние DataFrame с таблицей через временную staging-таблицу.
 
-        cur.execute("""
-            SELECT setval('product_id_seq', COALESCE((SELECT MAX(id) FROM product), 0) + 1, false);
-        """)
+    Данные загружаются COPY во временную таблицу и переносятся одним
+    INSERT ... SELECT с заданной стратегией ON CONFLICT.
 
-        cur.execute("""
-            SELECT setval('orders_id_seq', COALESCE((SELECT MAX(id) FROM orders), 0) + 1, false);
-        """)
+    Returns:
+        int: Количество вставленных или обновленных строк
+    """
+    stage_table = f"stage_{table}"
+    column_list = ", ".join(columns)
+    cur.execute(f"CREATE TEMP TABLE {stage_table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+    with cur.copy(f"COPY {stage_table} ({column_list}) FROM STDIN WITH (FORMAT csv)") as copy:
+        copy.write(frame_to_csv(df))
+    cur.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage_table} {on_conflict}")
+    return cur.rowcount
 
-        cur.execute("""
-            SELECT setval('orderitem_id_seq', COALESCE((SELECT MAX(id) FROM orderitem), 0) + 1, false);
-        """)
 
-        cur.execute("""
-            SELECT setval('recommendation_id_seq', COALESCE((SELECT MAX(id) FROM recommendation), 0) + 1, false);
-        """)
+def import_delta(data_dir="data", refresh_model=True):
+    """
+    Идемпотентная дозагрузка новых данных по водяным знакам.
 
+    Источник с неизменившейся контрольной суммой пропускается. Справочники
+    и товары обновляются UPSERT, заказы и позиции загружаются только с
+    order_id выше водяного знака источника. Каждый источник загружается
+    в отдельной транзакции вместе со своим водяным знаком, поэтому
+    повторный запуск после сбоя не дублирует данные.
+
+    Returns:
+        Dict: Количество загруженных строк по источникам
+    """
+    data_dir = Path(data_dir)
+    report: List[StageStats] = []
+    loaded: Dict[str, int] = {}
+    new_user_ids = set()
+
+    conn = connect()
+    _ensure_service_tables(conn)
+
+    with conn.cursor() as cur:
+        watermarks = _get_watermarks(cur)
+
+        def changed(source: str) -> Optional[str]:
+            checksum = file_checksum(data_dir / source)
+            if watermarks.get(source, (None, None))[0] == checksum:
+                print(f"⏭️ {source}: без изменений")
+                return None
+            return checksum
+
+        # Справочники и товары: UPSERT по первичному ключу
+        catalog_sources = [
+            ("departments.csv", "department", ["id", "name"], ["department_id", "department"],
+             "ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name "
+             "WHERE department.name IS DISTINCT FROM EXCLUDED.name"),
+            ("aisles.csv", "aisle", ["id", "name"], ["aisle_id", "aisle"],
+             "ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name "
+             "WHERE aisle.name IS DISTINCT FROM EXCLUDED.name"),
+            ("products.csv", "product", ["id", "name", "aisle_id", "department_id"],
+             ["product_id", "product_name", "aisle_id", "department_id"],
+             "ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, aisle_id = EXCLUDED.aisle_id, "
+             "department_id = EXCLUDED.department_id "
+             "WHERE (product.name, product.aisle_id, product.department_id) IS DISTINCT FROM "
+             "(EXCLUDED.name, EXCLUDED.aisle_id, EXCLUDED.department_id)"),
+        ]
+        for source, table, columns, csv_columns, on_conflict in catalog_sources:
+            checksum = changed(source)
+            if checksum is None:
+                continue
+            with stage(source, report) as stats:
+                df = read_table(data_dir, Path(source).stem, csv_columns)
+                stats.add(_merge_frame(cur, table, columns, df, on_conflict))
+                _save_watermark(cur, source, checksum, None, stats.rows)
+                conn.commit()
+            loaded[source] = stats.rows
+
+        if any(loaded.get(source) for source in ["departments.csv", "aisles.csv", "products.csv"]):
+            _refresh_department_aisles(cur)
+            print(f"✅ Версия каталога: {_bump_catalog_version(cur)}")
+            conn.commit()
+
+        # Заказы и новые пользователи: только order_id выше водяного знака
+        checksum = changed("orders.csv")
+        if checksum is not None:
+            with stage("orders.csv", report) as stats:
+                watermark = watermarks.get("orders.csv", (None, None))[1] or 0
+                df_orders = read_table(data_dir, "orders", ["order_id", "user_id"])
+                max_order_id = max(int(df_orders["order_id"].max()), watermark)
+                df_orders = df_orders[df_orders["order_id"] > watermark]
+
+                if not df_orders.empty:
+                    new_user_ids.update(int(uid) for uid in df_orders["user_id"].unique())
+                    _merge_frame(cur, "users", ["id", "email", "password_hash", "name", "is_active"],
+                                 _make_users(sorted(new_user_ids)), "ON CONFLICT (id) DO NOTHING")
+                    stats.add(_merge_frame(cur, "orders", ["id", "user_id"],
+                                           df_orders[["order_id", "user_id"]], "ON CONFLICT (id) DO NOTHING"))
+
+                _save_watermark(cur, "orders.csv", checksum, max_order_id, stats.rows)
+                conn.commit()
+            loaded["orders.csv"] = stats.rows
+
+        # Позиции заказов: позиции новых заказов заменяются целиком
+        checksum = changed("order_products__prior.csv")
+        if checksum is not None:
+            with stage("order_products__prior.csv", report) as stats:
+                watermark = watermarks.get("order_products__prior.csv", (None, None))[1] or 0
+                max_order_id = watermark
+                new_items = []
+                for chunk in iter_table(data_dir, "order_products__prior", ["order_id", "product_id"],
+                                        CHUNK_SIZE):
+                    max_order_id = max(max_order_id, int(chunk["order_id"].max()))
+                    chunk = chunk[chunk["order_id"] > watermark]
+                    if not chunk.empty:
+                        new_items.append(chunk)
+
+                if new_items:
+                    df_items = pd.concat(new_items, ignore_index=True).assign(quantity=1)
+                    # Повторный запуск не должен дублировать позиции
+                    cur.execute(
+                        "DELETE FROM orderitem WHERE order_id = ANY(%s)",
+                        (df_items["order_id"].unique().tolist(),)
+                    )
+                    stats.add(_merge_frame(cur, "orderitem", ["order_id", "product_id", "quantity"],
+                                           df_items, ""))
+                    cur.execute(
+                        "SELECT DISTINCT user_id FROM orders WHERE id = ANY(%s)",
+                        (df_items["order_id"].unique().tolist(),)
+                    )
+                    new_user_ids.update(row[0] for row in cur.fetchall())
+
+                _save_watermark(cur, "order_products__prior.csv", checksum, max_order_id, stats.rows)
+                conn.commit()
+            loaded["order_products__prior.csv"] = stats.rows
+
+        _fix_sequences(cur)
         conn.commit()
-        print("✅ Последовательности настроены")
 
     conn.close()
 
+    # Инкрементальное обновление модели вместо полного переобучения
+    if refresh_model and new_user_ids:
+        from services.task_queue import publish_task
+
+        queued = publish_task({
+            "task_id": str(uuid.uuid4()),
+            "task_type": "refresh_model",
+            "user_ids": sorted(new_user_ids)
+        })
+        if queued:
+            print(f"✅ Задача на обновление модели для {len(new_user_ids)} пользователей отправлена")
+        else:
+            print("⚠️ Не удалось отправить задачу на обновление модели")
+
+    print(f"🏁 Дельта-импорт завершен: {sum(loaded.values()):,} строк")
+    return loaded
+
 
 if __name__ == "__main__":
+    if "--delta" in sys.argv:
+        print("➕ Режим: дозагрузка новых данных по водяным знакам")
+        import_delta()
+        sys.exit(0)
+
     recreate_db = "--no-recreate" not in sys.argv  # По умолчанию пересоздаём
 
     if "--no-recreate" in sys.argv:
         sys.argv.remove("--no-recreate")
 
+    workers = DEFAULT_WORKERS
+    for arg in list(sys.argv[1:]):
+        if arg.startswith("--workers="):
+            workers = int(arg.split("=", 1)[1])
+            sys.argv.remove(arg)
+
     max_users = int(sys.argv[1]) if len(sys.argv) > 1 else None
 
     if recreate_db:
@@ -236,4 +720,4 @@ if __name__ == "__main__":
     else:
         print("📊 Режим: только загрузка данных")
 
-    import_fast(max_users=max_users, recreate=recreate_db)
\ No newline at end of file
+    import_fast(max_users=max_users, recreate=recreate_db, workers=workers)
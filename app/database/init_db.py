@@ -11,7 +11,9 @@ from models.aisle import Aisle
 from models.orders import Order
 from models.order_item import OrderItem
 from models.recommendation import Recommendation
+from models.catalog import CatalogVersion, DepartmentAisle
 from database.database import get_database_engine
+from services.catalog_service import bump_catalog_version, refresh_department_aisles
 from auth.hash_password import HashPassword
 
 logger = logging.getLogger(__name__)
@@ -115,6 +117,8 @@ def load_products_from_csv(session: Session, filepath: str) -> None:
         session.merge(product)
 
     session.commit()
+    refresh_department_aisles(session)
+    bump_catalog_version(session)
     logger.info(f"Загружено {len(df_products)} продуктов")
 
 
@@ -182,6 +186,8 @@ def create_sample_data(session: Session) -> None:
         OrderItem(order_id=order2.id, product_id=products[3].id, quantity=1),
     ]
     session.add_all(order_items)
+    refresh_department_aisles(session)
+    bump_catalog_version(session)
 
     logger.info("Создан минимальный набор тестовых данных")
 
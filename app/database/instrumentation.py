@@ -0,0 +1,51 @@
+# app/database/instrumentation.py
+"""
+Точки подключения метрик к движку БД и клиенту Redis.
+
+Слой database не зависит от services: пул соединений и клиент Redis
+сообщают о событиях наблюдателям, а services.metrics при импорте
+подписывает на них свои гистограммы и счетчики. Пока метрики не
+подключены (воркеры, скрипты импорта), события никуда не уходят.
+"""
+import time
+import logging
+from collections import defaultdict
+from typing import Callable, DefaultDict, List
+
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Ожидание соединения из пула: (секунды)
+POOL_CHECKOUT = "pool_checkout"
+# Выполненная команда Redis: (команда, секунды)
+REDIS_COMMAND = "redis_command"
+# Команда Redis без ответа: (команда, причина: error, timeout или circuit_open)
+REDIS_FAILURE = "redis_failure"
+
+_observers: DefaultDict[str, List[Callable]] = defaultdict(list)
+
+
+def subscribe(event: str, callback: Callable) -> None:
+    """Подписка на событие движка БД или клиента Redis"""
+    _observers[event].append(callback)
+
+
+def notify(event: str, *args) -> None:
+    """Передача события наблюдателям; их ошибки не должны ломать запрос"""
+    for callback in _observers.get(event, ()):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.debug(f"Ошибка наблюдателя {event}: {e}")
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, сообщающий время ожидания свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            notify(POOL_CHECKOUT, time.perf_counter() - started)
@@ -0,0 +1,168 @@
+# app/database/redis_client.py
+"""
+Клиент Redis с общим пулом соединений и предохранителем.
+
+Соединения создаются лениво при первой команде, поэтому недоступный при
+старте Redis не отключает кеш до перезапуска. Команды выполняются с
+коротким таймаутом и без повторов (по умолчанию redis-py повторяет
+команду до трех раз с экспоненциальной паузой от секунды). После
+REDIS_FAILURE_THRESHOLD ошибок подряд предохранитель размыкается: команды
+сразу возвращают значение по умолчанию, а фоновый поток раз в
+REDIS_RETRY_INTERVAL проверяет Redis и замыкает предохранитель, когда тот
+снова отвечает.
+
+Ошибки Redis не пробрасываются: кеш не должен ломать запрос, вызывающий
+код видит промах (get -> None) или неудачную запись (setex -> False).
+"""
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from .instrumentation import notify, REDIS_COMMAND, REDIS_FAILURE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+
+
+class ResilientRedis:
+    """Обертка над redis.Redis: ленивое подключение, таймауты и предохранитель"""
+
+    def __init__(self, url: Optional[str] = None, socket_timeout: float = 0.1, connect_timeout: float = 0.25,
+                 max_connections: int = 32, failure_threshold: int = 3, retry_interval: float = 5.0,
+                 client=None):
+        """
+        Args:
+            url: URL Redis (не нужен, если передан client)
+            socket_timeout: Таймаут команды (сек)
+            connect_timeout: Таймаут подключения (сек)
+            max_connections: Размер пула; сверх него команда сразу завершается ошибкой
+            failure_threshold: Ошибок подряд до размыкания предохранителя
+            retry_interval: Период фоновой проверки разомкнутого предохранителя (сек)
+            client: Готовый клиент (fakeredis в бенчмарках и тестах)
+        """
+        self.url = url
+        self.socket_timeout = socket_timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.failure_threshold = max(1, failure_threshold)
+        self.retry_interval = retry_interval
+
+        self._client = client
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._probe: Optional[threading.Thread] = None
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def client(self) -> redis.Redis:
+        """redis.Redis с общим пулом, создается при первом обращении"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    no_retry = Retry(NoBackoff(), 0)
+                    pool = redis.ConnectionPool.from_url(
+                        self.url,
+                        max_connections=self.max_connections,
+                        socket_timeout=self.socket_timeout,
+                        socket_connect_timeout=self.connect_timeout,
+                        health_check_interval=30,
+                        retry=no_retry,
+                    )
+                    self._client = redis.Redis(connection_pool=pool, retry=no_retry)
+        return self._client
+
+    @property
+    def available(self) -> bool:
+        """Предохранитель замкнут: команды отправляются в Redis"""
+        return self.state == CLOSED
+
+    def execute(self, command: str, *args, default: Any = None, **kwargs) -> Any:
+        """Команда Redis; при ошибке или разомкнутом предохранителе - default"""
+        if self.state != CLOSED:
+            notify(REDIS_FAILURE, command, "circuit_open")
+            return default
+
+        started = time.perf_counter()
+        try:
+            result = getattr(self.client, command)(*args, **kwargs)
+        except (redis.RedisError, OSError) as e:
+            notify(REDIS_COMMAND, command, time.perf_counter() - started)
+            notify(REDIS_FAILURE, command, "timeout" if isinstance(e, redis.TimeoutError) else "error")
+            self._record_failure(command, e)
+            return default
+
+        notify(REDIS_COMMAND, command, time.perf_counter() - started)
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+        return result
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute("get", key)
+
+    def setex(self, key: str, ttl: int, value) -> bool:
+        return bool(self.execute("setex", key, ttl, value, default=False))
+
+    def delete(self, *keys: str) -> int:
+        return self.execute("delete", *keys, default=0)
+
+    def ping(self) -> bool:
+        return bool(self.execute("ping", default=False))
+
+    def _record_failure(self, command: str, error: Exception):
+        with self._lock:
+            self.failures += 1
+            if self.state != CLOSED or self.failures < self.failure_threshold:
+                logger.debug(f"Ошибка Redis ({command}): {error}")
+                return
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            logger.warning(f"Redis недоступен ({error}), {self.failures} ошибок подряд: "
+                           f"кеш отключен, проверка каждые {self.retry_interval:g} с")
+            if self._probe is None or not self._probe.is_alive():
+                self._probe = threading.Thread(target=self._probe_loop, name="redis-probe", daemon=True)
+                self._probe.start()
+
+    def _probe_loop(self):
+        """Фоновая проверка Redis, пока предохранитель разомкнут"""
+        while not self._stop.wait(self.retry_interval):
+            try:
+                # Сокеты пула могли остаться от прежнего соединения
+                self.client.connection_pool.disconnect()
+                self.client.ping()
+            except (redis.RedisError, OSError) as e:
+                logger.debug(f"Redis по-прежнему недоступен: {e}")
+                continue
+            with self._lock:
+                self.state = CLOSED
+                self.failures = 0
+                downtime = time.monotonic() - (self.opened_at or time.monotonic())
+            logger.info(f"Redis снова доступен после {downtime:.1f} с, кеш включен")
+            return
+
+    def close(self):
+        """Остановка фоновой проверки и закрытие соединений пула"""
+        self._stop.set()
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        """Состояние для метрик: предохранитель и соединения пула"""
+        values = {"circuit_open": 0.0 if self.available else 1.0, "consecutive_failures": float(self.failures)}
+        pool = getattr(self._client, "connection_pool", None)
+        if pool is not None:
+            values["in_use"] = float(len(getattr(pool, "_in_use_connections", ())))
+            values["idle"] = float(len(getattr(pool, "_available_connections", ())))
+        return values
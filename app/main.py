@@ -1,11 +1,15 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routes import auth, recommendations, products, orders
+from routes import auth, recommendations, products, orders, admin
 from database.config import get_settings
+from database.database import engine, redis_client
+from services.warmup import warmup_state, run_warmup
+from services import metrics, profiler
+from services.serialization import FastJSONResponse
+import asyncio
 import logging
-import subprocess
-import time
 
 # Получаем настройки
 settings = get_settings()
@@ -25,7 +29,8 @@ if not settings.DEBUG:
 app = FastAPI(
     title="Recommendation System API",
     description="API для системы рекомендаций продуктов",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Настройка CORS
@@ -35,13 +40,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Recommendation-Source", "X-Profile-Id", "Server-Timing"],
 )
 
+# Длительность запросов и время БД по маршрутам для /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+# Состояние пулов БД и Redis считывается при каждом сборе метрик
+metrics.register_pool_gauges(engine)
+metrics.register_redis_gauges(redis_client)
+
+# Профиль отдельного запроса администратора по заголовку X-Profile
+app.add_middleware(profiler.ProfilerMiddleware)
+
 # Подключаем роутеры
 app.include_router(auth)
 app.include_router(recommendations)
 app.include_router(products)
 app.include_router(orders)
+app.include_router(admin)
 
 
 @app.get("/")
@@ -56,60 +72,38 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Готовность сервиса: этапы фонового прогрева и их длительность"""
+    snapshot = warmup_state.snapshot()
+    if not snapshot["ready"]:
+        response.status_code = 503
+    return snapshot
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске"""
     logger = logging.getLogger(__name__)
     logger.info("Starting Recommendation System API...")
 
-    # Проверяем и инициализируем БД
-    try:
-        from database.database import engine
-        from sqlalchemy import text
-        import subprocess
-        import time
-
-        # Даем время БД запуститься
-        time.sleep(10)
-
-        with engine.connect() as conn:
-            # Проверяем существование таблицы product
-            result = conn.execute(text(
-                "SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'product')"
-            )).scalar()
-
-            if not result:
-                logger.info("Database is empty. Starting data import...")
-                # Запускаем импорт данных
-                subprocess.run([
-                    "python", "-m", "database.import_fast", "100"
-                ], check=True)
-                logger.info("Data import completed successfully!")
-            else:
-                logger.info("Database already initialized.")
-
-    except Exception as e:
-        logger.error(f"Error during database initialization: {e}")
-        # Не прерываем запуск приложения
-
-    # Пробуем предзагрузить популярные товары
-    try:
-        from services.recommendation_service import RecommendationService
-        from database.database import get_session
-        from sqlalchemy import text
-
-        # Проверяем, существует ли таблица product
-        with next(get_session()) as session:
-            result = session.execute(text(
-                "SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'product')"
-            )).scalar()
-
-            if result:
-                service = RecommendationService(session)
-                # Загружаем данные и кешируем популярные товары
-                service.load_data()
-                logger.info("Популярные товары предзагружены в кеш")
-            else:
-                logger.warning("Таблицы БД еще не созданы. Пропускаем предзагрузку.")
-    except Exception as e:
-        logger.warning(f"Не удалось предзагрузить популярные товары: {e}")
\ No newline at end of file
+    # Ожидание БД, импорт и загрузка модели идут в фоне, /health отвечает сразу
+    app.state.warmup_task = asyncio.create_task(asyncio.to_thread(run_warmup))
+
+    # Постоянное семплирование стеков, если включено в настройках
+    profiler.start_if_enabled()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Запись накопленного профиля при остановке"""
+    active = profiler.get_profiler()
+    if active.running:
+        active.stop()
+        active.flush()
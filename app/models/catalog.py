@@ -0,0 +1,31 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+
+
+class CatalogVersion(SQLModel, table=True):
+    """
+    Версия каталога товаров.
+
+    Единственная строка (id=1), версия увеличивается при каждом импорте
+    и любой записи в каталог. По ней инвалидируются кеши и ETag каталога.
+    """
+    __tablename__ = "catalog_version"
+
+    id: Optional[int] = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DepartmentAisle(SQLModel, table=True):
+    """
+    Материализованная связь отдел -> проход с количеством товаров.
+
+    Заполняется при импорте каталога, чтобы навигация по категориям
+    не сканировала таблицу product.
+    """
+    __tablename__ = "department_aisle"
+
+    department_id: int = Field(foreign_key="department.id", primary_key=True)
+    aisle_id: int = Field(foreign_key="aisle.id", primary_key=True)
+    product_count: int = Field(default=0)
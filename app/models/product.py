@@ -1,5 +1,6 @@
 # app/models/product.py
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional, List, TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -23,6 +24,12 @@ class ProductBase(SQLModel):
 
 class Product(ProductBase, table=True):
     """Модель товара для БД"""
+    __table_args__ = (
+        # Индексы для keyset-пагинации каталога с фильтрами
+        Index("idx_product_department_id_id", "department_id", "id"),
+        Index("idx_product_aisle_id_id", "aisle_id", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     # Связи
@@ -15,6 +15,7 @@ class ModelType(str, Enum):
     POPULAR = "popular"
     TFIDF = "tfidf"
     COLLABORATIVE = "collaborative"
+    SVD = "svd"
 
 
 class RecommendationBase(SQLModel):
@@ -3,5 +3,6 @@ from .auth import router as auth
 from .products import router as products
 from .recommendations import router as recommendations
 from .orders import router as orders
+from .admin import router as admin
 
-__all__ = ["auth", "products", "recommendations", "orders"]
\ No newline at end of file
+__all__ = ["auth", "products", "recommendations", "orders", "admin"]
\ No newline at end of file
@@ -0,0 +1,88 @@
+# app/routes/admin.py
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from auth.authenticate import authenticate_admin
+from database.config import get_settings
+from services.profiler import get_profiler, request_profiles
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/profiler")
+async def profiler_status(user_id: str = Depends(authenticate_admin)):
+    """
+    Состояние постоянного профилировщика: число семплов, самые частые функции и спаны
+    """
+    return get_profiler().stats()
+
+
+@router.post("/profiler/start")
+async def profiler_start(
+        user_id: str = Depends(authenticate_admin),
+        interval_ms: Optional[float] = Query(None, ge=1, le=1000, description="Период семплирования (мс)")
+):
+    """
+    Включить постоянное семплирование стеков
+    """
+    profiler = get_profiler()
+    if interval_ms is not None and not profiler.running:
+        profiler.interval = interval_ms / 1000
+    profiler.start()
+    logger.info(f"Профилировщик включен пользователем {user_id}")
+    return profiler.stats()
+
+
+@router.post("/profiler/stop")
+async def profiler_stop(user_id: str = Depends(authenticate_admin)):
+    """
+    Выключить семплирование и записать накопленный профиль в файл
+    """
+    profiler = get_profiler()
+    profiler.stop()
+    path = profiler.flush()
+    logger.info(f"Профилировщик выключен пользователем {user_id}")
+    return {**profiler.stats(), "file": str(path) if path else None}
+
+
+@router.post("/profiler/dump")
+async def profiler_dump(user_id: str = Depends(authenticate_admin)):
+    """
+    Записать текущее окно профиля в collapsed файл для flamegraph.pl или speedscope
+    """
+    profiler = get_profiler()
+    if profiler.samples == 0:
+        raise HTTPException(status_code=409, detail="Профиль пуст, семплирование не запускалось")
+
+    name = f"dump_{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.collapsed"
+    path = profiler.dump(Path(get_settings().PROFILER_OUTPUT_DIR) / name)
+    return {"file": str(path), "samples": profiler.samples}
+
+
+@router.get("/profiler/profile", response_class=PlainTextResponse)
+async def profiler_profile(user_id: str = Depends(authenticate_admin)):
+    """
+    Текущее окно постоянного профиля в collapsed формате
+    """
+    return PlainTextResponse(get_profiler().collapsed())
+
+
+@router.get("/profiler/requests/{profile_id}")
+async def request_profile(
+        profile_id: str,
+        user_id: str = Depends(authenticate_admin),
+        format: str = Query("json", pattern="^(json|collapsed)$", description="json или collapsed")
+):
+    """
+    Профиль запроса, выполненного с заголовком X-Profile
+    """
+    profile = request_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    if format == "collapsed":
+        return PlainTextResponse(profile["collapsed"])
+    return profile
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import Session, select
 from auth.authenticate import authenticate
-from auth.hash_password import HashPassword
+from auth.hash_password import HashPassword, HashPoolBusyError
 from auth.jwt_handler import create_access_token
 from database.database import get_session
 from database.config import get_settings
@@ -19,6 +19,41 @@ auth_route = APIRouter(prefix="/auth", tags=["authentication"])
 hash_password = HashPassword()
 
 
+def _hash_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent password operations, retry later",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def _create_hash(password: str) -> str:
+    """Хеширование пароля в пуле bcrypt"""
+    try:
+        return await hash_password.acreate_hash(password)
+    except HashPoolBusyError:
+        raise _hash_pool_busy()
+
+
+async def _verify_password(session: Session, user: User, password: str) -> bool:
+    """
+    Проверка пароля в пуле bcrypt.
+
+    Если хеш создан с другой стоимостью (BCRYPT_ROUNDS), он прозрачно
+    пересчитывается и сохраняется при успешном входе.
+    """
+    try:
+        valid, new_hash = await hash_password.averify_and_update(password, user.password_hash)
+    except HashPoolBusyError:
+        raise _hash_pool_busy()
+
+    if valid and new_hash:
+        user.password_hash = new_hash
+        session.add(user)
+        session.commit()
+    return valid
+
+
 @auth_route.post("/create-test-user")
 async def create_test_user(session: Session = Depends(get_session)):
     """
@@ -37,7 +72,7 @@ async def create_test_user(session: Session = Depends(get_session)):
     test_user = User(
         email="admin@example.com",
         name="Admin User",
-        password_hash=hash_password.create_hash("admin123")
+        password_hash=await _create_hash("admin123")
     )
 
     session.add(test_user)
@@ -80,7 +115,7 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    if hash_password.verify_hash(form_data.password, user_exist.password_hash):
+    if await _verify_password(session, user_exist, form_data.password):
         # Создаем JWT токен с ID пользователя
         access_token = create_access_token(str(user_exist.id))
 
@@ -111,9 +146,7 @@ async def login(user_data: UserSignIn, session: Session = Depends(get_session)):
         )
 
     # Проверяем пароль
-    if not user.password_hash or not hash_password.verify_hash(
-        user_data.password, user.password_hash
-    ):
+    if not user.password_hash or not await _verify_password(session, user, user_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -152,7 +185,7 @@ async def sign_up(user_data: UserSignUp, session: Session = Depends(get_session)
     new_user = User(
         email=user_data.email,
         name=user_data.name,
-        password_hash=hash_password.create_hash(user_data.password)
+        password_hash=await _create_hash(user_data.password)
     )
 
     session.add(new_user)
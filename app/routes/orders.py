@@ -8,9 +8,8 @@ from models.orders import Order
 from models.order_item import OrderItem
 from schemas.order import OrderCreate, OrderResponse, OrderConfirmation, OrderItemResponse
 from auth.authenticate import authenticate
+from services.task_queue import publish_task
 import logging
-import pika
-import json
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -19,37 +18,19 @@ router = APIRouter(prefix="/orders", tags=["orders"])
 
 def send_recommendation_update_to_queue(user_id: int, order_id: int, ordered_products: List[int]) -> bool:
     """Отправка задачи на асинхронное обновление рекомендаций в RabbitMQ"""
-    try:
-        credentials = pika.PlainCredentials('rmuser', 'rmpassword')
-        parameters = pika.ConnectionParameters(
-            host='rabbitmq',
-            port=5672,
-            credentials=credentials
-        )
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        channel.queue_declare(queue='ml_task_queue')
-
-        task_data = {
-            "task_id": str(uuid.uuid4()),
-            "task_type": "update_recommendations",
-            "user_id": user_id,
-            "order_id": order_id,
-            "ordered_products": ordered_products,
-            "question": f"Update recommendations for user {user_id} after order {order_id}"  # для совместимости
-        }
-
-        channel.basic_publish(
-            exchange='',
-            routing_key='ml_task_queue',
-            body=json.dumps(task_data)
-        )
-        connection.close()
+    task_data = {
+        "task_id": str(uuid.uuid4()),
+        "task_type": "update_recommendations",
+        "user_id": user_id,
+        "order_id": order_id,
+        "ordered_products": ordered_products,
+        "question": f"Update recommendations for user {user_id} after order {order_id}"  # для совместимости
+    }
+
+    if publish_task(task_data):
         logger.info(f"Recommendation update task sent for user {user_id}")
         return True
-    except Exception as e:
-        logger.error(f"Failed to send to RabbitMQ: {e}")
-        return False
+    return False
 
 
 @router.post("/", response_model=OrderConfirmation)
@@ -1,137 +1,184 @@
 # app/routers/products.py
-from typing import List, Optional
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlmodel import Session, select, or_
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
+from sqlmodel import Session
 from database.database import get_session
-from schemas.recommendation import ProductDetail
-from models.product import Product
-from models.department import Department
-from models.aisle import Aisle
+from schemas.recommendation import ProductDetail, BoughtTogetherItem, SessionCart
+from services.catalog_service import CatalogService, CachedPayload, etag_matches
+from services.bought_together import get_index
+from services.serialization import FastJSONResponse
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 
+def _conditional_response(request: Request, payload: CachedPayload, compress: bool = False) -> Response:
+    """
+    Ответ каталога с ETag: 304 при совпадении If-None-Match, иначе тело из кеша.
+    """
+    headers = {"ETag": payload.etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), payload.etag):
+        return Response(status_code=304, headers=headers)
+
+    if compress:
+        headers["Vary"] = "Accept-Encoding"
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return Response(content=payload.gzipped(), media_type="application/json", headers=headers)
+
+    return Response(content=payload.body, media_type="application/json", headers=headers)
+
+
 @router.get("/", response_model=List[ProductDetail])
 async def get_products(
         session: Session = Depends(get_session),
         search: Optional[str] = Query(None, description="Поиск по названию"),
         department_id: Optional[int] = Query(None, description="Фильтр по отделу"),
         aisle_id: Optional[int] = Query(None, description="Фильтр по проходу"),
+        cursor: Optional[int] = Query(None, ge=0, description="ID последнего товара предыдущей страницы"),
         skip: int = Query(0, ge=0),
         limit: int = Query(20, ge=1, le=100)
 ):
     """
-    Получить список продуктов с фильтрацией и поиском
-    """
-    query = select(
-        Product.id,
-        Product.name,
-        Product.aisle_id,
-        Product.department_id,
-        Aisle.name.label("aisle_name"),
-        Department.name.label("department_name")
-    ).join(
-        Aisle, Product.aisle_id == Aisle.id
-    ).join(
-        Department, Product.department_id == Department.id
-    ).where(
-        Product.is_active == True
-    )
-
-    # Поиск по названию
-    if search:
-        query = query.where(Product.name.ilike(f"%{search}%"))
-
-    # Фильтр по отделу
-    if department_id:
-        query = query.where(Product.department_id == department_id)
-
-    # Фильтр по проходу
-    if aisle_id:
-        query = query.where(Product.aisle_id == aisle_id)
+    Получить список продуктов с фильтрацией и поиском.
 
-    # Пагинация
-    query = query.offset(skip).limit(limit)
-
-    results = session.exec(query).all()
+    Для постраничного обхода используйте cursor из заголовка X-Next-Cursor,
+    общее количество товаров возвращается в заголовке X-Total-Count.
+    """
+    catalog = CatalogService(session)
+
+    results, next_cursor = catalog.list_products(
+        search=search,
+        department_id=department_id,
+        aisle_id=aisle_id,
+        cursor=cursor,
+        skip=skip,
+        limit=limit
+    )
 
-    return [
-        ProductDetail(
-            id=r.id,
-            name=r.name,
-            aisle_id=r.aisle_id,
-            department_id=r.department_id,
-            aisle_name=r.aisle_name,
-            department_name=r.department_name
-        ) for r in results
-    ]
+    headers = {"X-Total-Count": str(catalog.count_products(search, department_id, aisle_id))}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+
+    # Строки каталога уже типизированы схемой БД: словари сериализуются
+    # напрямую, без ProductDetail на каждый товар
+    return FastJSONResponse(
+        [
+            {
+                "id": r.id,
+                "name": r.name,
+                "aisle_id": r.aisle_id,
+                "department_id": r.department_id,
+                "aisle_name": r.aisle_name,
+                "department_name": r.department_name,
+                "times_ordered": 0
+            } for r in results
+        ],
+        headers=headers
+    )
 
 
 @router.get("/{product_id}", response_model=ProductDetail)
 async def get_product(
         product_id: int,
+        request: Request,
         session: Session = Depends(get_session)
 ):
     """
     Получить информацию о конкретном продукте
     """
-    result = session.exec(
-        select(
-            Product.id,
-            Product.name,
-            Product.aisle_id,
-            Product.department_id,
-            Aisle.name.label("aisle_name"),
-            Department.name.label("department_name")
-        ).join(
-            Aisle, Product.aisle_id == Aisle.id
-        ).join(
-            Department, Product.department_id == Department.id
-        ).where(
-            Product.id == product_id,
-            Product.is_active == True
-        )
-    ).first()
+    payload = CatalogService(session).get_product(product_id)
 
-    if not result:
+    if payload is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return ProductDetail(
-        id=result.id,
-        name=result.name,
-        aisle_id=result.aisle_id,
-        department_id=result.department_id,
-        aisle_name=result.aisle_name,
-        department_name=result.department_name
-    )
+    return _conditional_response(request, payload)
+
+
+def _bought_together(session: Session, product_ids: List[int], scores: List[float]) -> FastJSONResponse:
+    """Товары индекса совместных покупок с названиями из каталога"""
+    score_by_id = dict(zip(product_ids, scores))
+    items: List[Dict] = [
+        {
+            "product_id": row.id,
+            "product_name": row.name,
+            "score": score_by_id[row.id],
+            "aisle_name": row.aisle_name,
+            "department_name": row.department_name
+        }
+        for row in CatalogService(session).products_by_ids(product_ids)
+    ]
+    return FastJSONResponse(items)
+
+
+def _require_index():
+    index = get_index()
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Индекс совместных покупок не построен (python -m services.bought_together)"
+        )
+    return index
+
+
+@router.get("/{product_id}/bought-together", response_model=List[BoughtTogetherItem])
+async def get_bought_together(
+        product_id: int,
+        session: Session = Depends(get_session),
+        limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Товары, которые чаще всего покупают вместе с данным (по PMI совместных покупок)
+    """
+    return _bought_together(session, *_require_index().partners(product_id, limit))
+
+
+@router.post("/bought-together", response_model=List[BoughtTogetherItem])
+async def get_cart_bought_together(
+        cart: SessionCart,
+        session: Session = Depends(get_session),
+        limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Дополнение корзины: партнеры всех товаров корзины, кроме уже лежащих в ней
+    """
+    return _bought_together(session, *_require_index().for_cart(cart.product_ids, limit))
 
 
 @router.get("/departments/list", response_model=List[dict])
-async def get_departments(session: Session = Depends(get_session)):
+async def get_departments(request: Request, session: Session = Depends(get_session)):
     """
     Получить список всех отделов
     """
-    departments = session.exec(select(Department)).all()
-    return [{"id": d.id, "name": d.name} for d in departments]
+    return _conditional_response(request, CatalogService(session).get_departments())
+
+
+@router.get("/departments/tree", response_model=List[dict])
+async def get_department_tree(request: Request, session: Session = Depends(get_session)):
+    """
+    Получить дерево категорий: отделы с проходами и количеством товаров
+    """
+    return _conditional_response(request, CatalogService(session).get_department_tree())
 
 
 @router.get("/aisles/list", response_model=List[dict])
 async def get_aisles(
+        request: Request,
         department_id: Optional[int] = Query(None),
         session: Session = Depends(get_session)
 ):
     """
     Получить список проходов (опционально по отделу)
     """
-    query = select(Aisle)
+    return _conditional_response(request, CatalogService(session).get_aisles(department_id))
 
-    if department_id:
-        # Фильтруем проходы по отделу через продукты
-        query = select(Aisle).join(
-            Product, Aisle.id == Product.aisle_id
-        ).where(
-            Product.department_id == department_id
-        ).distinct()
 
-    aisles = session.exec(query).all()
-    return [{"id": a.id, "name": a.name} for a in aisles]
+@router.get("/catalog/snapshot")
+async def get_catalog_snapshot(request: Request, session: Session = Depends(get_session)):
+    """
+    Получить полный снимок каталога (отделы, проходы, товары).
+
+    Снимок сжимается gzip и помечается ETag версии каталога, поэтому
+    фронтенд может хранить его локально и перепроверять через If-None-Match.
+    """
+    return _conditional_response(request, CatalogService(session).get_snapshot(), compress=True)
@@ -1,6 +1,7 @@
 # app/routes/recommendations.py
-from typing import List, Optional
+from typing import Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
 from sqlmodel import Session, select, func
 from database.database import get_session
 from models.product import Product
@@ -12,12 +13,16 @@ from models.aisle import Aisle
 from models.recommendation import ModelType
 from schemas.recommendation import (
     RecommendationResponse,
+    SessionCart,
     OrderHistoryItem,
     UserPreferences,
     ProductBase,
     ProductDetail
 )
 from auth.authenticate import authenticate
+from services.rpc_client import rpc_client, RPCUnavailableError
+from services.serialization import FastJSONResponse
+from services.popular_cache import CACHE_SIZE as POPULAR_CACHE_SIZE
 import logging
 
 logger = logging.getLogger(__name__)
@@ -49,21 +54,15 @@ async def get_recommendations(
 
     # Сначала получаем популярные товары (они нужны для исключения)
     popular_product_ids = []
-    if exclude_popular and model_type == ModelType.COLLABORATIVE:
-        # Получаем ID популярных товаров
-        popular_query = session.exec(
-            select(Product.id)
-            .join(OrderItem, Product.id == OrderItem.product_id)
-            .group_by(Product.id)
-            .order_by(func.count(OrderItem.id).desc())
-            .limit(10)  # Берем топ-50 популярных
-        ).all()
-
-        popular_product_ids = list(popular_query)
+    personal = model_type in (ModelType.COLLABORATIVE, ModelType.SVD)
+    if exclude_popular and personal:
+        # ID популярных товаров из того же кеша, что и список популярных
+        popular = await run_in_threadpool(_popular_fallback, session, 10)
+        popular_product_ids = [rec["product_id"] for rec in popular]
         print(f"[DEBUG] Found {len(popular_product_ids)} popular products to exclude")
 
-    # Для collaborative рекомендаций
-    if model_type == ModelType.COLLABORATIVE:
+    # Для персональных (collaborative и SVD) рекомендаций
+    if personal:
         # Строим запрос
         query = select(
             Recommendation.product_id,
@@ -80,7 +79,7 @@ async def get_recommendations(
             Department, Product.department_id == Department.id
         ).where(
             Recommendation.user_id == user_id_int,
-            Recommendation.model_type == ModelType.COLLABORATIVE
+            Recommendation.model_type == model_type
         )
 
         # ИСКЛЮЧАЕМ популярные товары
@@ -114,7 +113,7 @@ async def get_recommendations(
                 Department, Product.department_id == Department.id
             ).where(
                 Recommendation.user_id == user_id_int,
-                Recommendation.model_type == ModelType.COLLABORATIVE,
+                Recommendation.model_type == model_type,
                 ~Recommendation.product_id.in_(exclude_ids)
             ).order_by(
                 Recommendation.score.desc()
@@ -144,43 +143,133 @@ async def get_recommendations(
 
     # Для популярных товаров
     if model_type == ModelType.POPULAR:
-        popular_products = session.exec(
-            select(
-                Product.id.label("product_id"),
-                Product.name.label("product_name"),
-                Aisle.name.label("aisle_name"),
-                Department.name.label("department_name"),
-                func.count(OrderItem.id).label("popularity")
-            ).select_from(
-                Product
-            ).join(
-                OrderItem, Product.id == OrderItem.product_id
-            ).join(
-                Aisle, Product.aisle_id == Aisle.id
-            ).join(
-                Department, Product.department_id == Department.id
-            ).group_by(
-                Product.id, Product.name, Aisle.name, Department.name
-            ).order_by(
-                func.count(OrderItem.id).desc()
-            ).limit(limit)
-        ).all()
-
-        return [
-            RecommendationResponse(
-                product_id=p.product_id,
-                product_name=p.product_name,
-                score=1.0 - (idx * 0.05),
-                model_type=ModelType.POPULAR,
-                aisle_name=p.aisle_name,
-                department_name=p.department_name
-            )
-            for idx, p in enumerate(popular_products)
-        ]
+        return FastJSONResponse(await run_in_threadpool(_popular_fallback, session, limit))
 
     return []
 
 
+def _trusted_list(recommendations: List[Dict], source: str) -> FastJSONResponse:
+    """
+    Ответ из словарей воркера инференса или кеша популярных: их формирует
+    _get_product_details, поэтому RecommendationResponse на каждый элемент
+    не создается.
+    """
+    return FastJSONResponse(recommendations, headers={"X-Recommendation-Source": source})
+
+
+def _popular_from_db(session: Session, limit: int) -> List[Dict]:
+    """Популярные товары по числу позиций в заказах"""
+    popular_products = session.exec(
+        select(
+            Product.id.label("product_id"),
+            Product.name.label("product_name"),
+            Aisle.name.label("aisle_name"),
+            Department.name.label("department_name"),
+            func.count(OrderItem.id).label("popularity")
+        ).select_from(
+            Product
+        ).join(
+            OrderItem, Product.id == OrderItem.product_id
+        ).join(
+            Aisle, Product.aisle_id == Aisle.id
+        ).join(
+            Department, Product.department_id == Department.id
+        ).group_by(
+            Product.id, Product.name, Aisle.name, Department.name
+        ).order_by(
+            func.count(OrderItem.id).desc()
+        ).limit(limit)
+    ).all()
+
+    return [
+        {
+            "product_id": p.product_id,
+            "product_name": p.product_name,
+            "score": 1.0 - (idx * 0.05),
+            "model_type": ModelType.POPULAR.value,
+            "aisle_name": p.aisle_name,
+            "department_name": p.department_name
+        }
+        for idx, p in enumerate(popular_products)
+    ]
+
+
+@router.get("/realtime", response_model=List[RecommendationResponse])
+async def get_realtime_recommendations(
+        user_id: str = Depends(authenticate),
+        session: Session = Depends(get_session),
+        limit: int = Query(10, ge=1, le=50, description="Количество рекомендаций")
+):
+    """
+    Рекомендации, рассчитанные воркером инференса в момент запроса.
+
+    Если воркер недоступен или не ответил за RECOMMENDATION_RPC_TIMEOUT,
+    возвращаются популярные товары. Источник - в заголовке X-Recommendation-Source.
+    """
+    try:
+        result = await rpc_client.recommend(int(user_id), limit)
+        return _trusted_list(
+            [{**rec, "model_type": ModelType.COLLABORATIVE.value} for rec in result["recommendations"]], "rpc"
+        )
+    except RPCUnavailableError as e:
+        logger.warning(f"Инференс недоступен для пользователя {user_id}: {e}")
+
+    return _trusted_list(await run_in_threadpool(_popular_fallback, session, limit), "popular")
+
+
+def _popular_fallback(session: Session, limit: int) -> List[Dict]:
+    """
+    Популярные товары из кеша Redis или из БД.
+
+    Промах кеша пересчитывается одним запросом, устаревший список
+    обновляется в фоне (services.popular_cache). Функция блокирующая
+    (запрос к БД, ожидание чужого пересчета), async маршруты вызывают ее
+    через run_in_threadpool.
+    """
+    # Без Redis кеш популярных хранит только id товаров, поэтому идем в БД
+    service = get_recommendation_service(session)
+    if service and service.redis and service.redis.available:
+        bind = session.get_bind()
+        cached = service.popular_cache().get(lambda: _load_popular(bind))
+        if cached:
+            return [{**rec, "model_type": ModelType.POPULAR.value} for rec in cached[:limit]]
+    return _popular_from_db(session, limit)
+
+
+def _load_popular(bind) -> List[Dict]:
+    """Пересчет кеша популярных в своей сессии: может выполняться в фоновом потоке"""
+    with Session(bind) as session:
+        return _popular_from_db(session, POPULAR_CACHE_SIZE)
+
+
+@router.post("/session", response_model=List[RecommendationResponse])
+async def get_session_recommendations(
+        cart: SessionCart,
+        user_id: str = Depends(authenticate),
+        session: Session = Depends(get_session),
+        limit: int = Query(10, ge=1, le=50, description="Количество рекомендаций")
+):
+    """
+    Рекомендации с учетом текущей корзины.
+
+    Воркер инференса добавляет товары корзины к вектору пользователя в
+    обученной модели: без переобучения и записи в БД, за тот же
+    RECOMMENDATION_RPC_TIMEOUT. Товары корзины в ответ не попадают. Если
+    воркер недоступен, возвращаются популярные товары не из корзины.
+    """
+    in_cart = set(cart.product_ids)
+    try:
+        result = await rpc_client.recommend(int(user_id), limit, cart=cart.product_ids)
+        return _trusted_list(
+            [{**rec, "model_type": ModelType.COLLABORATIVE.value} for rec in result["recommendations"]], "session"
+        )
+    except RPCUnavailableError as e:
+        logger.warning(f"Инференс недоступен для корзины пользователя {user_id}: {e}")
+
+    popular = await run_in_threadpool(_popular_fallback, session, limit + len(in_cart))
+    return _trusted_list([rec for rec in popular if rec["product_id"] not in in_cart][:limit], "popular")
+
+
 @router.get("/order-history", response_model=List[OrderHistoryItem])
 async def get_order_history(
         user_id: str = Depends(authenticate),
@@ -1,7 +1,7 @@
 # app/schemas/recommendation.py
 from typing import List, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from models.recommendation import ModelType
 
 
@@ -36,6 +36,20 @@ class RecommendationResponse(BaseModel):
         from_attributes = True
 
 
+class BoughtTogetherItem(BaseModel):
+    """Товар, который часто покупают вместе с запрошенными"""
+    product_id: int
+    product_name: str
+    score: float
+    aisle_name: Optional[str]
+    department_name: Optional[str]
+
+
+class SessionCart(BaseModel):
+    """Товары текущей корзины для рекомендаций сессии"""
+    product_ids: List[int] = Field(default_factory=list, max_length=500)
+
+
 class OrderHistoryItem(BaseModel):
     """Элемент истории заказов"""
     order_id: int
@@ -0,0 +1,274 @@
+# app/services/bought_together.py
+"""
+Индекс "часто покупают вместе" по совместным покупкам в заказах.
+
+Корзины заказов - бинарная матрица заказы x товары B, совместные покупки -
+C = Bᵀ B. Пары нормируются PMI: log(c_ij * N / (n_i * n_j)), где N - число
+заказов, n_i - число заказов с товаром i (PMI = log lift). Так бананы и
+молоко, которые есть почти в каждой корзине, не вытесняют действительно
+связанные товары. Пары, встретившиеся реже min_count раз, отбрасываются
+(PMI редких пар шумный), для каждого товара остаются top_k партнеров с
+положительным PMI. C считается блоками строк, полная матрица совместных
+покупок в памяти не строится.
+
+Индекс - CSR матрица товары x товары (float32 PMI, int32 индексы) и id
+товаров в одном NPZ файле в MODEL_ARTIFACT_DIR. API загружает его при первом
+запросе и перечитывает после замены файла; ответ - одна строка матрицы для
+товара или сумма строк товаров корзины.
+
+Запуск:
+    python -m services.bought_together [data_dir] [--source=files|db] [--output=PATH] [--top-k=20] [--min-count=3]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from scipy.sparse import csr_matrix
+
+# Добавляем путь к проекту
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.config import get_settings
+from services.id_index import IdIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "bought_together.npz"
+TOP_K = 20
+MIN_COUNT = 3
+CHUNK_SIZE = 1_000_000
+# Товаров в блоке строк при подсчете совместных покупок
+BLOCK_PRODUCTS = 1024
+
+
+@dataclass
+class BoughtTogetherIndex:
+    """Top-K партнеров каждого товара по PMI"""
+    matrix: csr_matrix
+    product_index: IdIndex
+    meta: Dict = field(default_factory=dict)
+
+    def _row(self, col: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.matrix.indptr[col], self.matrix.indptr[col + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def partners(self, product_id: int, n: int = 10) -> Tuple[List[int], List[float]]:
+        """Товары, которые чаще всего покупают вместе с product_id, и их PMI"""
+        col = self.product_index.get(product_id)
+        if col is None:
+            return [], []
+        cols, scores = self._row(col)
+        return self.product_index.ids[cols[:n]].tolist(), scores[:n].tolist()
+
+    def for_cart(self, product_ids: List[int], n: int = 10) -> Tuple[List[int], List[float]]:
+        """
+        Дополнение корзины: PMI партнеров товаров корзины суммируются,
+        товары самой корзины исключаются.
+        """
+        positions = self.product_index.positions(list(product_ids))
+        positions = np.unique(positions[positions >= 0])
+        if len(positions) == 0:
+            return [], []
+
+        rows = [self._row(col) for col in positions]
+        cols = np.concatenate([row[0] for row in rows])
+        candidates, inverse = np.unique(cols, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate([row[1] for row in rows]))
+        scores[np.isin(candidates, positions)] = -np.inf
+
+        top = np.argsort(-scores, kind="stable")[:n]
+        top = top[np.isfinite(scores[top])]
+        return self.product_index.ids[candidates[top]].tolist(), scores[top].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return (self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+                + self.product_index.nbytes)
+
+
+def _top_partners(counts, start: int, order_counts: np.ndarray, n_orders: int,
+                  top_k: int, min_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """PMI и top-K партнеров для блока строк совместных покупок (строки считаются от start)"""
+    coo = counts.tocoo()
+    rows, cols, values = coo.row + start, coo.col, coo.data
+    keep = (rows != cols) & (values >= min_count)
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+
+    pmi = np.log(values * float(n_orders) / (order_counts[rows] * order_counts[cols]))
+    positive = pmi > 0
+    rows, cols, pmi = rows[positive], cols[positive], pmi[positive]
+
+    order = np.lexsort((cols, -pmi, rows))
+    rows, cols, pmi = rows[order], cols[order], pmi[order]
+    starts = np.searchsorted(rows, rows, side="left")
+    keep = np.arange(len(rows)) - starts < top_k
+    return rows[keep], cols[keep], pmi[keep]
+
+
+def build_index(order_ids: np.ndarray, product_ids: np.ndarray, top_k: int = TOP_K,
+                min_count: int = MIN_COUNT) -> BoughtTogetherIndex:
+    """
+    Построение индекса по позициям заказов.
+
+    Args:
+        order_ids: Заказ каждой позиции
+        product_ids: Товар каждой позиции (повторы в заказе учитываются один раз)
+        top_k: Партнеров на товар
+        min_count: Минимум заказов с парой
+    """
+    started = time.perf_counter()
+    keys = np.unique((np.asarray(order_ids, dtype=np.int64) << 32) | np.asarray(product_ids, dtype=np.int64))
+    if len(keys) == 0:
+        raise ValueError("Нет заказов для индекса совместных покупок")
+    product_ids, cols = np.unique(keys & 0xFFFFFFFF, return_inverse=True)
+    _, rows = np.unique(keys >> 32, return_inverse=True)
+    n_orders = int(rows.max()) + 1
+
+    baskets = csr_matrix((np.ones(len(keys), dtype=np.float32), (rows, cols)),
+                         shape=(n_orders, len(product_ids)))
+    baskets_by_product = baskets.T.tocsr()
+    order_counts = np.diff(baskets_by_product.indptr).astype(np.float64)
+
+    parts = []
+    for start in range(0, len(product_ids), BLOCK_PRODUCTS):
+        block = baskets_by_product[start:start + BLOCK_PRODUCTS] @ baskets
+        parts.append(_top_partners(block, start, order_counts, n_orders, top_k, min_count))
+
+    rows = np.concatenate([part[0] for part in parts])
+    counts = np.bincount(rows, minlength=len(product_ids))
+    matrix = csr_matrix(
+        (np.concatenate([part[2] for part in parts]).astype(np.float32),
+         np.concatenate([part[1] for part in parts]).astype(np.int32),
+         np.concatenate([[0], np.cumsum(counts)])),
+        shape=(len(product_ids), len(product_ids))
+    )
+    meta = {
+        "orders": n_orders,
+        "products": len(product_ids),
+        "pairs": int(matrix.nnz),
+        "top_k": top_k,
+        "min_count": min_count,
+        "build_time": time.perf_counter() - started,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    logger.info(f"Индекс совместных покупок построен: {meta}")
+    return BoughtTogetherIndex(matrix, IdIndex(product_ids, dtype=np.int32), meta)
+
+
+def baskets_from_files(data_dir="data", chunk_size: int = CHUNK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """Позиции заказов из order_products__prior (колоночный кеш или CSV)"""
+    from database.columnar_cache import iter_table
+
+    order_ids, product_ids = [], []
+    for chunk in iter_table(data_dir, "order_products__prior", ["order_id", "product_id"], chunk_size):
+        order_ids.append(chunk["order_id"].to_numpy(dtype=np.int64))
+        product_ids.append(chunk["product_id"].to_numpy(dtype=np.int64))
+    if not order_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(order_ids), np.concatenate(product_ids)
+
+
+def baskets_from_db(session) -> Tuple[np.ndarray, np.ndarray]:
+    """Позиции заказов из таблицы orderitem рабочей БД"""
+    from sqlmodel import select
+    from models.order_item import OrderItem
+
+    rows = session.exec(select(OrderItem.order_id, OrderItem.product_id)).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.array(rows, dtype=np.int64)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def index_path(directory=None) -> Path:
+    """Файл индекса в директории артефактов"""
+    return Path(directory or get_settings().MODEL_ARTIFACT_DIR) / INDEX_FILE
+
+
+def save_index(path, index: BoughtTogetherIndex) -> Path:
+    """Сохранение индекса: запись во временный файл и переименование"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.parent / f".{path.name}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            data=index.matrix.data,
+            indices=index.matrix.indices,
+            indptr=index.matrix.indptr,
+            product_ids=index.product_index.ids,
+            meta=np.array(json.dumps(index.meta)),
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"Индекс совместных покупок сохранен: {path}")
+    return path
+
+
+def load_index(path) -> BoughtTogetherIndex:
+    """Загрузка индекса"""
+    with np.load(path, allow_pickle=False) as npz:
+        product_ids = npz["product_ids"]
+        matrix = csr_matrix((npz["data"], npz["indices"], npz["indptr"]),
+                            shape=(len(product_ids), len(product_ids)))
+        return BoughtTogetherIndex(matrix, IdIndex(product_ids, dtype=product_ids.dtype),
+                                   json.loads(str(npz["meta"])))
+
+
+# Загруженный индекс: путь -> (mtime файла, индекс)
+_loaded: Dict[str, Tuple[float, BoughtTogetherIndex]] = {}
+_loaded_lock = threading.Lock()
+
+
+def get_index(path=None) -> Optional[BoughtTogetherIndex]:
+    """Индекс в памяти процесса; None, если индекс еще не построен"""
+    path = Path(path) if path else index_path()
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+    with _loaded_lock:
+        cached = _loaded.get(str(path))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        index = load_index(path)
+        _loaded[str(path)] = (mtime, index)
+        return index
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    options = {}
+    for arg in list(sys.argv[1:]):
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+            sys.argv.remove(arg)
+
+    if options.get("source", "files") == "db":
+        from sqlmodel import Session
+        from database.database import engine
+
+        with Session(engine) as session:
+            order_ids, product_ids = baskets_from_db(session)
+    else:
+        order_ids, product_ids = baskets_from_files(sys.argv[1] if len(sys.argv) > 1 else "data")
+
+    index = build_index(
+        order_ids, product_ids,
+        top_k=int(options.get("top-k", TOP_K)),
+        min_count=int(options.get("min-count", MIN_COUNT)),
+    )
+    path = save_index(options.get("output") or index_path(), index)
+    meta = index.meta
+    print(f"✅ Индекс построен за {meta['build_time']:.1f}s: {meta['orders']:,} заказов, "
+          f"{meta['products']:,} товаров, {meta['pairs']:,} пар ({index.nbytes / 2 ** 20:.1f} MB)")
+    print(f"📦 Файл: {path}")
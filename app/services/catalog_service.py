@@ -0,0 +1,480 @@
+# app/services/catalog_service.py
+from sqlmodel import Session, select, func, delete
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import gzip
+import hashlib
+import threading
+import logging
+import time
+
+from models.product import Product
+from models.department import Department
+from models.aisle import Aisle
+from models.catalog import CatalogVersion, DepartmentAisle
+from database.config import get_settings
+from services import serialization
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedPayload:
+    """Сериализованный ответ каталога, привязанный к версии каталога"""
+    version: int
+    body: bytes
+    etag: str
+    gzip_body: Optional[bytes] = None
+
+    def gzipped(self) -> bytes:
+        """Сжатое тело ответа (считается один раз на версию)"""
+        if self.gzip_body is None:
+            self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        return self.gzip_body
+
+
+# Кеш количества товаров: ключ фильтра -> (количество, время записи)
+_count_cache: Dict[Tuple, Tuple[int, float]] = {}
+_count_lock = threading.Lock()
+
+# Кеш готовых ответов каталога: ключ эндпоинта -> сериализованный ответ
+_response_cache: Dict[str, CachedPayload] = {}
+_response_lock = threading.Lock()
+
+# Связь отдел -> проходы, загружается один раз на версию каталога
+_mapping_state = {"version": None, "mapping": None, "aisles": None}
+_mapping_lock = threading.Lock()
+
+# Последняя известная версия каталога и время её проверки
+_version_state = {"version": None, "checked_at": 0.0}
+_version_lock = threading.Lock()
+
+
+def clear_catalog_cache() -> None:
+    """Полная очистка in-process кешей каталога"""
+    with _count_lock:
+        _count_cache.clear()
+    with _response_lock:
+        _response_cache.clear()
+    with _mapping_lock:
+        _mapping_state["version"] = None
+        _mapping_state["mapping"] = None
+        _mapping_state["aisles"] = None
+    with _version_lock:
+        _version_state["version"] = None
+        _version_state["checked_at"] = 0.0
+
+
+def get_catalog_version(session: Session, force: bool = False) -> int:
+    """
+    Текущая версия каталога.
+
+    Версия читается из БД не чаще раза в CATALOG_VERSION_CHECK_INTERVAL секунд,
+    поэтому импорт из другого процесса виден с небольшой задержкой.
+    Пока таблицы catalog_version нет (БД до ее появления, прогрев еще
+    не создал таблицу), версия считается нулевой.
+    """
+    interval = get_settings().CATALOG_VERSION_CHECK_INTERVAL
+    now = time.monotonic()
+
+    with _version_lock:
+        if not force and _version_state["version"] is not None and now - _version_state["checked_at"] < interval:
+            return _version_state["version"]
+
+    try:
+        row = session.get(CatalogVersion, 1)
+        version = row.version if row else 0
+    except (OperationalError, ProgrammingError) as e:
+        # Ошибка прерывает транзакцию PostgreSQL, сессию нужно откатить
+        session.rollback()
+        logger.warning(f"Версия каталога недоступна, считаем 0: {e.orig}")
+        version = 0
+
+    with _version_lock:
+        _version_state["version"] = version
+        _version_state["checked_at"] = now
+
+    return version
+
+
+def bump_catalog_version(session: Session) -> int:
+    """
+    Увеличивает версию каталога после записи в каталог.
+
+    Returns:
+        int: Новая версия каталога
+    """
+    row = session.get(CatalogVersion, 1)
+    if row is None:
+        row = CatalogVersion(id=1, version=0)
+
+    row.version += 1
+    row.updated_at = datetime.utcnow()
+    session.add(row)
+    session.commit()
+
+    clear_catalog_cache()
+    with _version_lock:
+        _version_state["version"] = row.version
+        _version_state["checked_at"] = time.monotonic()
+
+    logger.info(f"Версия каталога увеличена до {row.version}")
+    return row.version
+
+
+def refresh_department_aisles(session: Session) -> int:
+    """
+    Пересчитывает материализованную связь отдел -> проход по таблице product.
+
+    Вызывается после загрузки каталога.
+
+    Returns:
+        int: Количество пар отдел-проход
+    """
+    session.exec(delete(DepartmentAisle))
+    session.exec(
+        insert(DepartmentAisle).from_select(
+            ["department_id", "aisle_id", "product_count"],
+            select(
+                Product.department_id,
+                Product.aisle_id,
+                func.count(Product.id)
+            ).where(
+                Product.is_active == True
+            ).group_by(
+                Product.department_id, Product.aisle_id
+            )
+        )
+    )
+    session.commit()
+
+    pairs = session.exec(select(func.count()).select_from(DepartmentAisle)).one()
+    logger.info(f"Связь отдел -> проход пересчитана: {pairs} пар")
+    return pairs
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match против ETag ответа"""
+    if not if_none_match:
+        return False
+
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class CatalogService:
+    """
+    Сервис чтения каталога товаров.
+
+    Отдает страницы каталога keyset-пагинацией по Product.id, кеширует
+    общее количество товаров для каждой комбинации фильтров и готовые
+    ответы справочников, привязанные к версии каталога.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.settings = get_settings()
+
+    @staticmethod
+    def _normalize_search(search: Optional[str]) -> Optional[str]:
+        """Строка поиска без пробелов по краям; пустая - без фильтра"""
+        search = search.strip() if search else None
+        return search or None
+
+    @staticmethod
+    def _filter_key(
+            search: Optional[str],
+            department_id: Optional[int],
+            aisle_id: Optional[int]
+    ) -> Tuple:
+        """Нормализованный ключ комбинации фильтров"""
+        return (
+            # ILIKE не различает регистр, поэтому регистр не различает и ключ
+            (CatalogService._normalize_search(search) or "").lower() or None,
+            department_id or None,
+            aisle_id or None
+        )
+
+    @staticmethod
+    def _apply_filters(query, search: Optional[str], department_id: Optional[int], aisle_id: Optional[int]):
+        """Применяет фильтры каталога к запросу"""
+        query = query.where(Product.is_active == True)
+
+        # Поиск по названию (ключ кеша количества строится по той же строке)
+        search = CatalogService._normalize_search(search)
+        if search:
+            query = query.where(Product.name.ilike(f"%{search}%"))
+
+        # Фильтр по отделу
+        if department_id:
+            query = query.where(Product.department_id == department_id)
+
+        # Фильтр по проходу
+        if aisle_id:
+            query = query.where(Product.aisle_id == aisle_id)
+
+        return query
+
+    def _product_query(self):
+        """Запрос товаров с названиями прохода и отдела"""
+        return select(
+            Product.id,
+            Product.name,
+            Product.aisle_id,
+            Product.department_id,
+            Aisle.name.label("aisle_name"),
+            Department.name.label("department_name")
+        ).join(
+            Aisle, Product.aisle_id == Aisle.id
+        ).join(
+            Department, Product.department_id == Department.id
+        )
+
+    def products_by_ids(self, product_ids: List[int]) -> list:
+        """Активные товары с названиями прохода и отдела в порядке product_ids"""
+        if not product_ids:
+            return []
+        rows = self.session.exec(
+            self._product_query().where(Product.id.in_(product_ids), Product.is_active == True)
+        ).all()
+        by_id = {row.id: row for row in rows}
+        return [by_id[product_id] for product_id in product_ids if product_id in by_id]
+
+    def list_products(
+            self,
+            search: Optional[str] = None,
+            department_id: Optional[int] = None,
+            aisle_id: Optional[int] = None,
+            cursor: Optional[int] = None,
+            skip: int = 0,
+            limit: int = 20
+    ) -> Tuple[list, Optional[int]]:
+        """
+        Получение страницы каталога.
+
+        Args:
+            cursor: ID последнего товара предыдущей страницы (keyset-пагинация)
+            skip: Смещение для старых клиентов, используется только без cursor
+            limit: Размер страницы
+
+        Returns:
+            Tuple[list, Optional[int]]: Строки страницы и курсор следующей страницы
+        """
+        query = self._apply_filters(self._product_query(), search, department_id, aisle_id)
+
+        # Keyset-пагинация: стоимость не зависит от глубины страницы
+        if cursor is not None:
+            query = query.where(Product.id > cursor)
+        elif skip:
+            query = query.offset(skip)
+
+        query = query.order_by(Product.id).limit(limit)
+        results = self.session.exec(query).all()
+
+        next_cursor = results[-1].id if len(results) == limit else None
+        return results, next_cursor
+
+    def count_products(
+            self,
+            search: Optional[str] = None,
+            department_id: Optional[int] = None,
+            aisle_id: Optional[int] = None
+    ) -> int:
+        """Количество товаров для комбинации фильтров с кешированием"""
+        version = get_catalog_version(self.session)
+        key = (version,) + self._filter_key(search, department_id, aisle_id)
+        ttl = self.settings.CATALOG_COUNT_CACHE_TTL
+        now = time.monotonic()
+
+        with _count_lock:
+            cached = _count_cache.get(key)
+        if cached and now - cached[1] < ttl:
+            return cached[0]
+
+        query = select(func.count(Product.id)).join(
+            Aisle, Product.aisle_id == Aisle.id
+        ).join(
+            Department, Product.department_id == Department.id
+        )
+        query = self._apply_filters(query, search, department_id, aisle_id)
+        total = self.session.exec(query).one() or 0
+
+        with _count_lock:
+            # Ограничиваем размер кеша: поисковые запросы почти не повторяются
+            if len(_count_cache) >= self.settings.CATALOG_COUNT_CACHE_SIZE:
+                _count_cache.clear()
+            _count_cache[key] = (total, now)
+
+        return total
+
+    def _cached(self, key: str, builder: Callable[[], object]) -> Optional[CachedPayload]:
+        """
+        Возвращает сериализованный ответ из кеша или строит его заново.
+
+        Builder возвращает данные для JSON или None, если ответа нет
+        (None не кешируется).
+        """
+        version = get_catalog_version(self.session)
+
+        with _response_lock:
+            entry = _response_cache.get(key)
+        if entry is not None and entry.version == version:
+            return entry
+
+        data = builder()
+        if data is None:
+            return None
+
+        body = serialization.json_bytes(data)
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        entry = CachedPayload(version=version, body=body, etag=f'"{version}-{digest}"')
+
+        with _response_lock:
+            if len(_response_cache) >= self.settings.CATALOG_RESPONSE_CACHE_SIZE:
+                _response_cache.clear()
+            _response_cache[key] = entry
+
+        return entry
+
+    def get_departments(self) -> CachedPayload:
+        """Список отделов"""
+
+        def build():
+            departments = self.session.exec(select(Department).order_by(Department.id)).all()
+            return [{"id": d.id, "name": d.name} for d in departments]
+
+        return self._cached("departments", build)
+
+    def department_aisles(self) -> Tuple[Dict[int, List[Tuple[int, int]]], Dict[int, str]]:
+        """
+        Связь отдел -> [(aisle_id, product_count)] и названия проходов.
+
+        Загружается в память один раз на версию каталога. Если таблица
+        department_aisle пуста (каталог загружен не через импорт),
+        связь однократно вычисляется по таблице product.
+        """
+        version = get_catalog_version(self.session)
+
+        with _mapping_lock:
+            if _mapping_state["version"] == version:
+                return _mapping_state["mapping"], _mapping_state["aisles"]
+
+        rows = self.session.exec(
+            select(DepartmentAisle.department_id, DepartmentAisle.aisle_id, DepartmentAisle.product_count)
+        ).all()
+
+        if not rows:
+            logger.warning("Таблица department_aisle пуста, вычисляем связь по товарам")
+            rows = self.session.exec(
+                select(Product.department_id, Product.aisle_id, func.count(Product.id))
+                .where(Product.is_active == True)
+                .group_by(Product.department_id, Product.aisle_id)
+            ).all()
+
+        mapping: Dict[int, List[Tuple[int, int]]] = {}
+        for department_id, aisle_id, product_count in rows:
+            mapping.setdefault(department_id, []).append((aisle_id, product_count))
+        for aisles in mapping.values():
+            aisles.sort()
+
+        aisle_names = {a.id: a.name for a in self.session.exec(select(Aisle)).all()}
+
+        with _mapping_lock:
+            _mapping_state["version"] = version
+            _mapping_state["mapping"] = mapping
+            _mapping_state["aisles"] = aisle_names
+
+        return mapping, aisle_names
+
+    def get_aisles(self, department_id: Optional[int] = None) -> CachedPayload:
+        """Список проходов (опционально по отделу)"""
+
+        def build():
+            if department_id:
+                mapping, aisle_names = self.department_aisles()
+                return [
+                    {"id": aisle_id, "name": aisle_names.get(aisle_id), "product_count": product_count}
+                    for aisle_id, product_count in mapping.get(department_id, [])
+                ]
+
+            aisles = self.session.exec(select(Aisle).order_by(Aisle.id)).all()
+            return [{"id": a.id, "name": a.name} for a in aisles]
+
+        return self._cached(f"aisles:{department_id or ''}", build)
+
+    def get_department_tree(self) -> CachedPayload:
+        """Дерево категорий: отделы с проходами и количеством товаров"""
+
+        def build():
+            mapping, aisle_names = self.department_aisles()
+            departments = self.session.exec(select(Department).order_by(Department.id)).all()
+
+            return [
+                {
+                    "id": d.id,
+                    "name": d.name,
+                    "product_count": sum(count for _, count in mapping.get(d.id, [])),
+                    "aisles": [
+                        {"id": aisle_id, "name": aisle_names.get(aisle_id), "product_count": count}
+                        for aisle_id, count in mapping.get(d.id, [])
+                    ]
+                }
+                for d in departments
+            ]
+
+        return self._cached("departments:tree", build)
+
+    def get_product(self, product_id: int) -> Optional[CachedPayload]:
+        """Карточка товара или None, если товар не найден"""
+
+        def build():
+            result = self.session.exec(
+                self._product_query().where(
+                    Product.id == product_id,
+                    Product.is_active == True
+                )
+            ).first()
+
+            if not result:
+                return None
+
+            return {
+                "id": result.id,
+                "name": result.name,
+                "aisle_id": result.aisle_id,
+                "department_id": result.department_id,
+                "aisle_name": result.aisle_name,
+                "department_name": result.department_name,
+                "times_ordered": 0
+            }
+
+        return self._cached(f"product:{product_id}", build)
+
+    def get_snapshot(self) -> CachedPayload:
+        """
+        Полный снимок каталога для локального кеширования на клиенте.
+
+        Товары передаются компактными строками [id, name, aisle_id, department_id].
+        """
+
+        def build():
+            departments = self.session.exec(select(Department).order_by(Department.id)).all()
+            aisles = self.session.exec(select(Aisle).order_by(Aisle.id)).all()
+            products = self.session.exec(
+                select(Product.id, Product.name, Product.aisle_id, Product.department_id)
+                .where(Product.is_active == True)
+                .order_by(Product.id)
+            ).all()
+
+            return {
+                "version": get_catalog_version(self.session),
+                "departments": [{"id": d.id, "name": d.name} for d in departments],
+                "aisles": [{"id": a.id, "name": a.name} for a in aisles],
+                "product_fields": ["id", "name", "aisle_id", "department_id"],
+                "products": [[p.id, p.name, p.aisle_id, p.department_id] for p in products]
+            }
+
+        return self._cached("snapshot", build)
@@ -0,0 +1,320 @@
+# app/services/evaluation.py
+"""
+Офлайн оценка рекомендаций: Precision@K, Recall@K и HitRate@K.
+
+Постановка та же, что в ноутбуках уроков 4-5: модель строится по prior
+заказам, истина - товары train заказа пользователя (его последний заказ).
+Все тестовые пользователи оцениваются пакетным движком
+RecommendationService.generate_recommendations_batch, а метрики считаются
+векторно: предсказания и истина пакета - разреженные матрицы, число
+попаданий - суммы по строкам их поэлементного произведения. Пакеты
+распределяются по пулу процессов, каждый процесс обучает модель один раз.
+
+С порогами прореживания (--min-product-buyers и др.) модель обучается на
+прореженной матрице; --prune-sweep оценивает набор порогов PRUNING_PRESETS
+и печатает размер модели, скорость и качество для каждого.
+
+Запуск:
+    python -m services.evaluation [data_dir] [--k=10] [--max-users=N] [--sample=N]
+        [--workers=N] [--batch-size=N] [--k-neighbors=30]
+        [--min-product-buyers=N] [--min-user-items=N] [--max-user-items=N]
+        [--max-product-share=X] [--prune-sweep]
+"""
+import os
+import sys
+import time
+import logging
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from scipy.sparse import csr_matrix
+
+# Добавляем путь к проекту
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.columnar_cache import read_table
+from services.offline_trainer import build_user_product_matrix, CHUNK_SIZE
+from services.pruning import PruningConfig, prune_interactions
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 128
+
+# Пороги для --prune-sweep: от полной матрицы к все более агрессивным
+PRUNING_PRESETS = [
+    PruningConfig(),
+    PruningConfig(min_product_buyers=2),
+    PruningConfig(min_product_buyers=3, min_user_items=3),
+    PruningConfig(min_product_buyers=5, min_user_items=5, max_user_items=300),
+    PruningConfig(min_product_buyers=10, min_user_items=5, max_user_items=200, max_product_share=0.2),
+]
+
+
+@dataclass
+class EvaluationSplit:
+    """Матрица prior покупок и истина для тестовых пользователей"""
+    matrix: csr_matrix
+    user_ids: np.ndarray
+    product_ids: np.ndarray
+    test_user_ids: np.ndarray
+    # Истина по столбцам product_ids; товары вне модели не попадают в матрицу,
+    # но учитываются в actual_sizes, как в ноутбуке
+    truth: csr_matrix
+    actual_sizes: np.ndarray
+
+
+def build_split(data_dir="data", max_users: Optional[int] = None,
+                chunk_size: int = CHUNK_SIZE) -> EvaluationSplit:
+    """Prior матрица из offline_trainer и train заказы как истина"""
+    matrix, user_ids, product_ids = build_user_product_matrix(data_dir, max_users, chunk_size)
+
+    orders = read_table(data_dir, "orders", ["order_id", "user_id", "eval_set"])
+    if max_users:
+        # Тот же отбор пользователей, что и в offline_trainer
+        users = orders["user_id"].unique()[:max_users]
+        orders = orders[orders["user_id"].isin(users)]
+    train_orders = orders[orders["eval_set"] == "train"]
+
+    items = read_table(data_dir, "order_products__train", ["order_id", "product_id"])
+    items = items.merge(train_orders[["order_id", "user_id"]], on="order_id")
+    items = items.drop_duplicates(["user_id", "product_id"])
+    if items.empty:
+        raise ValueError("Нет train заказов для оценки")
+
+    item_users = items["user_id"].to_numpy().astype(np.int64)
+    item_products = items["product_id"].to_numpy().astype(np.int64)
+    test_user_ids = np.unique(item_users)
+    rows = np.searchsorted(test_user_ids, item_users)
+    actual_sizes = np.bincount(rows, minlength=len(test_user_ids))
+
+    cols = np.searchsorted(product_ids, item_products)
+    known = (cols < len(product_ids)) & (product_ids[np.minimum(cols, len(product_ids) - 1)] == item_products)
+    truth = csr_matrix(
+        (np.ones(int(known.sum()), dtype=np.float32), (rows[known], cols[known])),
+        shape=(len(test_user_ids), len(product_ids))
+    )
+    return EvaluationSplit(matrix, user_ids, product_ids, test_user_ids, truth, actual_sizes)
+
+
+def prediction_matrix(predicted: List[List[int]], product_ids: np.ndarray) -> csr_matrix:
+    """Списки рекомендованных id товаров -> бинарная матрица по столбцам product_ids"""
+    rows = np.repeat(np.arange(len(predicted)), [len(items) for items in predicted])
+    flat = np.fromiter((item for items in predicted for item in items), dtype=np.int64, count=len(rows))
+    cols = np.searchsorted(product_ids, flat)
+    known = (cols < len(product_ids)) & (product_ids[np.minimum(cols, len(product_ids) - 1)] == flat)
+    return csr_matrix(
+        (np.ones(int(known.sum()), dtype=np.float32), (rows[known], cols[known])),
+        shape=(len(predicted), len(product_ids))
+    )
+
+
+def hit_counts(predicted: csr_matrix, truth: csr_matrix) -> np.ndarray:
+    """Число попаданий в истину по строкам"""
+    return np.asarray(predicted.multiply(truth).sum(axis=1)).ravel()
+
+
+def metrics_from_hits(hits: np.ndarray, actual_sizes: np.ndarray, k: int) -> Dict[str, float]:
+    """Средние Precision@K, Recall@K и HitRate@K по пользователям"""
+    if len(hits) == 0:
+        return {f"precision@{k}": 0.0, f"recall@{k}": 0.0, f"hit_rate@{k}": 0.0}
+    recall = np.divide(hits, actual_sizes, out=np.zeros(len(hits)), where=actual_sizes > 0)
+    return {
+        f"precision@{k}": float(np.mean(hits / k)),
+        f"recall@{k}": float(np.mean(recall)),
+        f"hit_rate@{k}": float(np.mean(hits > 0)),
+    }
+
+
+# Модель процесса пула: обучается один раз в initializer
+_worker_service = None
+_worker_product_ids = None
+
+
+def _init_worker(matrix: csr_matrix, user_ids: np.ndarray, product_ids: np.ndarray,
+                 pruning: Optional[PruningConfig] = None) -> None:
+    global _worker_service, _worker_product_ids
+    from services.recommendation_service import RecommendationService
+
+    # Логи сервиса на каждого пользователя не нужны в оценке
+    logging.getLogger("services.recommendation_service").setLevel(logging.WARNING)
+
+    service = RecommendationService(session=None)
+    service.redis = None
+    # Прореживание только явное, настройки окружения на оценку не влияют
+    service.pruning = pruning or PruningConfig()
+    # Пакетный скоринг считает соседей сам, граф в каждом процессе не нужен
+    service.knn_k = 0
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.train_model()
+    _worker_service = service
+    _worker_product_ids = product_ids
+
+
+def _score_batch(user_ids: np.ndarray, truth: csr_matrix, k: int, k_neighbors: int) -> Tuple[np.ndarray, float]:
+    """Рекомендации пакета и попадания; возвращает (попадания, секунды скоринга)"""
+    started = time.perf_counter()
+    results = _worker_service.generate_recommendations_batch(
+        user_ids.tolist(), k_neighbors=k_neighbors, n_recommendations=k
+    )
+    elapsed = time.perf_counter() - started
+
+    predicted = prediction_matrix([results[user_id][0] for user_id in user_ids.tolist()], _worker_product_ids)
+    return hit_counts(predicted, truth), elapsed
+
+
+def evaluate(split: EvaluationSplit, k: int = 10, k_neighbors: int = 30, workers: Optional[int] = None,
+             batch_size: int = BATCH_SIZE, sample: Optional[int] = None, seed: int = 42,
+             pruning: Optional[PruningConfig] = None) -> Dict:
+    """
+    Оценка TF-IDF модели и baseline популярных товаров.
+
+    Args:
+        split: Данные из build_split
+        k: Длина списка рекомендаций
+        k_neighbors: Число соседей TF-IDF модели
+        workers: Процессов в пуле (0 или 1 - в текущем процессе, None - по числу ядер)
+        batch_size: Пользователей в пакете скоринга
+        sample: Случайная выборка тестовых пользователей
+        pruning: Пороги прореживания матрицы модели
+
+    Returns:
+        Dict: Метрики качества, охват, размер модели и пропускная способность
+    """
+    rows = np.arange(len(split.test_user_ids))
+    if sample and sample < len(rows):
+        rows = np.sort(np.random.default_rng(seed).choice(rows, size=sample, replace=False))
+    test_user_ids = split.test_user_ids[rows]
+    truth = split.truth[rows]
+    actual_sizes = split.actual_sizes[rows]
+
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    batches = [(start, min(start + batch_size, len(rows))) for start in range(0, len(rows), batch_size)]
+    args = (split.matrix, split.user_ids, split.product_ids, pruning)
+
+    # Пользователи и размер модели после прореживания (воркеры прореживают сами)
+    model_user_ids = split.user_ids
+    pruning_report = None
+    if pruning is not None and pruning.active:
+        pruned = prune_interactions(split.matrix, split.user_ids, split.product_ids, pruning)
+        model_user_ids, pruning_report = pruned.user_ids, pruned.report
+
+    started = time.perf_counter()
+    hits = np.zeros(len(rows))
+    scoring_seconds = 0.0
+    if workers <= 1:
+        _init_worker(*args)
+        train_seconds = time.perf_counter() - started
+        for start, end in batches:
+            batch_hits, elapsed = _score_batch(test_user_ids[start:end], truth[start:end], k, k_neighbors)
+            hits[start:end] = batch_hits
+            scoring_seconds += elapsed
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=args) as pool:
+            futures = [
+                pool.submit(_score_batch, test_user_ids[start:end], truth[start:end], k, k_neighbors)
+                for start, end in batches
+            ]
+            # Обучение идет в initializer каждого процесса, отдельно его не замерить
+            train_seconds = None
+            for (start, end), future in zip(batches, futures):
+                batch_hits, elapsed = future.result()
+                hits[start:end] = batch_hits
+                scoring_seconds += elapsed
+    wall_seconds = time.perf_counter() - started
+
+    # Baseline: одни и те же популярные по prior товары для всех
+    frequency = np.asarray(split.matrix.sum(axis=0)).ravel()
+    popular_cols = np.argsort(-frequency, kind="stable")[:k]
+    baseline_hits = np.asarray(truth[:, popular_cols].sum(axis=1)).ravel()
+
+    known_users = np.isin(test_user_ids, model_user_ids)
+    return {
+        "users": len(rows),
+        "k": k,
+        "tfidf": metrics_from_hits(hits, actual_sizes, k),
+        "baseline": metrics_from_hits(baseline_hits, actual_sizes, k),
+        "coverage": float(known_users.mean()) if len(rows) else 0.0,
+        "pruning": pruning_report,
+        "throughput": {
+            "workers": max(1, workers),
+            "batch_size": batch_size,
+            "wall_seconds": wall_seconds,
+            "train_seconds": train_seconds,
+            "scoring_seconds": scoring_seconds,
+            "users_per_second": len(rows) / wall_seconds if wall_seconds > 0 else 0.0,
+            "scoring_users_per_second": len(rows) / scoring_seconds if scoring_seconds > 0 else 0.0,
+        },
+    }
+
+
+def _print_report(result: Dict) -> None:
+    k = result["k"]
+    if result["pruning"]:
+        before, after = result["pruning"]["before"], result["pruning"]["after"]
+        print(f"✂️  Прореживание: {before['interactions']:,} -> {after['interactions']:,} позиций, "
+              f"{before['products']:,} -> {after['products']:,} товаров, {before['mb']} -> {after['mb']} МБ")
+    print(f"📊 Оценка на {result['users']:,} пользователях, охват модели {result['coverage']:.0%}")
+    print(f"   {'Метрика':<14} {'Baseline':>10} {'TF-IDF':>10} {'Изменение':>10}")
+    for metric in [f"precision@{k}", f"recall@{k}", f"hit_rate@{k}"]:
+        base, model = result["baseline"][metric], result["tfidf"][metric]
+        change = f"{(model / base - 1) * 100:+.1f}%" if base > 0 else "-"
+        print(f"   {metric:<14} {base:>10.4f} {model:>10.4f} {change:>10}")
+
+    throughput = result["throughput"]
+    print(f"⚡ {throughput['users_per_second']:.0f} польз./с всего, "
+          f"{throughput['scoring_users_per_second']:.0f} польз./с на скоринг "
+          f"({throughput['workers']} процессов, пакет {throughput['batch_size']}, "
+          f"{throughput['wall_seconds']:.1f}s)")
+
+
+def _print_sweep(results: List[Tuple[PruningConfig, Dict]]) -> None:
+    """Таблица компромисса размер/скорость/качество по порогам прореживания"""
+    k = results[0][1]["k"]
+    print(f"\n✂️  Прореживание матрицы модели")
+    print(f"   {'Пороги':<52} {'Позиций':>10} {'МБ':>7} {'Польз./с':>9} "
+          f"{f'recall@{k}':>10} {f'hit@{k}':>8} {'Охват':>6}")
+    for config, result in results:
+        size = (result["pruning"] or {}).get("after") or {}
+        interactions = f"{size['interactions']:,}" if size else "все"
+        mb = f"{size['mb']:.1f}" if size else "-"
+        print(f"   {config.describe():<52} {interactions:>10} {mb:>7} "
+              f"{result['throughput']['scoring_users_per_second']:>9.0f} "
+              f"{result['tfidf'][f'recall@{k}']:>10.4f} {result['tfidf'][f'hit_rate@{k}']:>8.4f} "
+              f"{result['coverage']:>6.0%}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    options = {}
+    for arg in list(sys.argv[1:]):
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+            sys.argv.remove(arg)
+    prune_sweep = "--prune-sweep" in sys.argv
+    if prune_sweep:
+        sys.argv.remove("--prune-sweep")
+
+    split_started = time.time()
+    split = build_split(
+        data_dir=sys.argv[1] if len(sys.argv) > 1 else "data",
+        max_users=int(options["max-users"]) if "max-users" in options else None,
+    )
+    print(f"✅ Данные подготовлены за {time.time() - split_started:.1f}s: "
+          f"{len(split.user_ids):,} пользователей в модели, {len(split.test_user_ids):,} тестовых")
+
+    evaluate_options = dict(
+        k=int(options.get("k", 10)),
+        k_neighbors=int(options.get("k-neighbors", 30)),
+        workers=int(options["workers"]) if "workers" in options else None,
+        batch_size=int(options.get("batch-size", BATCH_SIZE)),
+        sample=int(options["sample"]) if "sample" in options else None,
+    )
+    if prune_sweep:
+        _print_sweep([(config, evaluate(split, pruning=config, **evaluate_options)) for config in PRUNING_PRESETS])
+    else:
+        result = evaluate(split, pruning=PruningConfig.from_options(options), **evaluate_options)
+        _print_report(result)
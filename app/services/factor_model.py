@@ -0,0 +1,181 @@
+# app/services/factor_model.py
+"""
+Матричная факторизация для персональных рекомендаций.
+
+Усеченное SVD нормированной TF-IDF матрицы: X ≈ U S Vᵀ. Факторы товаров -
+V (товары x ранг), факторы пользователей - X V = U S. Оценки всех товаров
+для пользователя - одно плотное произведение V u, топ-N выбирается через
+argpartition, поэтому время ответа не зависит от длины истории покупок.
+Пользователи вне обучающей выборки проецируются тем же способом (fold-in):
+u = x V, где x - нормированный TF-IDF вектор их покупок.
+
+Факторы хранятся в float32 .npy файлах рядом с артефактами модели и
+открываются через mmap, так что процессы API и воркеров делят одни и те же
+страницы в page cache вместо копии в памяти каждого процесса.
+"""
+import os
+import json
+import shutil
+import logging
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import randomized_svd
+
+from services.id_index import IdIndex
+
+logger = logging.getLogger(__name__)
+
+FACTORS_PREFIX = "factors"
+DEFAULT_RANK = 64
+_ARRAYS = ("user_factors", "item_factors", "idf", "user_ids", "product_ids")
+
+
+@dataclass
+class FactorModel:
+    """Факторы пользователей и товаров и IDF для fold-in"""
+    user_factors: np.ndarray
+    item_factors: np.ndarray
+    idf: np.ndarray
+    user_ids: np.ndarray
+    product_ids: np.ndarray
+    meta: Dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        # Поиск по массивам id: отсортированные id (и открытые через mmap) не копируются
+        self.user_index = IdIndex(self.user_ids, dtype=self.user_ids.dtype)
+        self.product_index = IdIndex(self.product_ids, dtype=self.product_ids.dtype)
+
+    @property
+    def rank(self) -> int:
+        return self.item_factors.shape[1]
+
+    @property
+    def n_items(self) -> int:
+        return self.item_factors.shape[0]
+
+    def user_vector(self, user_id: int) -> Optional[np.ndarray]:
+        """Фактор пользователя из обучающей выборки или None"""
+        row = self.user_index.get(user_id)
+        return None if row is None else self.user_factors[row]
+
+    def fold_in(self, tf_idf_row) -> np.ndarray:
+        """Проекция TF-IDF вектора (1 x n_items) в пространство факторов"""
+        row = normalize(csr_matrix(tf_idf_row, dtype=np.float32), norm="l2", axis=1)
+        return np.asarray(row @ self.item_factors, dtype=np.float32).ravel()
+
+    def fold_in_products(self, product_ids: Iterable[int], quantities: Optional[Iterable[float]] = None) -> np.ndarray:
+        """
+        Fold-in по списку покупок: TF-IDF вектор строится так же, как при обучении
+        (sqrt количества, умноженный на IDF). Товары вне модели пропускаются.
+        """
+        positions = self.product_index.positions(list(product_ids))
+        quantities = (np.ones(len(positions)) if quantities is None
+                      else np.asarray(list(quantities), dtype=np.float64))
+        known = positions >= 0
+        if not known.any():
+            return np.zeros(self.rank, dtype=np.float32)
+
+        # Количества повторяющихся товаров складываются
+        cols, inverse = np.unique(positions[known], return_inverse=True)
+        values = np.sqrt(np.bincount(inverse, weights=quantities[known])) * self.idf[cols]
+        row = csr_matrix((values, (np.zeros(len(cols), dtype=np.int64), cols)), shape=(1, self.n_items))
+        return self.fold_in(row)
+
+    def recommend(self, vector: np.ndarray, n: int = 10,
+                  exclude_cols: Optional[Iterable[int]] = None) -> Tuple[List[int], List[float]]:
+        """
+        Топ-N товаров по оценке V u.
+
+        Returns:
+            Tuple: id товаров и оценки, обрезанные в [0, 1]
+        """
+        scores = self.item_factors @ np.asarray(vector, dtype=np.float32)
+        if exclude_cols is not None:
+            scores[np.fromiter(exclude_cols, dtype=np.int64)] = -np.inf
+
+        n = min(n, self.n_items)
+        if n <= 0:
+            return [], []
+        top = np.argpartition(scores, -n)[-n:]
+        top = top[np.argsort(scores[top])[::-1]]
+        top = top[np.isfinite(scores[top])]
+        return (
+            self.product_ids[top].tolist(),
+            np.clip(scores[top], 0.0, 1.0).astype(float).tolist()
+        )
+
+
+def fit(tf_idf_matrix, idf: np.ndarray, user_ids: np.ndarray, product_ids: np.ndarray,
+        rank: int = DEFAULT_RANK, n_iter: int = 5, seed: int = 42) -> FactorModel:
+    """
+    Обучение факторов усеченным SVD TF-IDF матрицы.
+
+    Строки нормируются по L2, как в косинусном сходстве TF-IDF модели,
+    чтобы тяжелые пользователи не доминировали в разложении.
+
+    Args:
+        tf_idf_matrix: TF-IDF матрица (строки - user_ids, столбцы - product_ids)
+        idf: IDF товаров по столбцам, нужен для fold-in новых пользователей
+        rank: Число факторов (ограничивается размерами матрицы)
+        n_iter: Итераций степенного метода randomized SVD
+    """
+    normalized = normalize(csr_matrix(tf_idf_matrix, dtype=np.float32), norm="l2", axis=1)
+    rank = max(1, min(rank, min(normalized.shape) - 1))
+
+    _, singular_values, vt = randomized_svd(normalized, n_components=rank, n_iter=n_iter, random_state=seed)
+    item_factors = np.ascontiguousarray(vt.T, dtype=np.float32)
+    user_factors = np.ascontiguousarray(normalized @ item_factors, dtype=np.float32)
+
+    explained = float((singular_values ** 2).sum() / normalized.multiply(normalized).sum()) if normalized.nnz else 0.0
+    return FactorModel(
+        user_factors=user_factors,
+        item_factors=item_factors,
+        idf=np.asarray(idf, dtype=np.float32),
+        user_ids=np.asarray(user_ids, dtype=np.int64),
+        product_ids=np.asarray(product_ids, dtype=np.int64),
+        meta={"rank": rank, "n_iter": n_iter, "explained_variance": explained},
+    )
+
+
+def factors_path(directory, version: str, rank: int) -> Path:
+    """Директория факторов для версии артефакта и ранга"""
+    return Path(directory) / f"{FACTORS_PREFIX}_{version}_r{rank}"
+
+
+def save_factors(path, model: FactorModel) -> Path:
+    """
+    Сохранение факторов в директорию .npy файлов.
+
+    Файлы пишутся во временную директорию и переименовываются, чтобы
+    соседний процесс не открыл частично записанные факторы.
+    """
+    path = Path(path)
+    tmp_path = path.parent / f".{path.name}.tmp"
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    for name in _ARRAYS:
+        np.save(tmp_path / f"{name}.npy", np.ascontiguousarray(getattr(model, name)))
+    meta = dict(model.meta, created_at=datetime.utcnow().isoformat())
+    (tmp_path / "meta.json").write_text(json.dumps(meta))
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    logger.info(f"Факторы модели сохранены: {path}")
+    return path
+
+
+def load_factors(path, mmap: bool = True) -> FactorModel:
+    """Загрузка факторов; с mmap массивы отображаются в память только для чтения"""
+    path = Path(path)
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode=mmap_mode) for name in _ARRAYS}
+    meta = json.loads((path / "meta.json").read_text())
+    return FactorModel(meta=meta, **arrays)
@@ -0,0 +1,74 @@
+# app/services/id_index.py
+"""
+Компактное отображение внешних id в позиции строк и столбцов матрицы.
+
+Вместо пары словарей (позиция -> id и id -> позиция), где на каждый id
+приходится несколько Python объектов, хранится массив id по позициям и,
+если он не отсортирован, перестановка для np.searchsorted.
+"""
+import numpy as np
+from typing import Iterable, Optional
+
+
+class IdIndex:
+    """Массив id по позициям с поиском позиции через searchsorted"""
+
+    def __init__(self, ids: Iterable[int] = (), dtype=np.int64):
+        self.ids = np.asarray(ids if isinstance(ids, np.ndarray) else list(ids), dtype=dtype)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        # Артефакты и np.unique дают отсортированные id - перестановка не нужна
+        if len(self.ids) < 2 or bool(np.all(self.ids[1:] > self.ids[:-1])):
+            self._order = None
+            self._sorted = self.ids
+        else:
+            self._order = np.argsort(self.ids, kind="stable").astype(np.int32)
+            self._sorted = self.ids[self._order]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def positions(self, ids) -> np.ndarray:
+        """Позиции id (векторно), -1 для отсутствующих"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        found = np.minimum(np.searchsorted(self._sorted, ids), len(self.ids) - 1)
+        hit = self._sorted[found] == ids
+        positions = found if self._order is None else self._order[found]
+        return np.where(hit, positions, -1).astype(np.int64)
+
+    def get(self, id_: int, default: Optional[int] = None) -> Optional[int]:
+        position = int(self.positions([id_])[0])
+        return default if position < 0 else position
+
+    def __contains__(self, id_) -> bool:
+        return self.get(id_) is not None
+
+    def __getitem__(self, id_: int) -> int:
+        position = self.get(id_)
+        if position is None:
+            raise KeyError(id_)
+        return position
+
+    def extend(self, ids) -> np.ndarray:
+        """
+        Добавление новых id в конец (существующие позиции не меняются).
+
+        Returns:
+            np.ndarray: Позиции всех переданных id после добавления
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        missing = ids[self.positions(ids) < 0]
+        if len(missing):
+            # Порядок первого появления, как при поочередном добавлении
+            _, first = np.unique(missing, return_index=True)
+            self.ids = np.concatenate([self.ids, missing[np.sort(first)].astype(self.ids.dtype)])
+            self._reindex()
+        return self.positions(ids)
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self._order is None else self._order.nbytes + self._sorted.nbytes
+        return self.ids.nbytes + extra
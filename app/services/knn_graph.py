@@ -0,0 +1,195 @@
+# app/services/knn_graph.py
+"""
+Предрасчитанный граф соседей user-user kNN.
+
+Для каждого пользователя хранится до K соседей с наибольшим положительным
+косинусным сходством нормированных TF-IDF строк: CSR матрица
+пользователи x пользователи, в строке - соседи по убыванию сходства.
+Онлайн запрос читает строку графа за O(K) вместо сходства со всеми
+пользователями.
+
+Граф строится пакетами строк (плотный блок сходств ограничен по памяти)
+и сохраняется рядом с артефактом модели (knn_<версия>_k<K>.npz).
+После refresh_users пересчитываются только строки измененных и новых
+пользователей и строки, где они были соседями; остальным строкам
+добавляются сходства с измененными пользователями. IDF при этом не
+пересчитывается по всему графу: сходства остальных пар соответствуют IDF
+последнего полного построения.
+"""
+import os
+import json
+import logging
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+GRAPH_PREFIX = "knn"
+# Элементов плотного блока сходств при построении: float32 блок, его копия
+# и int64 индексы argpartition дают пик около 64 МБ
+BLOCK_ELEMENTS = 4_000_000
+
+
+def _top_k_block(similarities: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Top-K положительных сходств строк блока: (число соседей по строкам, столбцы, сходства)"""
+    k = min(k, similarities.shape[1])
+    if k == 0:
+        return (np.zeros(similarities.shape[0], dtype=np.int64), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.float32))
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    sims = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-sims, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    sims = np.take_along_axis(sims, order, axis=1)
+    positive = sims > 0
+    return positive.sum(axis=1), top[positive], sims[positive].astype(np.float32)
+
+
+def _top_k_entries(rows: np.ndarray, cols: np.ndarray, sims: np.ndarray, n_rows: int,
+                   n_cols: int, k: int) -> csr_matrix:
+    """CSR граф из произвольных пар (строка, столбец, сходство): top-K по строке"""
+    order = np.lexsort((-sims, rows))
+    rows, cols, sims = rows[order], cols[order], sims[order]
+    starts = np.searchsorted(rows, np.arange(n_rows))
+    rank = np.arange(len(rows)) - starts[rows]
+    keep = rank < k
+    counts = np.bincount(rows[keep], minlength=n_rows)
+    return csr_matrix(
+        (sims[keep].astype(np.float32), cols[keep].astype(np.int32), np.concatenate([[0], np.cumsum(counts)])),
+        shape=(n_rows, n_cols)
+    )
+
+
+def _neighbor_rows(normalized: csr_matrix, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Соседи строк rows по всем пользователям: (число соседей по строкам, столбцы, сходства)"""
+    n_users = normalized.shape[0]
+    block = max(1, BLOCK_ELEMENTS // max(n_users, 1))
+    counts, cols, sims = [], [], []
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        similarities = (normalized[chunk] @ normalized.T).toarray()
+        similarities[np.arange(len(chunk)), chunk] = -1
+        chunk_counts, chunk_cols, chunk_sims = _top_k_block(similarities, k)
+        counts.append(chunk_counts)
+        cols.append(chunk_cols)
+        sims.append(chunk_sims)
+    if not counts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return np.concatenate(counts), np.concatenate(cols), np.concatenate(sims)
+
+
+@dataclass
+class NeighborGraph:
+    """Top-K соседей каждого пользователя (строки и столбцы - позиции пользователей модели)"""
+    matrix: csr_matrix
+    k: int
+    user_ids: np.ndarray
+    meta: Dict = field(default_factory=dict)
+
+    def neighbors(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Позиции соседей и сходства по убыванию (срез CSR без копии)"""
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return self.matrix.indices[start:end], self.matrix.data[start:end]
+
+    def update(self, normalized: csr_matrix, user_ids: np.ndarray, changed_rows) -> "NeighborGraph":
+        """
+        Граф после изменения строк changed_rows нормированной матрицы.
+
+        Новые пользователи добавляются в конец, позиции остальных не меняются.
+
+        Args:
+            normalized: Нормированная TF-IDF матрица после обновления
+            user_ids: Идентификаторы пользователей по строкам normalized
+            changed_rows: Позиции пользователей с измененными строками
+        """
+        n_users = normalized.shape[0]
+        old = self.matrix
+        changed = np.zeros(n_users, dtype=bool)
+        changed[np.asarray(changed_rows, dtype=np.int64)] = True
+        changed[old.shape[0]:] = True
+
+        # Строки, где измененный пользователь был соседом, пересчитываются целиком:
+        # его сходство могло уменьшиться, и следующий сосед за пределами K неизвестен
+        old_rows = np.repeat(np.arange(old.shape[0]), np.diff(old.indptr))
+        recompute = changed.copy()
+        recompute[np.unique(old_rows[changed[old.indices]])] = True
+        recompute_rows = np.flatnonzero(recompute)
+
+        # Остальным строкам хватает сохраненных соседей и сходств с измененными
+        keep = ~recompute[old_rows]
+        changed_idx = np.flatnonzero(changed)
+        cross = (normalized @ normalized[changed_idx].T).tocoo()
+        cross_keep = ~recompute[cross.row] & (cross.data > 0)
+
+        counts, cols, sims = _neighbor_rows(normalized, recompute_rows, self.k)
+        graph = _top_k_entries(
+            np.concatenate([old_rows[keep], cross.row[cross_keep], np.repeat(recompute_rows, counts)]),
+            np.concatenate([old.indices[keep], changed_idx[cross.col[cross_keep]], cols]),
+            np.concatenate([old.data[keep], cross.data[cross_keep], sims]),
+            n_users, n_users, self.k
+        )
+        logger.info(f"Граф соседей обновлен: {len(recompute_rows)} строк пересчитано, "
+                    f"{int(changed.sum())} пользователей изменено")
+        return NeighborGraph(graph, self.k, np.asarray(user_ids), dict(self.meta))
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+
+def build_graph(normalized: csr_matrix, user_ids: np.ndarray, k: int = 30,
+                version: Optional[str] = None) -> NeighborGraph:
+    """
+    Построение графа соседей для всех пользователей.
+
+    Args:
+        normalized: Нормированная по строкам TF-IDF матрица
+        user_ids: Идентификаторы пользователей по строкам
+        k: Число соседей пользователя
+        version: Версия модели (для метаданных)
+    """
+    n_users = normalized.shape[0]
+    counts, cols, sims = _neighbor_rows(normalized, np.arange(n_users), k)
+    matrix = csr_matrix(
+        (sims, cols.astype(np.int32), np.concatenate([[0], np.cumsum(counts)])),
+        shape=(n_users, n_users)
+    )
+    meta = {"k": k, "version": version, "created_at": datetime.utcnow().isoformat()}
+    return NeighborGraph(matrix, k, np.asarray(user_ids), meta)
+
+
+def graph_path(directory, version: str, k: int) -> Path:
+    """Файл графа версии модели"""
+    return Path(directory) / f"{GRAPH_PREFIX}_{version}_k{k}.npz"
+
+
+def save_graph(path, graph: NeighborGraph) -> Path:
+    """Сохранение графа: запись во временный файл и переименование"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.parent / f".{path.name}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            data=graph.matrix.data,
+            indices=graph.matrix.indices,
+            indptr=graph.matrix.indptr,
+            shape=np.array(graph.matrix.shape, dtype=np.int64),
+            user_ids=np.asarray(graph.user_ids, dtype=np.int64),
+            meta=np.array(json.dumps({**graph.meta, "k": graph.k})),
+        )
+    os.replace(tmp_path, path)
+    logger.info(f"Граф соседей сохранен: {path}")
+    return path
+
+
+def load_graph(path) -> NeighborGraph:
+    """Загрузка графа соседей"""
+    with np.load(path, allow_pickle=False) as npz:
+        meta = json.loads(str(npz["meta"]))
+        matrix = csr_matrix((npz["data"], npz["indices"], npz["indptr"]), shape=tuple(npz["shape"]))
+        return NeighborGraph(matrix, int(meta["k"]), npz["user_ids"], meta)
@@ -0,0 +1,357 @@
+# app/services/metrics.py
+"""
+Метрики в текстовом формате Prometheus.
+
+Небольшой собственный реестр (Counter, Gauge, Histogram) без внешних
+зависимостей, ASGI middleware для задержек запросов и хуки SQLAlchemy
+для времени и числа запросов к БД в рамках HTTP запроса.
+
+Пул соединений и клиент Redis из слоя database сообщают о своих событиях
+через database.instrumentation; метрики подписываются на них при импорте
+модуля, а gauge состояния пулов регистрирует приложение при старте.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from database import instrumentation
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(_Metric):
+    """Текущее значение; callback вызывается при каждом сборе метрик"""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception:
+                values = {}
+            with self._lock:
+                self._values = dict(values)
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+@dataclass
+class _HistogramValue:
+    buckets: List[int]
+    sum: float = 0.0
+    count: int = 0
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = _HistogramValue(buckets=[0] * (len(self.bounds) + 1))
+            entry.buckets[index] += 1
+            entry.sum += value
+            entry.count += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока в секундах"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry.count if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, _HistogramValue(list(v.buckets), v.sum, v.count)) for key, v in self._values.items())
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, observed in zip((*self.bounds, float("inf")), entry.buckets):
+                cumulative += observed
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry.sum)}")
+            lines.append(f"{self.name}_count{labels} {entry.count}")
+        return lines
+
+
+class Registry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# HTTP
+http_request_duration = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Длительность HTTP запросов", ["method", "route", "status"]
+))
+http_request_db_time = REGISTRY.register(Histogram(
+    "http_request_db_seconds", "Суммарное время запросов к БД за HTTP запрос", ["method", "route"]
+))
+http_request_db_queries = REGISTRY.register(Histogram(
+    "http_request_db_queries", "Число запросов к БД за HTTP запрос", ["method", "route"], buckets=COUNT_BUCKETS
+))
+
+# База данных
+db_queries = REGISTRY.register(Counter("db_queries", "Выполненные SQL запросы"))
+db_pool_checkout_wait = REGISTRY.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Ожидание соединения из пула SQLAlchemy",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+))
+
+# Модель рекомендаций
+model_phase_duration = REGISTRY.register(Histogram(
+    "model_phase_duration_seconds", "Длительность этапов загрузки данных и обучения модели", ["phase"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+))
+recommendation_stage_duration = REGISTRY.register(Histogram(
+    "recommendation_tfidf_stage_seconds", "Этапы generate_recommendations_tfidf", ["stage"]
+))
+popular_cache_requests = REGISTRY.register(Counter(
+    "popular_cache_requests", "Обращения к кешу популярных товаров (hit, stale, miss)", ["result"]
+))
+popular_cache_recomputes = REGISTRY.register(Counter(
+    "popular_cache_recomputes", "Пересчеты кеша популярных товаров: при промахе и фоновые", ["mode"]
+))
+
+# RabbitMQ
+rabbitmq_publish_duration = REGISTRY.register(Histogram(
+    "rabbitmq_publish_duration_seconds", "Длительность публикации задач в RabbitMQ", ["queue"]
+))
+rabbitmq_publish_failures = REGISTRY.register(Counter(
+    "rabbitmq_publish_failures", "Неудачные публикации задач в RabbitMQ", ["queue"]
+))
+
+
+# Redis
+redis_command_duration = REGISTRY.register(Histogram(
+    "redis_command_duration_seconds", "Длительность команд Redis", ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+))
+redis_command_failures = REGISTRY.register(Counter(
+    "redis_command_failures", "Команды Redis без ответа: ошибка, таймаут или разомкнутый предохранитель",
+    ["command", "reason"]
+))
+
+class _RequestStats:
+    __slots__ = ("db_time", "db_queries")
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_queries = 0
+
+
+# Статистика текущего HTTP запроса; объект изменяемый, поэтому виден и из threadpool
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: длительность запроса и время БД по шаблону маршрута"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            # Шаблон пути вместо фактического, чтобы не плодить метки
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe(elapsed, method=method, route=route_path, status=str(status["code"]))
+            http_request_db_time.observe(stats.db_time, method=method, route=route_path)
+            http_request_db_queries.observe(stats.db_queries, method=method, route=route_path)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    db_queries.inc()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_time += time.perf_counter() - started
+        stats.db_queries += 1
+
+
+instrumentation.subscribe(instrumentation.POOL_CHECKOUT, db_pool_checkout_wait.observe)
+instrumentation.subscribe(
+    instrumentation.REDIS_COMMAND,
+    lambda command, seconds: redis_command_duration.observe(seconds, command=command)
+)
+instrumentation.subscribe(
+    instrumentation.REDIS_FAILURE,
+    lambda command, reason: redis_command_failures.inc(command=command, reason=reason)
+)
+
+
+def register_pool_gauges(engine: Engine) -> None:
+    """Текущее состояние пула соединений при каждом сборе метрик"""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+
+    REGISTRY.register(Gauge(
+        "db_pool_connections", "Соединения пула SQLAlchemy по состоянию", ["state"],
+        callback=lambda: {
+            ("checked_out",): pool.checkedout(),
+            ("checked_in",): pool.checkedin(),
+            ("overflow",): max(0, pool.overflow()),
+        }
+    ))
+
+
+def register_redis_gauges(client) -> None:
+    """Состояние предохранителя и пула клиента Redis (database.redis_client) при каждом сборе метрик"""
+    REGISTRY.register(Gauge(
+        "redis_circuit_open", "Предохранитель Redis разомкнут (1) или замкнут (0)",
+        callback=lambda: {(): client.stats()["circuit_open"]}
+    ))
+    REGISTRY.register(Gauge(
+        "redis_pool_connections", "Соединения пула Redis по состоянию", ["state"],
+        callback=lambda: {
+            (state,): value for state, value in client.stats().items() if state in ("in_use", "idle")
+        }
+    ))
+
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return REGISTRY.render()
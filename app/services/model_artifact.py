@@ -0,0 +1,237 @@
+# app/services/model_artifact.py
+"""
+Версионированные артефакты модели рекомендаций.
+
+Артефакт - NPZ файл с агрегированной user-product матрицей в CSR формате,
+идентификаторами пользователей и товаров и метаданными обучения. TF-IDF
+и производные структуры восстанавливаются при загрузке, поэтому файл
+не зависит от кода взвешивания. Файл LATEST указывает на последнюю версию.
+
+Рядом с матрицей хранятся число покупателей и суммарное количество по
+товарам: по ним шард считает IDF, а координатор - популярность, не
+загружая матрицу целиком (load_artifact_rows, load_artifact_columns).
+"""
+import os
+import json
+import logging
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+from dataclasses import dataclass
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_PREFIX = "tfidf"
+LATEST_POINTER = "LATEST"
+FORMAT_VERSION = 1
+# Элементов CSR массива на один шаг потокового чтения
+READ_CHUNK = 1 << 20
+
+
+@dataclass
+class ModelArtifact:
+    """Загруженный артефакт модели"""
+    version: str
+    matrix: csr_matrix
+    user_ids: np.ndarray
+    product_ids: np.ndarray
+    meta: Dict
+
+
+@dataclass
+class ArtifactColumns:
+    """Статистика товаров артефакта без матрицы"""
+    version: str
+    product_ids: np.ndarray
+    buyers: np.ndarray
+    frequency: np.ndarray
+    n_users: int
+    meta: Dict
+
+
+def new_version() -> str:
+    """Версия артефакта по времени обучения (UTC)"""
+    return datetime.utcnow().strftime("%Y%m%d%H%M%S")
+
+
+def save_artifact(directory, matrix: csr_matrix, user_ids: np.ndarray, product_ids: np.ndarray,
+                  meta: Optional[Dict] = None, version: Optional[str] = None) -> Path:
+    """
+    Сохранение артефакта и перевод указателя LATEST на него.
+
+    Файлы пишутся во временные и переименовываются, чтобы API и воркер
+    никогда не прочитали частично записанный артефакт.
+
+    Args:
+        directory: Директория артефактов
+        matrix: User-product матрица (строки - user_ids, столбцы - product_ids)
+        user_ids: Идентификаторы пользователей по строкам
+        product_ids: Идентификаторы товаров по столбцам
+        meta: Метаданные обучения (источник, статистика)
+        version: Версия (по умолчанию - текущее время)
+
+    Returns:
+        Path: Путь к сохраненному артефакту
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    version = version or new_version()
+    matrix = csr_matrix(matrix)
+    matrix.sum_duplicates()
+
+    meta = dict(meta or {})
+    meta.update({"version": version, "format": FORMAT_VERSION, "created_at": datetime.utcnow().isoformat()})
+
+    path = directory / f"{ARTIFACT_PREFIX}_{version}.npz"
+    tmp_path = directory / f".{path.name}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            data=matrix.data,
+            indices=matrix.indices,
+            indptr=matrix.indptr,
+            shape=np.array(matrix.shape, dtype=np.int64),
+            user_ids=np.asarray(user_ids, dtype=np.int64),
+            product_ids=np.asarray(product_ids, dtype=np.int64),
+            buyers=np.bincount(matrix.indices, minlength=matrix.shape[1]).astype(np.int64),
+            frequency=np.asarray(matrix.sum(axis=0), dtype=np.float64).ravel(),
+            meta=np.array(json.dumps(meta)),
+        )
+    os.replace(tmp_path, path)
+
+    pointer = directory / LATEST_POINTER
+    tmp_pointer = directory / f".{LATEST_POINTER}.tmp"
+    tmp_pointer.write_text(path.name)
+    os.replace(tmp_pointer, pointer)
+
+    logger.info(f"Артефакт модели сохранен: {path}")
+    return path
+
+
+def latest_artifact(directory) -> Optional[Path]:
+    """Путь к последнему артефакту или None, если артефактов нет"""
+    pointer = Path(directory) / LATEST_POINTER
+    if not pointer.exists():
+        return None
+    path = Path(directory) / pointer.read_text().strip()
+    return path if path.exists() else None
+
+
+def _read_meta(npz) -> Dict:
+    meta = json.loads(str(npz["meta"]))
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемый формат артефакта: {meta.get('format')}")
+    return meta
+
+
+def _iter_chunks(npz, name: str, chunk: int = READ_CHUNK) -> Iterator[np.ndarray]:
+    """Одномерный массив NPZ по частям, без распаковки целиком в память"""
+    with npz.zip.open(f"{name}.npy") as fp:
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(fp)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(fp)
+        total = int(np.prod(shape))
+        # Пустой массив дает одну пустую часть, чтобы вызывающий узнал dtype
+        for start in range(0, max(total, 1), chunk):
+            count = min(chunk, total - start)
+            yield np.frombuffer(fp.read(count * dtype.itemsize), dtype=dtype, count=count)
+
+
+def load_artifact(path) -> ModelArtifact:
+    """Загрузка артефакта модели"""
+    with np.load(path, allow_pickle=False) as npz:
+        meta = _read_meta(npz)
+
+        matrix = csr_matrix(
+            (npz["data"], npz["indices"], npz["indptr"]),
+            shape=tuple(npz["shape"])
+        )
+        return ModelArtifact(
+            version=meta["version"],
+            matrix=matrix,
+            user_ids=npz["user_ids"],
+            product_ids=npz["product_ids"],
+            meta=meta,
+        )
+
+
+def load_artifact_columns(path) -> ArtifactColumns:
+    """
+    Id товаров, число покупателей и суммарное количество по товарам.
+
+    Матрица не загружается; для артефактов без сохраненной статистики
+    она считается потоковым проходом по indices и data.
+    """
+    with np.load(path, allow_pickle=False) as npz:
+        meta = _read_meta(npz)
+        n_users, n_products = (int(size) for size in npz["shape"])
+        if "buyers" in npz.files:
+            buyers, frequency = npz["buyers"], npz["frequency"]
+        else:
+            # Артефакты до сохранения статистики: индексы в них уже без дубликатов
+            buyers = np.zeros(n_products, dtype=np.int64)
+            frequency = np.zeros(n_products, dtype=np.float64)
+            for indices, data in zip(_iter_chunks(npz, "indices"), _iter_chunks(npz, "data")):
+                buyers += np.bincount(indices, minlength=n_products)
+                frequency += np.bincount(indices, weights=data, minlength=n_products)
+        return ArtifactColumns(
+            version=meta["version"],
+            product_ids=npz["product_ids"],
+            buyers=buyers,
+            frequency=frequency,
+            n_users=n_users,
+            meta=meta,
+        )
+
+
+def load_artifact_rows(path, select: Callable[[np.ndarray], np.ndarray]) -> ModelArtifact:
+    """
+    Загрузка только части строк матрицы артефакта.
+
+    indices и data читаются потоком по READ_CHUNK элементов, в памяти
+    остаются только элементы выбранных строк: пиковый объем - выбранные
+    строки, а не вся матрица.
+
+    Args:
+        path: Путь к артефакту
+        select: Маска строк по массиву id всех пользователей
+
+    Returns:
+        ModelArtifact: Выбранные строки (столбцы - все товары) и их user_ids
+    """
+    with np.load(path, allow_pickle=False) as npz:
+        meta = _read_meta(npz)
+        user_ids = npz["user_ids"]
+        indptr = npz["indptr"]
+        n_products = int(npz["shape"][1])
+
+        rows = np.asarray(select(user_ids), dtype=bool)
+        lengths = np.diff(indptr)[rows]
+        new_indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(indptr.dtype)
+
+        selected = {}
+        for name in ("indices", "data"):
+            values, filled, start = None, 0, 0
+            for part in _iter_chunks(npz, name):
+                if values is None:
+                    values = np.empty(int(new_indptr[-1]), dtype=part.dtype)
+                # Строка каждого элемента части по indptr
+                element_rows = np.searchsorted(indptr, np.arange(start, start + len(part)), side="right") - 1
+                kept = part[rows[element_rows]]
+                values[filled:filled + len(kept)] = kept
+                filled += len(kept)
+                start += len(part)
+            selected[name] = values
+
+        matrix = csr_matrix((selected["data"], selected["indices"], new_indptr), shape=(int(rows.sum()), n_products))
+        return ModelArtifact(
+            version=meta["version"],
+            matrix=matrix,
+            user_ids=user_ids[rows],
+            product_ids=npz["product_ids"],
+            meta=meta,
+        )
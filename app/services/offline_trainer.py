@@ -0,0 +1,184 @@
+# app/services/offline_trainer.py
+"""
+Офлайн обучение модели рекомендаций из файлов вместо рабочей БД.
+
+Строит user-product матрицу по выгрузкам orders и order_products__prior
+(колоночный кеш или CSV тех же схем, например снимок БД через COPY),
+читая позиции чанками: в памяти держатся только агрегированные пары
+(пользователь, товар) и буфер несмерженных чанков. Результат - версионированный
+артефакт, который API и ML воркер загружают вместо чтения orderitem,
+и граф соседей пользователей для него (KNN_GRAPH_K), чтобы API не строил
+граф при старте.
+
+Запуск:
+    python -m services.offline_trainer [data_dir] [--output=DIR] [--max-users=N] [--chunk-size=N] [--knn-k=N]
+"""
+import sys
+import time
+import logging
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from scipy.sparse import csr_matrix
+
+# Добавляем путь к проекту
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database.columnar_cache import read_table, iter_table
+from database.config import get_settings
+from services.model_artifact import new_version, save_artifact
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1_000_000
+# Сколько несмерженных строк позиций копить перед слиянием с агрегатом
+MERGE_ROWS = 5_000_000
+
+
+def _order_user_index(data_dir, max_users: Optional[int]) -> np.ndarray:
+    """Плотный массив order_id -> user_id (-1 для неизвестных заказов)"""
+    df_orders = read_table(data_dir, "orders", ["order_id", "user_id"])
+    if max_users:
+        # Тот же отбор пользователей, что и в import_fast
+        users = df_orders["user_id"].unique()[:max_users]
+        df_orders = df_orders[df_orders["user_id"].isin(users)]
+
+    order_ids = df_orders["order_id"].to_numpy()
+    index = np.full(int(order_ids.max()) + 1, -1, dtype=np.int64)
+    index[order_ids] = df_orders["user_id"].to_numpy()
+    return index
+
+
+def _merge(keys: np.ndarray, counts: np.ndarray, pending) -> Tuple[np.ndarray, np.ndarray]:
+    """Слияние агрегата (ключ пары, количество) с буфером новых пар"""
+    all_keys = np.concatenate([keys, *pending])
+    weights = np.concatenate([counts, np.ones(len(all_keys) - len(keys), dtype=np.int64)])
+    keys, inverse = np.unique(all_keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=weights).astype(np.int64)
+
+
+def build_user_product_matrix(data_dir="data", max_users: Optional[int] = None,
+                              chunk_size: int = CHUNK_SIZE) -> Tuple[csr_matrix, np.ndarray, np.ndarray]:
+    """
+    Агрегация позиций заказов в user-product матрицу.
+
+    Пара (пользователь, товар) кодируется одним int64 ключом, поэтому
+    агрегация сводится к сортировке и bincount без pandas groupby.
+
+    Returns:
+        Tuple: (матрица количеств, user_ids по строкам, product_ids по столбцам)
+    """
+    order_user = _order_user_index(data_dir, max_users)
+
+    keys = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+    pending, pending_rows = [], 0
+
+    for chunk in iter_table(data_dir, "order_products__prior", ["order_id", "product_id"], chunk_size):
+        order_ids = chunk["order_id"].to_numpy()
+        product_ids = chunk["product_id"].to_numpy().astype(np.int64)
+
+        known = order_ids < len(order_user)
+        users = np.full(len(order_ids), -1, dtype=np.int64)
+        users[known] = order_user[order_ids[known]]
+        mask = users >= 0
+        if not mask.any():
+            continue
+
+        pending.append((users[mask] << 32) | product_ids[mask])
+        pending_rows += int(mask.sum())
+        if pending_rows >= MERGE_ROWS:
+            keys, counts = _merge(keys, counts, pending)
+            pending, pending_rows = [], 0
+
+    if pending:
+        keys, counts = _merge(keys, counts, pending)
+
+    if len(keys) == 0:
+        raise ValueError("Нет данных для обучения")
+
+    users = keys >> 32
+    products = keys & 0xFFFFFFFF
+    user_ids = np.unique(users)
+    product_ids = np.unique(products)
+
+    matrix = csr_matrix(
+        (counts, (np.searchsorted(user_ids, users), np.searchsorted(product_ids, products))),
+        shape=(len(user_ids), len(product_ids))
+    )
+    return matrix, user_ids, product_ids
+
+
+def build_knn_graph(matrix: csr_matrix, user_ids: np.ndarray, product_ids: np.ndarray,
+                    version: str, output_dir, k: int) -> Dict:
+    """Граф соседей версии модели, сохраняется рядом с артефактом"""
+    from services.recommendation_service import RecommendationService
+
+    service = RecommendationService(session=None)
+    service.redis = None
+    service.knn_k = 0
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.model_version = version
+    service.train_model()
+    return service.train_knn_graph(k, directory=output_dir)
+
+
+def train(data_dir="data", output_dir: Optional[str] = None, max_users: Optional[int] = None,
+          chunk_size: int = CHUNK_SIZE, knn_k: Optional[int] = None) -> Dict:
+    """
+    Обучение модели из файлов и сохранение артефакта.
+
+    Args:
+        knn_k: Соседей в графе (по умолчанию KNN_GRAPH_K, 0 - граф не строится)
+
+    Returns:
+        Dict: Статистика обучения и путь к артефакту
+    """
+    settings = get_settings()
+    output_dir = output_dir or settings.MODEL_ARTIFACT_DIR
+    knn_k = settings.KNN_GRAPH_K if knn_k is None else knn_k
+    start_time = time.time()
+
+    matrix, user_ids, product_ids = build_user_product_matrix(data_dir, max_users, chunk_size)
+
+    stats = {
+        "source": str(Path(data_dir).resolve()),
+        "users": len(user_ids),
+        "products": len(product_ids),
+        "interactions": int(matrix.nnz),
+        "sparsity": (1 - matrix.nnz / (matrix.shape[0] * matrix.shape[1])) * 100,
+        "max_users": max_users,
+        "build_time": time.time() - start_time,
+    }
+    version = new_version()
+    path = save_artifact(output_dir, matrix, user_ids, product_ids, meta=stats, version=version)
+    stats["artifact"] = str(path)
+    if knn_k > 0:
+        stats["knn_graph"] = build_knn_graph(matrix, user_ids, product_ids, version, output_dir, knn_k)
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    options = {}
+    for arg in list(sys.argv[1:]):
+        if arg.startswith("--") and "=" in arg:
+            name, value = arg[2:].split("=", 1)
+            options[name] = value
+            sys.argv.remove(arg)
+
+    result = train(
+        data_dir=sys.argv[1] if len(sys.argv) > 1 else "data",
+        output_dir=options.get("output"),
+        max_users=int(options["max-users"]) if "max-users" in options else None,
+        chunk_size=int(options.get("chunk-size", CHUNK_SIZE)),
+        knn_k=int(options["knn-k"]) if "knn-k" in options else None,
+    )
+    print(f"✅ Модель обучена за {result['build_time']:.1f}s: "
+          f"{result['users']:,} пользователей, {result['products']:,} товаров, "
+          f"{result['interactions']:,} взаимодействий")
+    print(f"📦 Артефакт: {result['artifact']}")
+    if "knn_graph" in result:
+        graph = result["knn_graph"]
+        print(f"🕸️  Граф соседей: K={graph['k']}, {graph['edges']:,} связей за {graph['graph_time']:.1f}s")
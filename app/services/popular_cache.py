@@ -0,0 +1,198 @@
+# app/services/popular_cache.py
+"""
+Кеш популярных товаров в Redis с мягким и жестким сроком жизни.
+
+Значение - конверт {"fresh_until": ..., "items": [...]}. До fresh_until
+список свежий; после него читатели по-прежнему получают устаревший список,
+а один пересчет идет в фоне (stale-while-revalidate). Redis удаляет ключ
+только по жесткому сроку. Оба срока получают случайный разброс, чтобы
+записи разных процессов не истекали одновременно.
+
+При промахе пересчет выполняется один раз (single-flight): одновременные
+промахи процесса ждут общий Future, между процессами действует блокировка
+SET NX с ограниченным временем жизни. Процесс без блокировки ждет
+появления значения до POPULAR_CACHE_WAIT секунд и только потом считает сам.
+"""
+import time
+import uuid
+import random
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from database.config import get_settings
+from services import serialization
+from services.metrics import popular_cache_requests, popular_cache_recomputes
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "popular_products_cache"
+# Товаров в кеше (запросы берут нужное число с начала списка)
+CACHE_SIZE = 50
+POLL_INTERVAL = 0.05
+# Удаление блокировки, только если в ней наш токен
+RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+Loader = Callable[[], List[Dict]]
+
+# Пересчеты процесса: ключ -> Future промаха, ключи с фоновым обновлением
+_inflight: Dict[str, Future] = {}
+_refreshing: Set[str] = set()
+_inflight_lock = threading.Lock()
+_refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="popular-refresh")
+
+
+class PopularCache:
+    """Список популярных товаров в Redis (клиент database.redis_client)"""
+
+    def __init__(self, redis, key: str = CACHE_KEY):
+        settings = get_settings()
+        self.redis = redis
+        self.key = key
+        self.lock_key = f"{key}:lock"
+        self.soft_ttl = settings.POPULAR_CACHE_SOFT_TTL
+        self.hard_ttl = max(settings.POPULAR_CACHE_HARD_TTL, settings.POPULAR_CACHE_SOFT_TTL)
+        self.jitter = settings.POPULAR_CACHE_JITTER
+        self.lock_ttl = settings.POPULAR_CACHE_LOCK_TTL
+        self.wait = settings.POPULAR_CACHE_WAIT
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _store(self, items: List[Dict], fresh_until: float) -> bool:
+        envelope = {"fresh_until": fresh_until, "items": items}
+        return self.redis.setex(self.key, max(1, int(self._jittered(self.hard_ttl))), serialization.dumps(envelope))
+
+    def write(self, items: List[Dict]) -> bool:
+        """Запись свежего списка; False, если Redis недоступен"""
+        return self._store(items, time.time() + self._jittered(self.soft_ttl))
+
+    def read(self) -> Optional[Tuple[List[Dict], bool]]:
+        """(список, свежий ли он) или None при промахе"""
+        cached = self.redis.get(self.key)
+        if not cached:
+            return None
+        value = serialization.loads(cached)
+        if isinstance(value, list):
+            # Запись без конверта (до мягкого срока жизни) считается устаревшей
+            return value, False
+        return value["items"], time.time() < value["fresh_until"]
+
+    def mark_stale(self) -> None:
+        """Пометить список устаревшим: он отдается, пока его не заменит пересчет"""
+        entry = self.read()
+        if entry is not None:
+            self._store(entry[0], 0.0)
+
+    def get(self, loader: Loader) -> Optional[List[Dict]]:
+        """
+        Список популярных товаров.
+
+        Свежий список отдается сразу, устаревший - тоже сразу, с фоновым
+        обновлением. При промахе loader вызывается одним исполнителем.
+        None - Redis недоступен или пересчет не удался (вызывающий идет в БД).
+
+        Args:
+            loader: Пересчет списка; может выполняться в фоновом потоке,
+                поэтому не должен использовать сессию запроса
+        """
+        if not self.redis.available:
+            return None
+
+        entry = self.read()
+        if entry is not None:
+            items, fresh = entry
+            popular_cache_requests.inc(result="hit" if fresh else "stale")
+            if not fresh:
+                self.refresh_in_background(loader)
+            return items
+
+        popular_cache_requests.inc(result="miss")
+        return self._load_once(loader)
+
+    def refresh_in_background(self, loader: Loader) -> bool:
+        """Фоновое обновление, если процесс еще не обновляет этот ключ"""
+        with _inflight_lock:
+            if self.key in _refreshing:
+                return False
+            _refreshing.add(self.key)
+
+        def run():
+            try:
+                self._recompute(loader, mode="background")
+            except Exception as e:
+                logger.warning(f"Фоновое обновление кеша популярных не удалось: {e}")
+            finally:
+                with _inflight_lock:
+                    _refreshing.discard(self.key)
+
+        _refresher.submit(run)
+        return True
+
+    def _load_once(self, loader: Loader) -> Optional[List[Dict]]:
+        """Пересчет при промахе: один на процесс, остальные ждут его результат"""
+        with _inflight_lock:
+            future = _inflight.get(self.key)
+            leader = future is None
+            if leader:
+                future = Future()
+                _inflight[self.key] = future
+
+        if not leader:
+            try:
+                return future.result(timeout=self.lock_ttl)
+            except (FutureTimeout, Exception) as e:
+                logger.warning(f"Пересчет кеша популярных не дождался результата: {e}")
+                return None
+
+        try:
+            items = self._recompute(loader, mode="miss")
+            future.set_result(items)
+            return items
+        except Exception as e:
+            logger.error(f"Пересчет кеша популярных не удался: {e}")
+            future.set_result(None)
+            return None
+        finally:
+            with _inflight_lock:
+                _inflight.pop(self.key, None)
+
+    def _recompute(self, loader: Loader, mode: str) -> Optional[List[Dict]]:
+        """Пересчет под блокировкой Redis"""
+        token = uuid.uuid4().hex
+        # True - блокировка наша, None - ее держит другой процесс, False - Redis не ответил
+        acquired = self.redis.execute("set", self.lock_key, token, nx=True,
+                                      px=int(self.lock_ttl * 1000), default=False)
+        if acquired is None:
+            if mode == "background":
+                return None
+            entry = self._wait_for_value()
+            if entry is not None:
+                return entry
+
+        try:
+            popular_cache_recomputes.inc(mode=mode)
+            items = loader()
+            if items:
+                self.write(items)
+            return items
+        finally:
+            if acquired:
+                # Снимаем только свою блокировку: чужая могла появиться после истечения нашей.
+                # Сравнение и удаление в одном скрипте, иначе между ними ключ может смениться
+                self.redis.execute("eval", RELEASE_LOCK, 1, self.lock_key, token, default=0)
+
+    def _wait_for_value(self) -> Optional[List[Dict]]:
+        deadline = time.monotonic() + self.wait
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = self.read()
+            if entry is not None:
+                return entry[0]
+        return None
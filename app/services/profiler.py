@@ -0,0 +1,389 @@
+# app/services/profiler.py
+"""
+Семплирующий профилировщик и спаны времени.
+
+Фоновый поток раз в interval снимает стеки всех потоков через
+sys._current_frames() и считает одинаковые стеки. Результат пишется в
+collapsed формате (строка "кадр;кадр;... число"), который открывают
+flamegraph.pl, speedscope и inferno. Постоянное семплирование включается
+админскими эндпоинтами или PROFILER_ENABLED, профиль отдельного запроса -
+заголовком X-Profile от администратора.
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import logging
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from database.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Кадры, в которых поток просто ждет работу; такие стеки не семплируются
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_path_cache: Dict[str, str] = {}
+_sampler_threads = set()
+
+
+def _short_path(filename: str) -> str:
+    """Путь файла для подписи кадра: относительно app или пакета"""
+    short = _path_cache.get(filename)
+    if short is None:
+        if filename.startswith(APP_ROOT):
+            short = os.path.relpath(filename, APP_ROOT)
+        elif "site-packages" in filename:
+            short = filename.split("site-packages" + os.sep, 1)[-1]
+        else:
+            short = os.path.basename(filename)
+        _path_cache[filename] = short
+    return short
+
+
+def _thread_label(name: str) -> str:
+    # Пулы потоков нумеруют потоки, в профиле они объединяются
+    return "thread:" + re.sub(r"[_-]?\d+$", "", name or "unknown")
+
+
+def _collapse(frame, thread_name: str) -> Optional[str]:
+    """Стек потока от корня к листу, None для простаивающего потока"""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    parts.append(_thread_label(thread_name))
+    parts.reverse()
+    return ";".join(parts)
+
+
+class StackSampler:
+    """
+    Сборщик стеков в фоновом потоке.
+
+    Args:
+        interval: Период семплирования (сек)
+        output_dir: Каталог для collapsed файлов
+        flush_interval: Как часто сбрасывать накопленное в файл (сек), None - не сбрасывать
+        keep_files: Сколько последних файлов хранить в output_dir
+    """
+
+    def __init__(self, interval: float = 0.01, output_dir: Optional[str] = None,
+                 flush_interval: Optional[float] = None, keep_files: int = 48):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.flush_interval = flush_interval
+        self.keep_files = keep_files
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reset_counters()
+        self.last_file: Optional[str] = None
+
+    def _reset_counters(self) -> None:
+        self._stacks: Counter = Counter()
+        self._spans: Dict[str, List[float]] = {}
+        self.samples = 0
+        self.window_started = time.time()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        _sampler_threads.add(own)
+        last_flush = time.monotonic()
+        try:
+            while not self._stop.wait(self.interval):
+                self.sample()
+                if self.flush_interval and time.monotonic() - last_flush >= self.flush_interval:
+                    last_flush = time.monotonic()
+                    try:
+                        self.flush()
+                    except OSError as e:
+                        logger.warning(f"Не удалось записать профиль: {e}")
+        finally:
+            _sampler_threads.discard(own)
+
+    def sample(self) -> None:
+        """Один снимок стеков всех рабочих потоков"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        stacks = []
+        for ident, frame in frames.items():
+            if ident in _sampler_threads:
+                continue
+            stack = _collapse(frame, names.get(ident, str(ident)))
+            if stack is not None:
+                stacks.append(stack)
+        del frames
+
+        with self._lock:
+            self.samples += 1
+            self._stacks.update(stacks)
+
+    def record_span(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def collapsed(self) -> str:
+        """Накопленные стеки в collapsed формате"""
+        with self._lock:
+            items = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def stats(self, top: int = 10) -> Dict:
+        """Состояние семплера, самые частые листовые функции и спаны"""
+        with self._lock:
+            stacks = dict(self._stacks)
+            spans = {name: list(entry) for name, entry in self._spans.items()}
+            samples = self.samples
+
+        leaves: Counter = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": samples,
+            "unique_stacks": len(stacks),
+            "window_seconds": round(time.time() - self.window_started, 1),
+            "last_file": self.last_file,
+            "top_self": [
+                {"frame": frame, "samples": count, "percent": round(count * 100 / total, 1)}
+                for frame, count in leaves.most_common(top)
+            ],
+            "spans": {
+                name: {"count": count, "total_ms": round(seconds * 1000, 2)}
+                for name, (count, seconds) in sorted(spans.items())
+            },
+        }
+
+    def dump(self, path) -> Path:
+        """Запись накопленных стеков в файл без сброса"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.collapsed(), encoding="utf-8")
+        self.last_file = str(path)
+        return path
+
+    def flush(self) -> Optional[Path]:
+        """Запись окна семплирования в output_dir и начало нового окна"""
+        if self.output_dir is None or self.samples == 0:
+            return None
+        directory = Path(self.output_dir)
+        path = self.dump(directory / f"profile_{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.collapsed")
+        with self._lock:
+            self._reset_counters()
+
+        files = sorted(directory.glob("profile_*.collapsed"))
+        for old in files[:max(0, len(files) - self.keep_files)]:
+            old.unlink(missing_ok=True)
+        return path
+
+
+# Спаны текущего профилируемого запроса; список изменяемый, поэтому виден и из threadpool
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+_profiler: Optional[StackSampler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> StackSampler:
+    """Постоянный профилировщик процесса"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            settings = get_settings()
+            _profiler = StackSampler(
+                interval=settings.PROFILER_INTERVAL_MS / 1000,
+                output_dir=settings.PROFILER_OUTPUT_DIR,
+                flush_interval=settings.PROFILER_FLUSH_SECONDS or None,
+                keep_files=settings.PROFILER_KEEP_FILES
+            )
+        return _profiler
+
+
+def record_span(name: str, seconds: float) -> None:
+    """Учет длительности участка в профиле запроса и постоянном профиле"""
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+    if _profiler is not None and _profiler.running:
+        _profiler.record_span(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Замер участка кода; работает и как декоратор"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+class RequestProfiles:
+    """Последние профили отдельных запросов"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._items: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict) -> str:
+        profile_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._items[profile_id] = profile
+            while len(self._items) > self.limit:
+                self._items.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._items.get(profile_id)
+
+
+request_profiles = RequestProfiles(get_settings().PROFILER_REQUEST_HISTORY)
+
+
+def _server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """Спаны запроса в формате заголовка Server-Timing"""
+    grouped: Dict[str, List[float]] = {}
+    for name, seconds in spans:
+        entry = grouped.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    parts = [f'{name};dur={seconds * 1000:.2f};desc="x{count}"' for name, (count, seconds) in grouped.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def _request_user(scope) -> Optional[str]:
+    """Пользователь из заголовка Authorization, None если токен недействителен"""
+    from fastapi import HTTPException
+    from auth.jwt_handler import verify_access_token
+
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                return verify_access_token(token)["user"]
+            except HTTPException:
+                return None
+    return None
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware профиля отдельного запроса.
+
+    Запрос администратора с заголовком X-Profile семплируется отдельным
+    семплером с повышенной частотой. Ответ получает Server-Timing со
+    спанами и X-Profile-Id, по которому collapsed стеки доступны в
+    GET /admin/profiler/requests/{id}. Семплируются все потоки процесса,
+    поэтому под нагрузкой в профиль попадают и параллельные запросы.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(name == b"x-profile" for name, _ in scope.get("headers", [])):
+            await self.app(scope, receive, send)
+            return
+
+        from auth.authenticate import is_admin
+
+        user = _request_user(scope)
+        if user is None or not is_admin(user):
+            await self.app(scope, receive, send)
+            return
+
+        settings = get_settings()
+        sampler = StackSampler(interval=settings.PROFILER_REQUEST_INTERVAL_MS / 1000)
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+        sampler.start()
+
+        def finish() -> Dict:
+            sampler.stop()
+            elapsed = time.perf_counter() - started
+            profile = {
+                "path": scope["path"],
+                "method": scope["method"],
+                "user": user,
+                "created_at": datetime.utcnow().isoformat(),
+                "duration_ms": round(elapsed * 1000, 2),
+                "samples": sampler.samples,
+                "spans": [{"name": name, "ms": round(seconds * 1000, 3)} for name, seconds in spans],
+                "collapsed": sampler.collapsed(),
+            }
+            profile["id"] = request_profiles.add(profile)
+            return profile
+
+        async def send_wrapper(message):
+            # Обработчик уже отработал к моменту отправки заголовков ответа
+            if message["type"] == "http.response.start" and sampler.running:
+                profile = finish()
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile["id"].encode()))
+                headers.append((b"server-timing", _server_timing(spans, profile["duration_ms"] / 1000).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_spans.reset(token)
+            if sampler.running:
+                finish()
+
+
+def start_if_enabled() -> None:
+    """Запуск постоянного профилировщика при PROFILER_ENABLED"""
+    if get_settings().PROFILER_ENABLED:
+        get_profiler().start()
+        logger.info("Постоянный профилировщик запущен")
@@ -0,0 +1,158 @@
+# app/services/pruning.py
+"""
+Прореживание user-product матрицы перед обучением.
+
+Разовые покупки и товары одного покупателя раздувают матрицу, но почти
+не влияют на соседей. Правила применяются в один проход в порядке:
+1. столбцы сверхпопулярных товаров (доля покупателей выше max_product_share);
+2. строки тяжелых пользователей обрезаются до max_user_items товаров
+   с наибольшим количеством;
+3. товары, купленные меньше чем min_product_buyers пользователями;
+4. пользователи с числом разных товаров меньше min_user_items.
+Пустые после этого строки и столбцы удаляются.
+"""
+import numpy as np
+from dataclasses import dataclass, asdict
+from typing import Dict
+from scipy.sparse import csr_matrix
+
+
+@dataclass(frozen=True)
+class PruningConfig:
+    """Пороги прореживания; значения по умолчанию ничего не удаляют"""
+    min_product_buyers: int = 1
+    min_user_items: int = 1
+    max_user_items: int = 0  # 0 - без ограничения
+    max_product_share: float = 0.0  # 0 - без ограничения
+
+    @property
+    def active(self) -> bool:
+        return (self.min_product_buyers > 1 or self.min_user_items > 1
+                or self.max_user_items > 0 or self.max_product_share > 0)
+
+    @classmethod
+    def from_settings(cls, settings) -> "PruningConfig":
+        return cls(
+            min_product_buyers=settings.PRUNE_MIN_PRODUCT_BUYERS,
+            min_user_items=settings.PRUNE_MIN_USER_ITEMS,
+            max_user_items=settings.PRUNE_MAX_USER_ITEMS,
+            max_product_share=settings.PRUNE_MAX_PRODUCT_SHARE,
+        )
+
+    @classmethod
+    def from_options(cls, options: Dict[str, str]) -> "PruningConfig":
+        """Пороги из опций командной строки (--min-product-buyers=N и т.д.)"""
+        return cls(
+            min_product_buyers=int(options.get("min-product-buyers", 1)),
+            min_user_items=int(options.get("min-user-items", 1)),
+            max_user_items=int(options.get("max-user-items", 0)),
+            max_product_share=float(options.get("max-product-share", 0.0)),
+        )
+
+    def describe(self) -> str:
+        parts = []
+        if self.min_product_buyers > 1:
+            parts.append(f"покупателей>={self.min_product_buyers}")
+        if self.min_user_items > 1:
+            parts.append(f"товаров>={self.min_user_items}")
+        if self.max_user_items > 0:
+            parts.append(f"товаров<={self.max_user_items}")
+        if self.max_product_share > 0:
+            parts.append(f"доля<={self.max_product_share:g}")
+        return ", ".join(parts) or "без прореживания"
+
+
+@dataclass
+class PruningResult:
+    """Прореженная матрица, ее id и то, что из нее ушло"""
+    matrix: csr_matrix
+    user_ids: np.ndarray
+    product_ids: np.ndarray
+    # Количества, удаленные из оставшихся столбцов (по столбцам результата)
+    frequency_offset: np.ndarray
+    # Удаленные товары и их суммарные количества до прореживания
+    dropped_product_ids: np.ndarray
+    dropped_frequency: np.ndarray
+    report: Dict
+
+
+def _matrix_stats(matrix: csr_matrix) -> Dict:
+    return {
+        "users": matrix.shape[0],
+        "products": matrix.shape[1],
+        "interactions": int(matrix.nnz),
+        "mb": round((matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20, 2),
+    }
+
+
+def _buyers(matrix: csr_matrix) -> np.ndarray:
+    return np.bincount(matrix.indices, minlength=matrix.shape[1])
+
+
+def prune_interactions(matrix, user_ids: np.ndarray, product_ids: np.ndarray,
+                       config: PruningConfig) -> PruningResult:
+    """
+    Прореживание матрицы по порогам config.
+
+    Args:
+        matrix: CSR матрица количеств (строки - user_ids, столбцы - product_ids)
+
+    Returns:
+        PruningResult: Матрица, id и отчет о размере до и после
+    """
+    matrix = csr_matrix(matrix)
+    matrix.sum_duplicates()
+    user_ids = np.asarray(user_ids)
+    product_ids = np.asarray(product_ids)
+    full_frequency = np.asarray(matrix.sum(axis=0)).ravel()
+    before = _matrix_stats(matrix)
+    removed = {}
+
+    keep_cols = np.ones(matrix.shape[1], dtype=bool)
+    if config.max_product_share > 0 and matrix.shape[0]:
+        popular = _buyers(matrix) / matrix.shape[0] > config.max_product_share
+        removed["popular_products"] = int(popular.sum())
+        keep_cols &= ~popular
+
+    if config.max_user_items > 0:
+        # Ранг товара в строке по убыванию количества; лишние обнуляются
+        coo = matrix.tocoo()
+        order = np.lexsort((-coo.data, coo.row))
+        starts = matrix.indptr[coo.row[order]]
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order)) - starts
+        capped = rank >= config.max_user_items
+        removed["capped_interactions"] = int(capped.sum())
+        matrix = csr_matrix((np.where(capped, 0, coo.data), (coo.row, coo.col)), shape=matrix.shape)
+        matrix.eliminate_zeros()
+
+    if config.min_product_buyers > 1:
+        rare = _buyers(matrix) < config.min_product_buyers
+        removed["rare_products"] = int((rare & keep_cols).sum())
+        keep_cols &= ~rare
+    matrix = matrix[:, np.flatnonzero(keep_cols)]
+
+    keep_rows = np.diff(matrix.indptr) > 0
+    if config.min_user_items > 1:
+        light = np.diff(matrix.indptr) < config.min_user_items
+        removed["light_users"] = int((light & keep_rows).sum())
+        keep_rows &= ~light
+    matrix = matrix[np.flatnonzero(keep_rows)]
+
+    # Столбцы, оставшиеся без покупателей после удаления строк
+    kept_cols = np.flatnonzero(keep_cols)
+    nonempty = _buyers(matrix) > 0
+    matrix = matrix[:, np.flatnonzero(nonempty)].tocsr()
+    kept_cols = kept_cols[nonempty]
+    dropped_cols = np.setdiff1d(np.arange(len(product_ids)), kept_cols)
+
+    kept_frequency = np.asarray(matrix.sum(axis=0)).ravel()
+    return PruningResult(
+        matrix=matrix,
+        user_ids=user_ids[np.flatnonzero(keep_rows)],
+        product_ids=product_ids[kept_cols],
+        frequency_offset=full_frequency[kept_cols] - kept_frequency,
+        dropped_product_ids=product_ids[dropped_cols],
+        dropped_frequency=full_frequency[dropped_cols],
+        report={"config": asdict(config), "before": before, "after": _matrix_stats(matrix), "removed": removed},
+    )
@@ -1,14 +1,15 @@
 # app/services/recommendation_service.py
 import pandas as pd
 import numpy as np
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix
 from sklearn.metrics.pairwise import cosine_similarity
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func
 from sqlalchemy.orm import selectinload
+from pathlib import Path
 from typing import List, Dict, Tuple, Optional
+import copy
 import logging
 import time
-import json
 from datetime import datetime, timedelta
 from numpy import bincount, log, sqrt
 
@@ -17,31 +18,122 @@ from models.orders import Order
 from models.order_item import OrderItem
 from models.recommendation import ModelType, Recommendation
 from database.database import redis_client
+from database.config import get_settings
+from services.model_artifact import latest_artifact, load_artifact
+from services.id_index import IdIndex
+from services.pruning import PruningConfig, prune_interactions
+from services import factor_model as factors
+from services import knn_graph
+from services.popular_cache import PopularCache, CACHE_KEY as POPULAR_CACHE_KEY, CACHE_SIZE as POPULAR_CACHE_SIZE
+from services.metrics import model_phase_duration, recommendation_stage_duration, popular_cache_requests
+from services.profiler import span, record_span
 
 logger = logging.getLogger(__name__)
 
 
+def _phase_done(phase: str, started: float) -> float:
+    """Запись длительности этапа обучения в метрики, возвращает начало следующего"""
+    now = time.perf_counter()
+    model_phase_duration.observe(now - started, phase=phase)
+    return now
+
+
+# Имена спанов профилировщика для этапов скоринга
+_STAGE_SPANS = {"similarity": "cosine_scoring", "aggregation": "neighbor_aggregation"}
+
+
+def idf_from_buyers(n_users: int, buyers: np.ndarray) -> np.ndarray:
+    """IDF товаров: log(N / (1 + число покупателей товара))"""
+    return log(float(n_users) / (1 + buyers))
+
+
+def idf_weights(tf_matrix) -> np.ndarray:
+    """IDF товаров по матрице количеств"""
+    tf = csr_matrix(tf_matrix)
+    tf.sum_duplicates()
+    return idf_from_buyers(tf.shape[0], bincount(tf.indices, minlength=tf.shape[1]))
+
+
+def _with_data(matrix: csr_matrix, data: np.ndarray) -> csr_matrix:
+    """CSR матрица с той же структурой и новыми значениями: indices/indptr не копируются"""
+    return csr_matrix((data, matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def tfidf_from_idf(tf: csr_matrix, idf: np.ndarray, dtype) -> csr_matrix:
+    """TF-IDF по матрице количеств и готовому IDF (шард считает IDF по всем пользователям)"""
+    return _with_data(tf, (sqrt(tf.data) * idf[tf.indices]).astype(dtype, copy=False))
+
+
+def l2_normalized(matrix: csr_matrix) -> csr_matrix:
+    """Строки с единичной L2 нормой в float32, структура общая с исходной матрицей"""
+    norms = sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    row_scale = np.repeat(inverse, np.diff(matrix.indptr))
+    return _with_data(matrix, (matrix.data * row_scale).astype(np.float32))
+
+
+def _stage_done(stage: str, started: float) -> float:
+    """Запись длительности этапа скоринга в метрики и спан, возвращает начало следующего"""
+    now = time.perf_counter()
+    recommendation_stage_duration.observe(now - started, stage=stage)
+    record_span(_STAGE_SPANS[stage], now - started)
+    return now
+
+
+def _nbytes(value, seen: set) -> int:
+    """Размер массивов NumPy/SciPy структуры в байтах; общие массивы считаются один раз"""
+    if value is None:
+        return 0
+    if hasattr(value, "indptr"):
+        return sum(_nbytes(array, seen) for array in (value.data, value.indices, value.indptr))
+    base = value if value.base is None else value.base
+    if id(base) in seen:
+        return 0
+    seen.add(id(base))
+    return int(value.nbytes)
+
+
 class RecommendationService:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, compact: Optional[bool] = None):
         self.session = session
+        # Компактный режим: float32 данные и int32 id вместо float64/int64
+        self.compact = get_settings().MODEL_COMPACT if compact is None else compact
+        self._float_dtype = np.float32 if self.compact else np.float64
+        self._id_dtype = np.int32 if self.compact else np.int64
         self.user_product_matrix = None
         self.tf_idf_matrix = None
-        self.df_user_products = None
-        self.df_product_frequency = None
-        self.user_id_map = {}
-        self.product_id_map = {}
-        self.reverse_user_map = {}
-        self.reverse_product_map = {}
+        # Позиции строк (пользователи) и столбцов (товары) матрицы
+        self.user_index = IdIndex(dtype=self._id_dtype)
+        self.product_index = IdIndex(dtype=self._id_dtype)
+        # Суммарные количества покупок по столбцам
+        self.product_frequency = None
         self.popular_products = []
+        # Прореживание матрицы при обучении и то, что из нее ушло
+        self.pruning = PruningConfig.from_settings(get_settings())
+        self.pruning_report = None
+        self._frequency_offset = None
+        self._dropped_products = (np.empty(0, dtype=np.int64), np.empty(0))
         self._product_cache = {}
         self._is_trained = False
-        self.redis = redis_client if redis_client else None
-        self._popular_cache_key = "popular_products_cache"
-        self._popular_cache_ttl = 3600  # 1 час
-
+        self.model_version = None
+        self._scoring_source = None
+        self._normalized_tf_idf = None
+        self._purchase_matrix = None
+        self._product_popularity = None
+        self._idf = None
+        self.factor_model = None
+        self._factors_source = None
+        # Граф соседей строится при обучении, если knn_k > 0
+        self.knn_k = get_settings().KNN_GRAPH_K
+        self.knn_graph = None
+        self.redis = redis_client
+        self._popular_cache_key = POPULAR_CACHE_KEY
+
+    @span("load_data")
     def load_data(self) -> Dict:
         """Загрузка и подготовка данных из БД с кэшированием"""
         logger.info("Загрузка данных из БД...")
+        phase_started = time.perf_counter()
 
         # Загружаем все продукты в кэш одним запросом
         products = self.session.exec(
@@ -54,6 +146,7 @@ class RecommendationService:
 
         self._product_cache = {p.id: p for p in products}
         logger.info(f"Загружено {len(self._product_cache)} продуктов в кэш")
+        phase_started = _phase_done("load_products", phase_started)
 
         # Получаем данные заказов
         query = select(
@@ -64,6 +157,7 @@ class RecommendationService:
         ).select_from(OrderItem).join(Order, OrderItem.order_id == Order.id)
 
         results = self.session.exec(query).all()
+        phase_started = _phase_done("load_orders", phase_started)
 
         if not results:
             raise ValueError("Нет данных для обучения")
@@ -86,47 +180,19 @@ class RecommendationService:
             .reset_index()
         )
 
-        # Создаем df_user_products
-        self.df_user_products = (
-            df_user_product.groupby("user_id")["product_id"]
-            .apply(list)
-            .reset_index()
-        )
-
-        # Частота продуктов
-        product_counts = df_user_product.groupby("product_id")["quantity"].sum()
-        self.df_product_frequency = pd.DataFrame({
-            "product_id": product_counts.index,
-            "frequency": product_counts.values
-        }).set_index("product_id")
-
-        # Популярные продукты
-        self.popular_products = (
-            self.df_product_frequency
-            .nlargest(100, "frequency")
-            .index.tolist()
-        )
+        phase_started = _phase_done("aggregate", phase_started)
 
-        # Создаем маппинги
-        unique_users = df_user_product["user_id"].unique()
-        unique_products = df_user_product["product_id"].unique()
-
-        self.user_id_map = {idx: user_id for idx, user_id in enumerate(unique_users)}
-        self.product_id_map = {idx: product_id for idx, product_id in enumerate(unique_products)}
-
-        # Обратные маппинги
-        self.reverse_user_map = {user_id: idx for idx, user_id in self.user_id_map.items()}
-        self.reverse_product_map = {product_id: idx for idx, product_id in self.product_id_map.items()}
-
-        # Создаем индексы для матрицы
-        user_indices = df_user_product["user_id"].map(self.reverse_user_map)
-        product_indices = df_user_product["product_id"].map(self.reverse_product_map)
+        # Позиции строк и столбцов по отсортированным id
+        user_ids, user_indices = np.unique(df_user_product["user_id"].to_numpy(), return_inverse=True)
+        product_ids, product_indices = np.unique(df_user_product["product_id"].to_numpy(), return_inverse=True)
 
         # Построение user-product матрицы
-        self.user_product_matrix = coo_matrix(
-            (df_user_product["quantity"], (user_indices, product_indices)),
-            shape=(len(unique_users), len(unique_products))
+        matrix = coo_matrix(
+            (df_user_product["quantity"].to_numpy(), (user_indices, product_indices)),
+            shape=(len(user_ids), len(product_ids))
         ).tocsr()
+        self.set_interactions(matrix, user_ids, product_ids)
+        phase_started = _phase_done("build_matrix", phase_started)
 
         # Рассчитываем разреженность
         total_size = self.user_product_matrix.shape[0] * self.user_product_matrix.shape[1]
@@ -134,8 +200,8 @@ class RecommendationService:
         sparsity = (1 - (actual_size / total_size)) * 100
 
         stats = {
-            "users": len(self.user_id_map),
-            "products": len(self.product_id_map),
+            "users": len(self.user_index),
+            "products": len(self.product_index),
             "interactions": actual_size,
             "sparsity": sparsity
         }
@@ -144,22 +210,207 @@ class RecommendationService:
 
         # Обновляем кеш популярных товаров
         self._update_popular_cache()
+        _phase_done("popular_cache", phase_started)
 
         return stats
 
+    def load_model(self, path) -> Dict:
+        """
+        Загрузка модели из артефакта офлайн обучения.
+
+        Из БД читается только каталог товаров, матрица взаимодействий
+        берется из артефакта.
+        """
+        logger.info(f"Загрузка артефакта модели {path}...")
+        phase_started = time.perf_counter()
+        artifact = load_artifact(path)
+
+        products = self.session.exec(
+            select(Product)
+            .options(
+                selectinload(Product.aisle),
+                selectinload(Product.department)
+            )
+        ).all()
+        self._product_cache = {p.id: p for p in products}
+
+        matrix = artifact.matrix
+        self.set_interactions(matrix, artifact.user_ids, artifact.product_ids)
+
+        self.model_version = artifact.version
+        phase_started = _phase_done("load_artifact", phase_started)
+        self._update_popular_cache()
+        _phase_done("popular_cache", phase_started)
+
+        stats = {
+            "users": len(artifact.user_ids),
+            "products": len(artifact.product_ids),
+            "interactions": matrix.nnz,
+            "model_version": artifact.version,
+            "loaded": "from_artifact"
+        }
+        logger.info(f"Артефакт загружен: {stats}")
+        return stats
+
+    def set_interactions(self, matrix, user_ids: np.ndarray, product_ids: np.ndarray) -> None:
+        """
+        Установка агрегированной user-product матрицы без обращения к БД.
+
+        Если задано прореживание (self.pruning), матрица прореживается, но
+        популярность товаров считается по всем покупкам.
+
+        Args:
+            matrix: CSR матрица количеств (строки - user_ids, столбцы - product_ids)
+            user_ids: Идентификаторы пользователей по строкам
+            product_ids: Идентификаторы товаров по столбцам
+        """
+        self.pruning_report = None
+        self._frequency_offset = None
+        self._dropped_products = (np.empty(0, dtype=np.int64), np.empty(0))
+        if self.pruning.active:
+            pruned = prune_interactions(matrix, user_ids, product_ids, self.pruning)
+            matrix, user_ids, product_ids = pruned.matrix, pruned.user_ids, pruned.product_ids
+            self._frequency_offset = pruned.frequency_offset
+            self._dropped_products = (pruned.dropped_product_ids, pruned.dropped_frequency)
+            self.pruning_report = pruned.report
+            logger.info(f"Прореживание ({self.pruning.describe()}): "
+                        f"{pruned.report['before']} -> {pruned.report['after']}")
+
+        self.user_index = IdIndex(user_ids, dtype=self._id_dtype)
+        self.product_index = IdIndex(product_ids, dtype=self._id_dtype)
+        self.user_product_matrix = self._compact_matrix(matrix)
+        self.tf_idf_matrix = None
+        self.factor_model = None
+        self.knn_graph = None
+        self._is_trained = False
+        self._update_frequency()
+
+    def _compact_matrix(self, matrix) -> csr_matrix:
+        """CSR матрица с данными в dtype модели; в компактном режиме индексы int32"""
+        matrix = csr_matrix(matrix, dtype=self._float_dtype)
+        if self.compact and matrix.nnz < np.iinfo(np.int32).max:
+            matrix.indices = matrix.indices.astype(np.int32, copy=False)
+            matrix.indptr = matrix.indptr.astype(np.int32, copy=False)
+        return matrix
+
+    def _update_frequency(self) -> None:
+        """
+        Частота товаров по суммам столбцов матрицы и топ-100 популярных.
+
+        Покупки, удаленные прореживанием, учитываются: популярные товары
+        те же, что и без прореживания.
+        """
+        self.product_frequency = np.asarray(
+            self.user_product_matrix.sum(axis=0), dtype=self._float_dtype
+        ).ravel()
+        if self._frequency_offset is not None:
+            self.product_frequency[:len(self._frequency_offset)] += self._frequency_offset
+
+        dropped_ids, dropped_frequency = self._dropped_products
+        frequency = np.concatenate([self.product_frequency, dropped_frequency])
+        top = np.argsort(-frequency, kind="stable")[:100]
+        top = top[frequency[top] > 0]
+        self.popular_products = np.concatenate([self.product_index.ids, dropped_ids])[top].tolist()
+
+    def _restore_dropped_products(self) -> None:
+        """
+        Товары, удаленные прореживанием и снова добавленные в индекс
+        refresh_users, убираются из _dropped_products, а их полная частота
+        переносится в смещение нового столбца: иначе товар попадет в
+        popular_products дважды. Прежние покупки обновленных пользователей
+        уже входят в эту частоту, поэтому учитываются повторно - как и
+        обрезанные покупки в смещении остальных столбцов.
+        """
+        dropped_ids, dropped_frequency = self._dropped_products
+        if len(dropped_ids) == 0:
+            return
+        cols = self.product_index.positions(dropped_ids)
+        restored = cols >= 0
+        if not restored.any():
+            return
+
+        offset = np.zeros(len(self.product_index))
+        if self._frequency_offset is not None:
+            offset[:len(self._frequency_offset)] = self._frequency_offset
+        offset[cols[restored]] += dropped_frequency[restored]
+        self._frequency_offset = offset
+        self._dropped_products = (dropped_ids[~restored], dropped_frequency[~restored])
+
+    def _row_cols(self, row: int) -> np.ndarray:
+        """Столбцы купленных товаров строки пользователя (срез CSR без копии)"""
+        matrix = self.user_product_matrix
+        return matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+
+    def user_products(self, user_id: int) -> List[int]:
+        """Купленные пользователем товары по строке CSR матрицы"""
+        row = self.user_index.get(user_id)
+        if row is None:
+            return []
+        return self.product_index.ids[self._row_cols(row)].tolist()
+
+    def memory_footprint(self) -> Dict:
+        """
+        Размер структур модели в памяти.
+
+        Считаются массивы NumPy/SciPy, общие индексы CSR матриц - один раз
+        (у первой матрицы, которая на них ссылается); факторы, открытые через mmap,
+        отображены из файла и делятся между процессами, поэтому указаны отдельно.
+        Кэш каталога товаров (ORM объекты) в отчет не входит.
+
+        Returns:
+            Dict: Байты по компонентам и итог в мегабайтах
+        """
+        seen = set()
+        components = {
+            "user_product_matrix": _nbytes(self.user_product_matrix, seen),
+            "tf_idf_matrix": _nbytes(self.tf_idf_matrix, seen),
+            "user_index": self.user_index.nbytes,
+            "product_index": self.product_index.nbytes,
+            "product_frequency": _nbytes(self.product_frequency, seen),
+            "scoring_matrices": sum(_nbytes(value, seen) for value in (
+                self._normalized_tf_idf, self._purchase_matrix, self._product_popularity, self._idf
+            )) if self._scoring_source is not None else 0,
+            "knn_graph": self.knn_graph.nbytes if self.knn_graph is not None else 0,
+        }
+        shared = 0
+        if self.factor_model is not None:
+            factor_bytes = sum(_nbytes(getattr(self.factor_model, name), seen)
+                               for name in ("user_factors", "item_factors"))
+            if isinstance(self.factor_model.item_factors, np.memmap):
+                shared = factor_bytes
+            else:
+                components["factor_model"] = factor_bytes
+
+        total = sum(components.values())
+        return {
+            "compact": self.compact,
+            "components": components,
+            "total_bytes": total,
+            "total_mb": round(total / 2 ** 20, 2),
+            "mmap_shared_mb": round(shared / 2 ** 20, 2),
+        }
+
+    def load_latest_model(self) -> Optional[Dict]:
+        """Загрузка последнего артефакта, None если артефактов нет"""
+        path = latest_artifact(get_settings().MODEL_ARTIFACT_DIR)
+        if path is None:
+            return None
+        return self.load_model(path)
+
+    def popular_cache(self) -> PopularCache:
+        """Кеш популярных товаров в Redis (self.redis может быть заменен после создания сервиса)"""
+        return PopularCache(self.redis, self._popular_cache_key)
+
     def _update_popular_cache(self):
         """Обновляет кеш популярных товаров"""
         try:
             # Получаем топ-50 популярных товаров с деталями
-            popular_details = self._get_product_details(self.popular_products[:50], [0.5] * 50)
+            popular_details = self._get_product_details(
+                self.popular_products[:POPULAR_CACHE_SIZE], [0.5] * POPULAR_CACHE_SIZE
+            )
 
-            if self.redis:
-                # Сохраняем в Redis
-                self.redis.setex(
-                    self._popular_cache_key,
-                    self._popular_cache_ttl,
-                    json.dumps(popular_details)
-                )
+            # Запись в Redis не проходит, если он недоступен или отключен предохранителем
+            if self.redis and self.popular_cache().write(popular_details):
                 logger.info(f"Популярные товары сохранены в Redis кеш")
             else:
                 # Сохраняем в таблицу рекомендаций если Redis недоступен
@@ -197,12 +448,14 @@ class RecommendationService:
     def _get_popular_from_cache(self, count: int = 10) -> Optional[List[Dict]]:
         """Получает популярные товары из кеша"""
         try:
-            if self.redis:
-                cached = self.redis.get(self._popular_cache_key)
-                if cached:
-                    popular = json.loads(cached)
+            if self.redis and self.redis.available:
+                # Устаревший список лучше пересчета через load_data: его заменит
+                # следующая загрузка модели или фоновое обновление в API
+                entry = self.popular_cache().read()
+                popular_cache_requests.inc(result="miss" if entry is None else "hit" if entry[1] else "stale")
+                if entry is not None:
                     logger.info(f"Загружены популярные товары из Redis кеша")
-                    return popular[:count]
+                    return entry[0][:count]
             else:
                 # Пробуем загрузить из БД
                 recs = self.session.exec(
@@ -215,6 +468,7 @@ class RecommendationService:
                     .limit(count)
                 ).all()
 
+                popular_cache_requests.inc(result="hit" if recs else "miss")
                 if recs:
                     logger.info(f"Загружены популярные товары из БД")
                     return [
@@ -277,38 +531,216 @@ class RecommendationService:
             logger.error(f"Ошибка при сохранении рекомендаций: {e}")
             raise
 
+    @span("tfidf_weight")
     def tfidf_weight(self, tf_matrix):
         """TF-IDF взвешивание"""
-        tf_idf = coo_matrix(tf_matrix)
-        N = float(tf_idf.shape[0])
-        idf = log(N / (1 + bincount(tf_idf.col)))
-        tf_idf.data = sqrt(tf_idf.data) * idf[tf_idf.col]
-        return tf_idf.tocsr()
-
-    def train_model(self) -> Dict:
-        """Обучение TF-IDF модели"""
+        tf = self._compact_matrix(tf_matrix)
+        tf.sum_duplicates()
+        # Структура общая с матрицей количеств, копируются только значения
+        return tfidf_from_idf(tf, idf_weights(tf), self._float_dtype)
+
+    def train_model(self, prefer_artifact: bool = False) -> Dict:
+        """
+        Обучение TF-IDF модели.
+
+        Args:
+            prefer_artifact: Взять матрицу из последнего артефакта офлайн обучения,
+                если он есть (старт воркера инференса). По умолчанию матрица читается
+                из БД, чтобы переобучение учитывало новые заказы и пользователей.
+        """
         logger.info("Обучение TF-IDF модели...")
         start_time = time.time()
 
         if self.user_product_matrix is None:
-            stats = self.load_data()
+            # Артефакт офлайн обучения избавляет от чтения orderitem из рабочей БД
+            stats = (self.load_latest_model() if prefer_artifact else None) or self.load_data()
         else:
             stats = {"loaded": "from_cache"}
 
         # Применяем TF-IDF
-        self.tf_idf_matrix = self.tfidf_weight(self.user_product_matrix)
+        with model_phase_duration.time(phase="tfidf"):
+            self.tf_idf_matrix = self.tfidf_weight(self.user_product_matrix)
         self._is_trained = True
+        # Полный граф O(n²) строится только офлайн (train_knn_graph); онлайн обучение
+        # лишь читает готовый граф версии артефакта, без него сходство считается на лету
+        graph_stats = self.load_knn_graph() if self.knn_k > 0 and self.model_version else None
 
         training_time = time.time() - start_time
+        model_phase_duration.observe(training_time, phase="train_total")
         logger.info(f"Модель обучена за {training_time:.2f}s")
 
         stats.update({
             "training_time": training_time,
             "model_shape": self.tf_idf_matrix.shape,
+            "memory_mb": self.memory_footprint()["total_mb"],
             "status": "trained"
         })
+        if self.pruning_report:
+            stats["pruning"] = self.pruning_report
+        if graph_stats:
+            stats["knn_graph"] = graph_stats
         return stats
 
+    def _graph_path(self, k: int, directory=None) -> Optional[Path]:
+        if not self.model_version:
+            return None
+        return knn_graph.graph_path(directory or get_settings().MODEL_ARTIFACT_DIR, self.model_version, k)
+
+    def load_knn_graph(self, k: Optional[int] = None, directory=None) -> Optional[Dict]:
+        """Граф соседей версии модели с диска; None, если он не построен"""
+        k = k or self.knn_k or get_settings().KNN_GRAPH_K
+        path = self._graph_path(k, directory)
+        if path is None or not path.exists():
+            return None
+
+        started = time.perf_counter()
+        graph = knn_graph.load_graph(path)
+        # Граф другой выборки пользователей (например, при другом прореживании) не подходит
+        if not np.array_equal(graph.user_ids, self.user_index.ids):
+            logger.warning(f"Граф соседей {path.name} построен для других пользователей, не используется")
+            return None
+        self.knn_graph = graph
+        elapsed = _phase_done("knn_graph", started) - started
+        return {"k": k, "loaded": "from_disk", "edges": int(graph.matrix.nnz), "graph_time": elapsed}
+
+    def train_knn_graph(self, k: Optional[int] = None, directory=None) -> Dict:
+        """
+        Построение графа top-K соседей всех пользователей (офлайн тренер, бенчмарк).
+
+        Для модели из артефакта граф сохраняется рядом с ним и при следующей
+        загрузке той же версии читается с диска без пересчета.
+        """
+        if not self._is_trained:
+            self.train_model()
+
+        k = k or self.knn_k or get_settings().KNN_GRAPH_K
+        stats = self.load_knn_graph(k, directory)
+        if stats is not None:
+            return stats
+
+        started = time.perf_counter()
+        normalized, _, _ = self._scoring_matrices()
+        graph = knn_graph.build_graph(normalized, self.user_index.ids, k, self.model_version)
+        path = self._graph_path(k, directory)
+        if path is not None:
+            try:
+                knn_graph.save_graph(path, graph)
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить граф соседей: {e}")
+        self.knn_graph = graph
+        elapsed = _phase_done("knn_graph", started) - started
+
+        stats = {"k": k, "loaded": "built", "edges": int(graph.matrix.nnz), "graph_time": elapsed}
+        logger.info(f"Граф соседей готов: {stats}")
+        return stats
+
+    def fork(self, session: Optional[Session]) -> "RecommendationService":
+        """
+        Копия обученной модели для обновления в другом потоке.
+
+        Матрицы и массивы общие: refresh_users заменяет их новыми, а не
+        меняет на месте. Копируются только индексы id и кэш товаров, которые
+        обновление дополняет, поэтому исходная модель продолжает отвечать
+        на запросы, пока копия обновляется.
+
+        Args:
+            session: Отдельная сессия БД для потока обновления
+        """
+        clone = copy.copy(self)
+        clone.session = session
+        clone.user_index = copy.copy(self.user_index)
+        clone.product_index = copy.copy(self.product_index)
+        clone._product_cache = dict(self._product_cache)
+        return clone
+
+    def refresh_users(self, user_ids: List[int]) -> Dict:
+        """
+        Инкрементальное обновление модели для пользователей с новыми заказами.
+
+        Перечитывает из БД только заказы указанных пользователей, заменяет
+        их строки в user-product матрице (добавляя новых пользователей и
+        товары) и пересчитывает TF-IDF. Если модель еще не обучена,
+        выполняется полное обучение.
+        """
+        if not self._is_trained or self.user_product_matrix is None:
+            return self.train_model()
+
+        logger.info(f"Инкрементальное обновление модели для {len(user_ids)} пользователей...")
+        start_time = time.time()
+        user_ids = sorted({int(uid) for uid in user_ids})
+
+        results = self.session.exec(
+            select(
+                Order.user_id,
+                OrderItem.product_id,
+                func.sum(OrderItem.quantity)
+            ).select_from(OrderItem).join(
+                Order, OrderItem.order_id == Order.id
+            ).where(
+                Order.user_id.in_(user_ids)
+            ).group_by(
+                Order.user_id, OrderItem.product_id
+            )
+        ).all()
+
+        df_new = pd.DataFrame(results, columns=["user_id", "product_id", "quantity"])
+
+        # Догружаем в кэш товары, появившиеся после полного обучения
+        missing_products = [pid for pid in df_new["product_id"].unique() if pid not in self._product_cache]
+        if missing_products and self._product_cache:
+            products = self.session.exec(
+                select(Product)
+                .options(
+                    selectinload(Product.aisle),
+                    selectinload(Product.department)
+                )
+                .where(Product.id.in_(missing_products))
+            ).all()
+            self._product_cache.update({p.id: p for p in products})
+
+        # Расширяем индексы новыми пользователями и товарами
+        new_rows = self.user_index.extend(df_new["user_id"].to_numpy())
+        new_cols = self.product_index.extend(df_new["product_id"].to_numpy())
+
+        # Заменяем строки затронутых пользователей
+        old = self.user_product_matrix.tocoo()
+        affected_rows = self.user_index.positions(user_ids)
+        keep = ~np.isin(old.row, affected_rows[affected_rows >= 0])
+
+        self.user_product_matrix = self._compact_matrix(coo_matrix(
+            (
+                np.concatenate([old.data[keep], df_new["quantity"].to_numpy(dtype=old.data.dtype)]),
+                (np.concatenate([old.row[keep], new_rows]), np.concatenate([old.col[keep], new_cols]))
+            ),
+            shape=(len(self.user_index), len(self.product_index))
+        ).tocsr())
+
+        self._restore_dropped_products()
+        # Частота и популярность товаров по суммам столбцов матрицы
+        self._update_frequency()
+
+        self.tf_idf_matrix = self.tfidf_weight(self.user_product_matrix)
+        if self.knn_graph is not None:
+            # Пересчитываются только строки затронутых пользователей и их соседей
+            normalized, _, _ = self._scoring_matrices()
+            changed_rows = self.user_index.positions(user_ids)
+            self.knn_graph = self.knn_graph.update(
+                normalized, self.user_index.ids, changed_rows[changed_rows >= 0]
+            )
+        self._update_popular_cache()
+
+        refresh_time = time.time() - start_time
+        model_phase_duration.observe(refresh_time, phase="refresh_users")
+        logger.info(f"Модель обновлена инкрементально за {refresh_time:.2f}s")
+
+        return {
+            "status": "refreshed",
+            "users_refreshed": len(user_ids),
+            "interactions_loaded": len(df_new),
+            "refresh_time": refresh_time,
+            "model_shape": self.tf_idf_matrix.shape
+        }
+
     def generate_recommendations_tfidf(
             self,
             target_user_id: int,
@@ -321,12 +753,11 @@ class RecommendationService:
             self.train_model()
 
         # Проверяем есть ли пользователь
-        if target_user_id not in self.reverse_user_map:
+        user_idx = self.user_index.get(target_user_id)
+        if user_idx is None:
             logger.info(f"Новый пользователь {target_user_id}, возвращаем популярные")
             return self.popular_products[:n_recommendations], [0.5] * min(n_recommendations, len(self.popular_products))
 
-        user_idx = self.reverse_user_map[target_user_id]
-
         # Получаем вектор пользователя
         target_user_vector = self.tf_idf_matrix[user_idx]
 
@@ -335,54 +766,51 @@ class RecommendationService:
             logger.warning(f"Пользователь {target_user_id} не имеет покупок в матрице")
             return self.popular_products[:n_recommendations], [0.5] * min(n_recommendations, len(self.popular_products))
 
-        # Вычисляем косинусное сходство
-        similarities = cosine_similarity(
-            self.tf_idf_matrix,
-            target_user_vector.reshape(1, -1),
-            dense_output=False
-        )
-        cos_vec = similarities.toarray().flatten()
-
-        # Получаем продукты пользователя
-        user_products_row = self.df_user_products[self.df_user_products['user_id'] == target_user_id]
-        if not user_products_row.empty:
-            user_products = set(user_products_row.iloc[0]['product_id'])
+        stage_started = time.perf_counter()
+        graph = self.knn_graph
+        if graph is not None and k_neighbors <= graph.k:
+            # Соседи из предрасчитанного графа: O(K) вместо сходства со всеми
+            top_k_indices, top_k_sims = graph.neighbors(user_idx)
+            top_k_indices, top_k_sims = top_k_indices[:k_neighbors], top_k_sims[:k_neighbors]
         else:
-            user_products = set()
+            # Вычисляем косинусное сходство
+            similarities = cosine_similarity(
+                self.tf_idf_matrix,
+                target_user_vector.reshape(1, -1),
+                dense_output=False
+            )
+            cos_vec = similarities.toarray().flatten()
 
-        logger.info(f"Пользователь {target_user_id} купил {len(user_products)} уникальных товаров")
+            # Исключаем самого пользователя
+            cos_vec[user_idx] = -1
 
-        # Исключаем самого пользователя
-        cos_vec[user_idx] = -1
+            # Находим топ-K похожих пользователей
+            k_to_check = min(k_neighbors * 2, len(cos_vec) - 1)
+            top_k_indices = np.argpartition(cos_vec, -k_to_check)[-k_to_check:]
+            top_k_indices = top_k_indices[np.argsort(cos_vec[top_k_indices])[::-1]]
+            top_k_sims = cos_vec[top_k_indices]
 
-        # Находим топ-K похожих пользователей
-        k_to_check = min(k_neighbors * 2, len(cos_vec) - 1)
-        top_k_indices = np.argpartition(cos_vec, -k_to_check)[-k_to_check:]
-        top_k_indices = top_k_indices[np.argsort(cos_vec[top_k_indices])[::-1]]
+        stage_started = _stage_done("similarity", stage_started)
+
+        # Получаем продукты пользователя (столбцы матрицы)
+        user_products = set(self._row_cols(user_idx).tolist())
+
+        logger.info(f"Пользователь {target_user_id} купил {len(user_products)} уникальных товаров")
 
         # Собираем рекомендации с весами
         recommendation_scores = {}
         similar_users_found = 0
 
-        for similar_user_idx in top_k_indices:
-            if cos_vec[similar_user_idx] <= 0:
-                continue
-
-            similar_user_id = self.user_id_map[similar_user_idx]
-            similar_user_row = self.df_user_products[self.df_user_products['user_id'] == similar_user_id]
-
-            if similar_user_row.empty:
+        for similar_user_idx, similarity_score in zip(top_k_indices, top_k_sims):
+            if similarity_score <= 0:
                 continue
 
-            similar_products = set(similar_user_row.iloc[0]['product_id'])
-
-            candidate_products = similar_products
+            candidate_products = self._row_cols(similar_user_idx).tolist()
 
             if not candidate_products:
                 continue
 
             similar_users_found += 1
-            similarity_score = cos_vec[similar_user_idx]
 
             # Добавляем продукты с учетом схожести
             for product in candidate_products:
@@ -405,21 +833,17 @@ class RecommendationService:
             return self.popular_products[:n_recommendations], [0.3] * min(n_recommendations, len(self.popular_products))
 
         # Ранжируем кандидатов
+        max_freq = float(self.product_frequency.max())
         scored_recommendations = []
         for product, scores in recommendation_scores.items():
             # Средняя схожесть
             avg_similarity = np.mean(scores)
 
             # Учитываем популярность
-            if product in self.df_product_frequency.index:
-                freq = self.df_product_frequency.loc[product, 'frequency']
-                max_freq = self.df_product_frequency['frequency'].max()
-                popularity_score = freq / max_freq
+            popularity_score = float(self.product_frequency[product]) / max_freq
 
-                # Комбинированный score
-                final_score = 0.7 * avg_similarity + 0.3 * popularity_score
-            else:
-                final_score = avg_similarity
+            # Комбинированный score
+            final_score = 0.7 * avg_similarity + 0.3 * popularity_score
 
             scored_recommendations.append((final_score, product))
 
@@ -427,14 +851,303 @@ class RecommendationService:
         scored_recommendations.sort(reverse=True, key=lambda x: x[0])
         top_recommendations = scored_recommendations[:n_recommendations]
 
+        _stage_done("aggregation", stage_started)
+
         # Возвращаем продукты и scores
-        recommended_products = [item[1] for item in top_recommendations]
-        scores = [min(item[0], 1.0) for item in top_recommendations]
+        recommended_products = self.product_index.ids[[item[1] for item in top_recommendations]].tolist()
+        scores = [min(float(item[0]), 1.0) for item in top_recommendations]
 
         logger.info(f"Возвращаем {len(recommended_products)} рекомендаций для пользователя {target_user_id}")
 
         return recommended_products, scores
 
+    def _scoring_matrices(self):
+        """
+        Матрицы для пакетного скоринга, пересчитываются после обучения:
+        нормированная TF-IDF, бинарная матрица покупок и популярность товаров.
+        Вместе с ними обновляется IDF для векторов корзины (self._idf).
+        """
+        if self._scoring_source is not self.tf_idf_matrix:
+            # Нормированная TF-IDF и бинарная матрица делят индексы с исходными матрицами
+            self._normalized_tf_idf = l2_normalized(self.tf_idf_matrix)
+            self._purchase_matrix = _with_data(
+                self.user_product_matrix, np.ones(self.user_product_matrix.nnz, dtype=np.float32)
+            )
+
+            popularity = self.product_frequency.astype(np.float64)
+            self._product_popularity = popularity / popularity.max() if popularity.max() > 0 else popularity
+            self._idf = idf_weights(self.user_product_matrix).astype(self._float_dtype)
+            self._scoring_source = self.tf_idf_matrix
+        return self._normalized_tf_idf, self._purchase_matrix, self._product_popularity
+
+    def _neighbor_scores(self, weights: csr_matrix, own: np.ndarray) -> np.ndarray:
+        """
+        Оценки товаров по матрице весов соседей (строки - запросы, столбцы - пользователи).
+
+        Args:
+            weights: Сходства с отобранными соседями
+            own: Плотная матрица купленных запросом товаров (1 - куплен)
+
+        Returns:
+            np.ndarray: Оценки товаров, -inf для товаров без соседей-покупателей
+        """
+        _, purchases, popularity = self._scoring_matrices()
+        neighbor_mask = weights.copy()
+        neighbor_mask.data[:] = 1
+
+        sim_sum = (weights @ purchases).toarray()
+        neighbor_count = (neighbor_mask @ purchases).toarray()
+
+        # Бонус 0.3 за уже купленные товары, как в generate_recommendations_tfidf
+        with np.errstate(divide="ignore", invalid="ignore"):
+            avg_similarity = sim_sum * (1 + 0.3 * own) / (neighbor_count * (1 + own))
+
+        return np.where(neighbor_count > 0, 0.7 * avg_similarity + 0.3 * popularity, -np.inf)
+
+    def generate_recommendations_batch(
+            self,
+            user_ids: List[int],
+            k_neighbors: int = 30,
+            n_recommendations: int = 10
+    ) -> Dict[int, Tuple[List[int], List[float]]]:
+        """
+        Пакетная генерация TF-IDF рекомендаций.
+
+        Та же формула, что и в generate_recommendations_tfidf, но сходство
+        всех пользователей пакета считается одним разреженным произведением,
+        а оценки товаров - произведением матрицы весов соседей на матрицу покупок.
+        """
+        if not self._is_trained:
+            self.train_model()
+
+        results = {}
+        popular = self.popular_products[:n_recommendations]
+        known = []
+        unique_ids = list(dict.fromkeys(user_ids))
+        positions = self.user_index.positions(unique_ids)
+        rows = positions[positions >= 0]
+        for user_id, position in zip(unique_ids, positions.tolist()):
+            if position >= 0:
+                known.append(user_id)
+            else:
+                results[user_id] = (popular, [0.5] * len(popular))
+        if not known:
+            return results
+
+        normalized, purchases, _ = self._scoring_matrices()
+
+        # Косинусное сходство пакета со всеми пользователями
+        stage_started = time.perf_counter()
+        similarities = (normalized[rows] @ normalized.T).toarray()
+        similarities[np.arange(len(rows)), rows] = -1
+        stage_started = _stage_done("similarity", stage_started)
+
+        # Матрица весов: top-K соседей с положительным сходством
+        k = min(k_neighbors, similarities.shape[1] - 1)
+        weight_rows, weight_cols, weight_values = [], [], []
+        if k > 0:
+            top = np.argpartition(similarities, -k, axis=1)[:, -k:]
+            for batch_idx in range(len(rows)):
+                neighbors = top[batch_idx]
+                sims = similarities[batch_idx, neighbors]
+                positive = sims > 0
+                weight_rows.extend([batch_idx] * int(positive.sum()))
+                weight_cols.extend(neighbors[positive])
+                weight_values.extend(sims[positive])
+        weights = csr_matrix(
+            (np.array(weight_values, dtype=np.float32), (weight_rows, weight_cols)),
+            shape=(len(rows), similarities.shape[1])
+        )
+        scores = self._neighbor_scores(weights, purchases[rows].toarray())
+        _stage_done("aggregation", stage_started)
+
+        for batch_idx, user_id in enumerate(known):
+            row = scores[batch_idx]
+            candidates = int(np.isfinite(row).sum())
+            if candidates == 0:
+                results[user_id] = (popular, [0.3] * len(popular))
+                continue
+
+            n = min(n_recommendations, candidates)
+            top = np.argpartition(row, -n)[-n:]
+            top = top[np.argsort(row[top])[::-1]]
+            results[user_id] = (
+                self.product_index.ids[top].tolist(),
+                [min(float(row[idx]), 1.0) for idx in top]
+            )
+
+        return results
+
+    def generate_recommendations_session(
+            self,
+            target_user_id: int,
+            cart_product_ids: List[int],
+            k_neighbors: int = 30,
+            n_recommendations: int = 10
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Рекомендации с учетом текущей корзины без переобучения.
+
+        Товары корзины (по одной штуке) добавляются к строке покупок
+        пользователя, вектор взвешивается IDF обученной модели и сравнивается
+        со всеми пользователями одним разреженным произведением; дальше та же
+        агрегация соседей, что и в пакетном скоринге. Модель и БД не меняются,
+        товары корзины в ответ не попадают.
+        """
+        if not self._is_trained:
+            self.train_model()
+
+        cart = list(dict.fromkeys(int(product_id) for product_id in cart_product_ids))
+        in_cart = set(cart)
+        popular = [pid for pid in self.popular_products if pid not in in_cart][:n_recommendations]
+
+        # Строка количеств: история пользователя плюс корзина
+        stage_started = time.perf_counter()
+        cart_cols = self.product_index.positions(cart)
+        cart_cols = cart_cols[cart_cols >= 0]
+        user_idx = self.user_index.get(target_user_id)
+        cols, quantities = cart_cols, np.ones(len(cart_cols))
+        if user_idx is not None:
+            matrix = self.user_product_matrix
+            start, end = matrix.indptr[user_idx], matrix.indptr[user_idx + 1]
+            cols = np.concatenate([matrix.indices[start:end], cart_cols])
+            quantities = np.concatenate([matrix.data[start:end], quantities])
+        if len(cols) == 0:
+            return popular, [0.5] * len(popular)
+
+        normalized, _, _ = self._scoring_matrices()
+        vector = csr_matrix((quantities, (np.zeros(len(cols), dtype=np.int64), cols)),
+                            shape=(1, normalized.shape[1]))
+        vector.sum_duplicates()
+        vector.data = sqrt(vector.data) * self._idf[vector.indices]
+        norm = sqrt(float(vector.data @ vector.data))
+        if norm == 0:
+            return popular, [0.5] * len(popular)
+        vector.data = (vector.data / norm).astype(np.float32)
+
+        similarities = np.asarray((normalized @ vector.T).toarray()).ravel()
+        if user_idx is not None:
+            similarities[user_idx] = -1
+        stage_started = _stage_done("similarity", stage_started)
+
+        k = min(k_neighbors, len(similarities))
+        neighbors = np.argpartition(similarities, -k)[-k:] if k > 0 else np.empty(0, dtype=np.int64)
+        neighbors = neighbors[similarities[neighbors] > 0]
+        if len(neighbors) == 0:
+            return popular, [0.3] * len(popular)
+
+        weights = csr_matrix(
+            (similarities[neighbors].astype(np.float32), (np.zeros(len(neighbors), dtype=np.int64), neighbors)),
+            shape=(1, len(similarities))
+        )
+        own = np.zeros((1, normalized.shape[1]))
+        own[0, vector.indices] = 1
+        scores = self._neighbor_scores(weights, own).ravel()
+        scores[cart_cols] = -np.inf
+        _stage_done("aggregation", stage_started)
+
+        candidates = int(np.isfinite(scores).sum())
+        if candidates == 0:
+            return popular, [0.3] * len(popular)
+        n = min(n_recommendations, candidates)
+        top = np.argpartition(scores, -n)[-n:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return self.product_index.ids[top].tolist(), [min(float(scores[idx]), 1.0) for idx in top]
+
+    def train_factor_model(self, rank: Optional[int] = None) -> Dict:
+        """
+        Обучение SVD факторов по текущей TF-IDF матрице.
+
+        Для модели из артефакта факторы сохраняются рядом с ним и при
+        следующей загрузке той же версии открываются через mmap без обучения,
+        если id пользователей и товаров совпадают с текущими индексами.
+        Несовпадающие факторы обучаются заново и файл не перезаписывают.
+        """
+        if not self._is_trained:
+            self.train_model()
+
+        settings = get_settings()
+        rank = rank or settings.FACTOR_RANK
+        path = (factors.factors_path(settings.MODEL_ARTIFACT_DIR, self.model_version, rank)
+                if self.model_version else None)
+
+        started = time.perf_counter()
+        stored = factors.load_factors(path) if path is not None and path.exists() else None
+        # Столбцы факторов - позиции товаров индекса, при которых их обучили: факторы
+        # той же версии с другим прореживанием или после refresh_users не подходят
+        if stored is not None and not (np.array_equal(stored.product_ids, self.product_index.ids)
+                                       and np.array_equal(stored.user_ids, self.user_index.ids)):
+            logger.warning(f"Факторы {path.name} обучены для других пользователей или товаров, обучаем заново")
+            stored, path = None, None
+        if stored is not None:
+            self.factor_model = stored
+            loaded = "from_disk"
+        else:
+            self.factor_model = factors.fit(
+                self.tf_idf_matrix, idf_weights(self.user_product_matrix),
+                self.user_index.ids, self.product_index.ids, rank=rank
+            )
+            loaded = "trained"
+            if path is not None:
+                try:
+                    factors.save_factors(path, self.factor_model)
+                except OSError as e:
+                    logger.warning(f"Не удалось сохранить факторы модели: {e}")
+        self._factors_source = self.tf_idf_matrix
+        elapsed = _phase_done("factors", started) - started
+
+        stats = {"rank": self.factor_model.rank, "loaded": loaded, "factors_time": elapsed}
+        logger.info(f"SVD факторы готовы: {stats}")
+        return stats
+
+    def _user_history(self, user_id: int) -> Tuple[List[int], List[float]]:
+        """Покупки пользователя из БД для fold-in (товары и суммарные количества)"""
+        if self.session is None:
+            return [], []
+        rows = self.session.exec(
+            select(OrderItem.product_id, func.sum(OrderItem.quantity))
+            .select_from(OrderItem)
+            .join(Order, OrderItem.order_id == Order.id)
+            .where(Order.user_id == user_id)
+            .group_by(OrderItem.product_id)
+        ).all()
+        return [row[0] for row in rows], [float(row[1]) for row in rows]
+
+    def generate_recommendations_svd(
+            self,
+            target_user_id: int,
+            n_recommendations: int = 10
+    ) -> Tuple[List[int], List[float]]:
+        """
+        Генерация рекомендаций по SVD факторам.
+
+        Фактор пользователя берется из обучения; если строка пользователя
+        обновлена refresh_users или его нет в модели, вектор получается
+        fold-in проекцией текущих покупок без переобучения факторов.
+        """
+        if self.factor_model is None:
+            self.train_factor_model()
+        model = self.factor_model
+
+        started = time.perf_counter()
+        vector = None
+        if self._factors_source is self.tf_idf_matrix:
+            vector = model.user_vector(target_user_id)
+        if vector is None and target_user_id in self.user_index:
+            # Столбцы новых товаров добавляются в конец и в факторах отсутствуют
+            row = self.tf_idf_matrix[self.user_index[target_user_id]]
+            vector = model.fold_in(row[:, :model.n_items])
+        if vector is None:
+            vector = model.fold_in_products(*self._user_history(target_user_id))
+
+        if not np.any(vector):
+            logger.info(f"Нет покупок пользователя {target_user_id} для SVD, возвращаем популярные")
+            return self.popular_products[:n_recommendations], [0.5] * min(n_recommendations, len(self.popular_products))
+
+        product_ids, scores = model.recommend(vector, n_recommendations)
+        record_span("factor_scoring", time.perf_counter() - started)
+        return product_ids, scores
+
     def get_recommendations(
             self,
             user_id: int,
@@ -476,9 +1189,12 @@ class RecommendationService:
 
             scores = [0.5] * len(product_ids)
 
-        elif model_type == ModelType.COLLABORATIVE:
+        elif model_type in (ModelType.COLLABORATIVE, ModelType.SVD):
             # Получаем больше рекомендаций для фильтрации
-            product_ids, scores = self.generate_recommendations_tfidf(user_id, n_recommendations=count * 2)
+            if model_type == ModelType.SVD:
+                product_ids, scores = self.generate_recommendations_svd(user_id, n_recommendations=count * 2)
+            else:
+                product_ids, scores = self.generate_recommendations_tfidf(user_id, n_recommendations=count * 2)
 
             logger.info(f"Generated {len(product_ids)} recommendations for user {user_id}")
 
@@ -555,13 +1271,16 @@ class RecommendationService:
     def retrain_model(self) -> Dict:
         """Переобучение модели"""
         try:
-            # Сбрасываем кэши
+            # Сбрасываем кэши; матрица перечитывается из БД с новыми заказами
             self._product_cache.clear()
             self._is_trained = False
+            self.user_product_matrix = None
+            self.factor_model = None
 
-            # Очищаем кеш популярных товаров
+            # Список популярных помечается устаревшим, а не удаляется: пока идет
+            # обучение, читатели получают его, а не пересчитывают одновременно
             if self.redis:
-                self.redis.delete(self._popular_cache_key)
+                self.popular_cache().mark_stale()
 
             return self.train_model()
         except Exception as e:
@@ -0,0 +1,199 @@
+# app/services/rpc_client.py
+"""
+Асинхронный RPC клиент к воркеру инференса рекомендаций.
+
+pika работает только с блокирующим соединением, поэтому соединение и
+очередь ответов живут в отдельном потоке, а корутины ждут asyncio.Future,
+которые поток завершает по correlation_id.
+
+Первое подключение запрос ждет до CONNECT_TIMEOUT. После неудачного
+подключения или обрыва запросы не ждут: переподключение идет в фоне
+(не чаще раза в RECONNECT_DELAY), а запрос сразу получает
+RPCUnavailableError и уходит в популярные товары.
+"""
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import functools
+from typing import Dict, Optional, Tuple
+
+import pika
+
+from database.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class RPCUnavailableError(Exception):
+    """Воркер инференса недоступен или не ответил вовремя"""
+
+
+class RecommendationRPCClient:
+    """RPC клиент с общим соединением на процесс"""
+
+    # Пауза перед повторным подключением после неудачи (сек)
+    RECONNECT_DELAY = 5.0
+    CONNECT_TIMEOUT = 2.0
+
+    def __init__(self, queue: Optional[str] = None):
+        settings = get_settings()
+        self.queue = queue or settings.RECOMMENDATION_RPC_QUEUE
+        self._futures: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connection: Optional[pika.BlockingConnection] = None
+        self._channel = None
+        self._callback_queue: Optional[str] = None
+        self._retry_after = 0.0
+        # Подключение уже не удавалось: запросы не ждут переподключения
+        self._failed = False
+
+    def _connection_params(self) -> pika.ConnectionParameters:
+        settings = get_settings()
+        return pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            credentials=pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS),
+            heartbeat=30,
+            connection_attempts=1,
+            socket_timeout=self.CONNECT_TIMEOUT,
+            blocked_connection_timeout=self.CONNECT_TIMEOUT
+        )
+
+    def _ensure_started(self) -> None:
+        """Запуск потока соединения, если он еще не работает"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                pass
+            elif time.monotonic() < self._retry_after:
+                raise RPCUnavailableError("RabbitMQ недоступен, ждем повторного подключения")
+            else:
+                self._ready.clear()
+                self._thread = threading.Thread(target=self._run, name="recommendation-rpc", daemon=True)
+                self._thread.start()
+
+        if self._failed and not self._ready.is_set():
+            raise RPCUnavailableError("RabbitMQ недоступен, переподключение в фоне")
+        if not self._ready.wait(self.CONNECT_TIMEOUT):
+            raise RPCUnavailableError("Не удалось подключиться к RabbitMQ")
+
+    def _run(self) -> None:
+        """Поток соединения: очередь ответов и обработка публикаций"""
+        try:
+            self._connection = pika.BlockingConnection(self._connection_params())
+            self._channel = self._connection.channel()
+            result = self._channel.queue_declare(queue='', exclusive=True)
+            self._callback_queue = result.method.queue
+            self._channel.basic_consume(
+                queue=self._callback_queue,
+                on_message_callback=self._on_response,
+                auto_ack=True
+            )
+            self._failed = False
+            self._ready.set()
+            self._channel.start_consuming()
+        except Exception as e:
+            logger.warning(f"RPC соединение с RabbitMQ потеряно: {e}")
+        finally:
+            self._ready.clear()
+            self._failed = True
+            self._retry_after = time.monotonic() + self.RECONNECT_DELAY
+            self._connection = None
+            # Ожидающие ответа запросы завершаются ошибкой сразу, а не по таймауту
+            with self._lock:
+                pending, self._futures = self._futures, {}
+            for loop, future in pending.values():
+                loop.call_soon_threadsafe(_set_exception, future, RPCUnavailableError("RPC соединение закрыто"))
+
+    def _on_response(self, ch, method, props, body: bytes) -> None:
+        with self._lock:
+            entry = self._futures.pop(props.correlation_id, None)
+        if entry is not None:
+            loop, future = entry
+            loop.call_soon_threadsafe(_set_result, future, body)
+
+    def _publish(self, correlation_id: str, body: bytes, timeout: float) -> None:
+        self._channel.basic_publish(
+            exchange='',
+            routing_key=self.queue,
+            properties=pika.BasicProperties(
+                reply_to=self._callback_queue,
+                correlation_id=correlation_id,
+                # Не дождавшийся обработки запрос брокер удалит сам
+                expiration=str(max(1, int(timeout * 1000)))
+            ),
+            body=body
+        )
+
+    async def call(self, payload: Dict, timeout: float) -> Dict:
+        """
+        RPC вызов с дедлайном.
+
+        Args:
+            payload: Тело запроса
+            timeout: Время ожидания ответа (сек)
+
+        Raises:
+            RPCUnavailableError: Нет соединения или ответ не пришел вовремя
+        """
+        await asyncio.to_thread(self._ensure_started)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        correlation_id = uuid.uuid4().hex
+        body = json.dumps({**payload, "deadline": time.time() + timeout}).encode()
+
+        with self._lock:
+            self._futures[correlation_id] = (loop, future)
+        try:
+            connection = self._connection
+            if connection is None:
+                raise RPCUnavailableError("RPC соединение закрыто")
+            try:
+                connection.add_callback_threadsafe(functools.partial(self._publish, correlation_id, body, timeout))
+            except (pika.exceptions.AMQPError, OSError) as e:
+                # Соединение закрылось после проверки выше
+                raise RPCUnavailableError(f"RPC соединение закрыто: {e!r}")
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RPCUnavailableError(f"Воркер не ответил за {timeout:.2f}s")
+        finally:
+            with self._lock:
+                self._futures.pop(correlation_id, None)
+
+        return json.loads(response)
+
+    async def recommend(self, user_id: int, count: int, exclude=None, timeout: Optional[float] = None,
+                        cart=None) -> Dict:
+        """
+        Рекомендации пользователю от воркера инференса.
+
+        Товары корзины (cart) воркер добавляет к вектору пользователя на лету.
+        """
+        payload = {"user_id": user_id, "count": count, "exclude": list(exclude or [])}
+        if cart:
+            payload["cart"] = list(cart)
+        response = await self.call(
+            payload,
+            timeout if timeout is not None else get_settings().RECOMMENDATION_RPC_TIMEOUT
+        )
+        if response.get("status") != "ok":
+            raise RPCUnavailableError(response.get("error", "Ошибка воркера инференса"))
+        return response
+
+
+def _set_result(future: asyncio.Future, value) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+rpc_client = RecommendationRPCClient()
@@ -0,0 +1,76 @@
+# app/services/serialization.py
+"""
+Быстрая сериализация кешей и ответов API.
+
+Значения в Redis хранятся байтами с однобайтовым префиксом формата:
+b"M" - msgpack, b"J" - JSON. Читатель определяет формат по префиксу,
+поэтому API и воркер с разным набором пакетов понимают записи друг друга,
+а значения без префикса (JSON, записанный до перехода) читаются как JSON.
+
+JSON кодируется orjson, если он установлен (в несколько раз быстрее
+stdlib и сразу дает bytes), иначе stdlib json с тем же компактным видом.
+"""
+import json
+from typing import Any, Union
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_PREFIX = b"M"
+JSON_PREFIX = b"J"
+
+
+def json_bytes(data: Any) -> bytes:
+    """Компактный UTF-8 JSON (без пробелов и экранирования не-ASCII)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(data: Any) -> bytes:
+    """Значение для кеша: msgpack, если установлен, иначе JSON"""
+    if msgpack is not None:
+        return MSGPACK_PREFIX + msgpack.packb(data, use_bin_type=True)
+    return JSON_PREFIX + json_bytes(data)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Чтение значения кеша любого из форматов dumps и JSON без префикса"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    prefix, body = data[:1], data[1:]
+    if prefix == MSGPACK_PREFIX:
+        if msgpack is None:
+            raise ValueError("Значение кеша записано в msgpack, но пакет msgpack не установлен")
+        return msgpack.unpackb(body, raw=False)
+    if prefix == JSON_PREFIX:
+        return json_loads(body)
+    return json_loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON ответ через json_bytes.
+
+    Используется как класс ответа приложения по умолчанию. Горячие
+    списочные эндпоинты возвращают его напрямую из словарей доверенного
+    кеша или воркера: FastAPI не валидирует возвращенный Response по
+    response_model, поэтому модели на каждый элемент не создаются.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json_bytes(content)
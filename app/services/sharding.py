@@ -0,0 +1,315 @@
+# app/services/sharding.py
+"""
+Шардирование TF-IDF модели по пользователям.
+
+Пользователи распределяются по шардам хешем id. Шард держит только свои
+строки нормированной TF-IDF матрицы и матрицы покупок и отвечает на два
+запроса: векторы своих пользователей и локальный top-K соседей для
+присланных векторов. Координатор получает векторы запрошенных
+пользователей с их домашних шардов, рассылает их всем шардам, сливает
+частичные top-K в глобальный и агрегирует кандидатов по формуле
+RecommendationService.generate_recommendations_batch, поэтому результат
+совпадает с нешардированной моделью.
+
+Шард читает из артефакта только свои строки, IDF считается по
+сохраненному в артефакте числу покупателей товаров; координатор читает
+только id и частоту товаров. Прореживание (PRUNE_*) зависит от всей
+матрицы, поэтому с ним оба загружают артефакт целиком.
+
+Транспорт передается координатору объектом с методом
+gather({шард: запрос}) -> {шард: ответ}: в ml_worker это RabbitMQ,
+в тестах - вызов шардов в том же процессе.
+"""
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from scipy.sparse import csr_matrix
+
+from database.config import get_settings
+from services.id_index import IdIndex
+from services.model_artifact import load_artifact, load_artifact_columns, load_artifact_rows
+from services.pruning import PruningConfig
+
+logger = logging.getLogger(__name__)
+
+# Мультипликативный хеш Кнута: соседние id попадают в разные шарды
+HASH_MULTIPLIER = 2654435761
+
+
+def shard_of(user_ids, n_shards: int) -> np.ndarray:
+    """Номер шарда для каждого id пользователя"""
+    ids = np.asarray(user_ids, dtype=np.uint64)
+    hashed = ((ids * np.uint64(HASH_MULTIPLIER)) & np.uint64(0xFFFFFFFF)) >> np.uint64(16)
+    return (hashed % np.uint64(n_shards)).astype(np.int64)
+
+
+def _pruning_active() -> bool:
+    return PruningConfig.from_settings(get_settings()).active
+
+
+def _popular_products(frequency: np.ndarray, product_ids: np.ndarray) -> List[int]:
+    """Топ-100 товаров по частоте, как RecommendationService._update_frequency"""
+    top = np.argsort(-frequency, kind="stable")[:100]
+    return product_ids[top[frequency[top] > 0]].tolist()
+
+
+def _trained_service(path):
+    """
+    Сервис без БД, обученный по всему артефакту (каталог товаров не
+    загружается); нужен только при прореживании.
+    """
+    from services.recommendation_service import RecommendationService
+
+    artifact = load_artifact(path)
+    service = RecommendationService(session=None)
+    service.redis = None
+    # Соседей считают шарды по присланным векторам, граф всех пользователей не нужен
+    service.knn_k = 0
+    service.set_interactions(artifact.matrix, artifact.user_ids, artifact.product_ids)
+    service.model_version = artifact.version
+    return service
+
+
+class ShardModel:
+    """Строки модели для пользователей одного шарда"""
+
+    def __init__(self, shard: int, n_shards: int, user_ids: np.ndarray, normalized: csr_matrix,
+                 purchases: csr_matrix, model_version: Optional[str] = None):
+        self.shard = shard
+        self.n_shards = n_shards
+        self.user_index = IdIndex(user_ids, dtype=user_ids.dtype)
+        self.normalized = normalized
+        self.purchases = purchases
+        self.model_version = model_version
+
+    @classmethod
+    def from_service(cls, service, shard: int, n_shards: int) -> "ShardModel":
+        """Срез строк шарда из обученного сервиса"""
+        if not service._is_trained:
+            service.train_model()
+        normalized, purchases, _ = service._scoring_matrices()
+        rows = np.flatnonzero(shard_of(service.user_index.ids, n_shards) == shard)
+        return cls(shard, n_shards, service.user_index.ids[rows], normalized[rows], purchases[rows],
+                   service.model_version)
+
+    @classmethod
+    def from_artifact(cls, path, shard: int, n_shards: int) -> "ShardModel":
+        """
+        Шард из артефакта: в память читаются только строки шарда, IDF -
+        по числу покупателей товаров среди всех пользователей.
+        """
+        from services.recommendation_service import idf_from_buyers, l2_normalized, tfidf_from_idf
+
+        if _pruning_active():
+            logger.warning("Прореживание включено: шард загружает артефакт целиком")
+            return cls.from_service(_trained_service(path), shard, n_shards)
+
+        columns = load_artifact_columns(path)
+        artifact = load_artifact_rows(path, lambda user_ids: shard_of(user_ids, n_shards) == shard)
+        float_dtype = np.float32 if get_settings().MODEL_COMPACT else np.float64
+        tf = csr_matrix(artifact.matrix, dtype=float_dtype)
+        normalized = l2_normalized(tfidf_from_idf(tf, idf_from_buyers(columns.n_users, columns.buyers), float_dtype))
+        purchases = csr_matrix((np.ones(tf.nnz, dtype=np.float32), tf.indices, tf.indptr), shape=tf.shape)
+        return cls(shard, n_shards, artifact.user_ids, normalized, purchases, artifact.version)
+
+    def vectors(self, user_ids: List[int]) -> Dict[str, Dict]:
+        """Нормированные TF-IDF строки своих пользователей (столбцы и значения)"""
+        result = {}
+        positions = self.user_index.positions(user_ids)
+        for user_id, row in zip(user_ids, positions.tolist()):
+            if row < 0:
+                continue
+            start, end = self.normalized.indptr[row], self.normalized.indptr[row + 1]
+            result[str(user_id)] = {
+                "cols": self.normalized.indices[start:end].tolist(),
+                "values": self.normalized.data[start:end].tolist(),
+            }
+        return result
+
+    def neighbors(self, queries: List[Dict], k: int) -> List[Dict]:
+        """
+        Локальный top-K соседей с положительным сходством для каждого запроса.
+
+        Соседи возвращаются вместе со столбцами их покупок, чтобы координатор
+        агрегировал кандидатов без повторного обращения к шардам.
+        """
+        if not queries or len(self.user_index) == 0:
+            return [{"user_ids": [], "sims": [], "cols": []} for _ in queries]
+
+        lengths = [len(query["cols"]) for query in queries]
+        vectors = csr_matrix(
+            (
+                np.concatenate([query["values"] for query in queries]).astype(self.normalized.dtype),
+                np.concatenate([query["cols"] for query in queries]).astype(np.int64),
+                np.concatenate([[0], np.cumsum(lengths)]),
+            ),
+            shape=(len(queries), self.normalized.shape[1])
+        )
+        similarities = (vectors @ self.normalized.T).toarray()
+
+        # Запрошенный пользователь не сосед самому себе
+        own_rows = self.user_index.positions([query["user_id"] for query in queries])
+        local = own_rows >= 0
+        similarities[np.flatnonzero(local), own_rows[local]] = -1
+
+        k = min(k, similarities.shape[1])
+        top = np.argpartition(similarities, -k, axis=1)[:, -k:]
+        results = []
+        for query_idx in range(len(queries)):
+            rows = top[query_idx]
+            sims = similarities[query_idx, rows]
+            rows = rows[sims > 0]
+            results.append({
+                "user_ids": self.user_index.ids[rows].tolist(),
+                "sims": similarities[query_idx, rows].tolist(),
+                "cols": [
+                    self.purchases.indices[self.purchases.indptr[row]:self.purchases.indptr[row + 1]].tolist()
+                    for row in rows
+                ],
+            })
+        return results
+
+    def handle(self, request: Dict) -> Dict:
+        """Обработка запроса координатора"""
+        response = {"status": "ok", "shard": self.shard, "model_version": self.model_version}
+        op = request.get("op")
+        if op == "vectors":
+            response["vectors"] = self.vectors([int(user_id) for user_id in request["user_ids"]])
+        elif op == "neighbors":
+            response["neighbors"] = self.neighbors(request["queries"], int(request["k"]))
+        else:
+            return {"status": "error", "error": f"Неизвестная операция шарда: {op}"}
+        return response
+
+
+class LocalTransport:
+    """Транспорт к шардам в том же процессе (тесты и отладка)"""
+
+    def __init__(self, shards: List[ShardModel]):
+        self.shards = shards
+
+    def gather(self, requests: Dict[int, Dict]) -> Dict[int, Dict]:
+        return {shard: self.shards[shard].handle(request) for shard, request in requests.items()}
+
+
+class ShardCoordinator:
+    """Слияние частичных top-K шардов и агрегация кандидатов"""
+
+    def __init__(self, transport, n_shards: int, product_ids: np.ndarray, popularity: np.ndarray,
+                 popular_products: List[int], model_version: Optional[str] = None):
+        self.transport = transport
+        self.n_shards = n_shards
+        self.product_ids = product_ids
+        self.popularity = popularity
+        self.popular_products = popular_products
+        self.model_version = model_version
+
+    @classmethod
+    def from_service(cls, service, transport, n_shards: int) -> "ShardCoordinator":
+        """Координатору нужны только id и популярность товаров, не матрица"""
+        frequency = service.product_frequency.astype(np.float64)
+        popularity = frequency / frequency.max() if frequency.max() > 0 else frequency
+        return cls(transport, n_shards, service.product_index.ids.copy(), popularity,
+                   list(service.popular_products), service.model_version)
+
+    @classmethod
+    def from_artifact(cls, path, transport, n_shards: int) -> "ShardCoordinator":
+        """Координатор из артефакта: матрица не загружается, только статистика товаров"""
+        if _pruning_active():
+            return cls.from_service(_trained_service(path), transport, n_shards)
+
+        columns = load_artifact_columns(path)
+        frequency = columns.frequency
+        popularity = frequency / frequency.max() if len(frequency) and frequency.max() > 0 else frequency
+        return cls(transport, n_shards, columns.product_ids, popularity,
+                   _popular_products(frequency, columns.product_ids), columns.version)
+
+    def _gather(self, requests: Dict[int, Dict]) -> Dict[int, Dict]:
+        responses = self.transport.gather(requests)
+        for shard, response in responses.items():
+            if response.get("status") != "ok":
+                raise RuntimeError(f"Шард {shard}: {response.get('error', 'ошибка')}")
+        versions = {response.get("model_version") for response in responses.values()}
+        if versions != {self.model_version}:
+            logger.warning(f"Версии модели шардов {sorted(map(str, versions))} "
+                           f"отличаются от координатора {self.model_version}")
+        return responses
+
+    def recommend_batch(
+            self,
+            user_ids: List[int],
+            k_neighbors: int = 30,
+            n_recommendations: int = 10
+    ) -> Dict[int, Tuple[List[int], List[float]]]:
+        """
+        Рекомендации пакета пользователей по всем шардам.
+
+        Returns:
+            Dict: {user_id: (id товаров, оценки)}, как generate_recommendations_batch
+        """
+        results = {}
+        popular = self.popular_products[:n_recommendations]
+        unique_ids = [int(user_id) for user_id in dict.fromkeys(user_ids)]
+        if not unique_ids:
+            return results
+
+        # Векторы пользователей с их домашних шардов
+        homes = shard_of(unique_ids, self.n_shards)
+        vector_requests = {
+            int(shard): {"op": "vectors", "user_ids": [uid for uid, home in zip(unique_ids, homes) if home == shard]}
+            for shard in np.unique(homes)
+        }
+        vectors = {}
+        for response in self._gather(vector_requests).values():
+            vectors.update(response["vectors"])
+
+        queries = []
+        for user_id in unique_ids:
+            vector = vectors.get(str(user_id))
+            if vector is None:
+                results[user_id] = (popular, [0.5] * len(popular))
+            else:
+                queries.append({"user_id": user_id, **vector})
+        if not queries:
+            return results
+
+        # Частичные top-K со всех шардов
+        responses = self._gather({
+            shard: {"op": "neighbors", "queries": queries, "k": k_neighbors} for shard in range(self.n_shards)
+        })
+
+        for query_idx, query in enumerate(queries):
+            partials = [response["neighbors"][query_idx] for response in responses.values()]
+            results[query["user_id"]] = self._aggregate(partials, query["cols"], k_neighbors,
+                                                        n_recommendations, popular)
+        return results
+
+    def _aggregate(self, partials: List[Dict], own_cols: List[int], k: int, n: int,
+                   popular: List[int]) -> Tuple[List[int], List[float]]:
+        """Глобальный top-K соседей и оценки товаров, как в пакетном скоринге"""
+        sims = np.array([sim for partial in partials for sim in partial["sims"]], dtype=np.float64)
+        neighbor_cols = [cols for partial in partials for cols in partial["cols"]]
+        if len(sims) == 0:
+            return popular, [0.3] * len(popular)
+
+        top = np.argsort(-sims, kind="stable")[:k]
+        lengths = [len(neighbor_cols[idx]) for idx in top]
+        if sum(lengths) == 0:
+            return popular, [0.3] * len(popular)
+        cols = np.concatenate([neighbor_cols[idx] for idx in top]).astype(np.int64)
+        weights = np.repeat(sims[top], lengths)
+
+        candidates, inverse = np.unique(cols, return_inverse=True)
+        sim_sum = np.bincount(inverse, weights=weights)
+        neighbor_count = np.bincount(inverse)
+        own = np.isin(candidates, own_cols).astype(np.float64)
+
+        # Бонус 0.3 за уже купленные товары, как в generate_recommendations_tfidf
+        avg_similarity = sim_sum * (1 + 0.3 * own) / (neighbor_count * (1 + own))
+        scores = 0.7 * avg_similarity + 0.3 * self.popularity[candidates]
+
+        best = np.argsort(-scores, kind="stable")[:n]
+        return (
+            self.product_ids[candidates[best]].tolist(),
+            [min(float(score), 1.0) for score in scores[best]]
+        )
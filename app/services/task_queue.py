@@ -0,0 +1,52 @@
+# app/services/task_queue.py
+from typing import Dict
+import logging
+import json
+import time
+import pika
+
+from database.config import get_settings
+from services.metrics import rabbitmq_publish_duration, rabbitmq_publish_failures
+
+logger = logging.getLogger(__name__)
+
+ML_TASK_QUEUE = "ml_task_queue"
+
+
+def publish_task(task_data: Dict, queue: str = ML_TASK_QUEUE) -> bool:
+    """
+    Отправка задачи ML воркеру через RabbitMQ.
+
+    Args:
+        task_data: Данные задачи (сериализуются в JSON)
+        queue: Имя очереди
+
+    Returns:
+        bool: True если задача отправлена
+    """
+    settings = get_settings()
+    started = time.perf_counter()
+    try:
+        credentials = pika.PlainCredentials(settings.RABBITMQ_USER, settings.RABBITMQ_PASS)
+        parameters = pika.ConnectionParameters(
+            host=settings.RABBITMQ_HOST,
+            port=settings.RABBITMQ_PORT,
+            credentials=credentials
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.queue_declare(queue=queue)
+
+        channel.basic_publish(
+            exchange='',
+            routing_key=queue,
+            body=json.dumps(task_data)
+        )
+        connection.close()
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send to RabbitMQ: {e}")
+        rabbitmq_publish_failures.inc(queue=queue)
+        return False
+    finally:
+        rabbitmq_publish_duration.observe(time.perf_counter() - started, queue=queue)
@@ -0,0 +1,266 @@
+# app/services/warmup.py
+"""
+Фоновый прогрев приложения после запуска.
+
+Ожидание БД с повторными попытками, первичный импорт данных и загрузка
+модели выполняются в отдельном потоке, поэтому API принимает запросы
+сразу после старта. Ход прогрева отдается эндпоинтом /ready.
+
+Без предзагрузки модели API работает (популярные товары читаются из БД,
+рекомендации считает RPC воркер), поэтому ошибка этого этапа переводит
+его в degraded: /ready отвечает 200, а загрузка повторяется с растущей
+задержкой.
+"""
+import sys
+import time
+import logging
+import subprocess
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, SQLModel
+
+from database.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+STAGES = ["database", "import", "model"]
+DONE_STATUSES = {"done", "skipped", "degraded"}
+
+# Ключ advisory lock, чтобы первичный импорт выполняла только одна реплика
+IMPORT_LOCK_KEY = 726_001
+
+
+class WarmupState:
+    """Статусы и длительности этапов прогрева"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at: Optional[float] = None
+        self.stages: Dict[str, Dict] = {name: {"status": "pending"} for name in STAGES}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = None
+            self.stages = {name: {"status": "pending"} for name in STAGES}
+
+    @contextmanager
+    def stage(self, name: str, degrade_on_error: bool = False):
+        """
+        Замер этапа: running -> done или failed с текстом ошибки.
+
+        С degrade_on_error ошибка переводит этап в degraded, и повтор
+        этапа остается degraded до успеха, не возвращаясь в running.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            previous = self.stages[name]
+            if previous["status"] == "degraded":
+                self.stages[name] = {**previous, "attempts": previous.get("attempts", 1) + 1}
+            else:
+                self.stages[name] = {"status": "running", "started_at": datetime.utcnow().isoformat()}
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.stages[name].update(
+                    status="degraded" if degrade_on_error else "failed",
+                    error=str(e),
+                    duration_ms=round((time.perf_counter() - started) * 1000, 1)
+                )
+            raise
+        with self._lock:
+            self.stages[name].pop("error", None)
+            self.stages[name].update(status="done", duration_ms=round((time.perf_counter() - started) * 1000, 1))
+
+    def skip(self, name: str, reason: str) -> None:
+        with self._lock:
+            self.stages[name] = {"status": "skipped", "reason": reason}
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return all(stage["status"] in DONE_STATUSES for stage in self.stages.values())
+
+    def snapshot(self) -> Dict:
+        """Состояние прогрева для /ready"""
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self.stages.items()}
+            elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+
+        if any(stage["status"] == "failed" for stage in stages.values()):
+            status = "failed"
+        elif not all(stage["status"] in DONE_STATUSES for stage in stages.values()):
+            status = "warming_up"
+        elif any(stage["status"] == "degraded" for stage in stages.values()):
+            status = "degraded"
+        else:
+            status = "ready"
+
+        return {
+            "status": status,
+            "ready": status in ("ready", "degraded"),
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "stages": stages
+        }
+
+
+warmup_state = WarmupState()
+
+
+def _backoff(attempt: int, delay: float, max_delay: float) -> float:
+    return min(max_delay, delay * 2 ** (attempt - 1))
+
+
+def wait_for_database(engine: Engine, retries: int, delay: float, max_delay: float) -> int:
+    """
+    Ожидание доступности БД с экспоненциальной задержкой.
+
+    Returns:
+        int: Номер успешной попытки
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return attempt
+        except Exception as e:
+            if attempt == retries:
+                raise
+            pause = _backoff(attempt, delay, max_delay)
+            logger.warning(f"БД недоступна (попытка {attempt}/{retries}): {e}. Повтор через {pause:.1f}s")
+            time.sleep(pause)
+
+
+def _tables_exist(engine: Engine) -> bool:
+    with engine.connect() as conn:
+        return bool(conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_name = 'product')"
+        )).scalar())
+
+
+def ensure_catalog_tables(engine: Engine) -> List[str]:
+    """
+    Создание служебных таблиц каталога (catalog_version, department_aisle)
+    в БД, созданной до их появления: первичный импорт на непустой БД
+    пропускается, а create_all выполняется только в init_db.
+
+    Returns:
+        List[str]: Созданные таблицы
+    """
+    from models.catalog import CatalogVersion, DepartmentAisle
+
+    inspector = inspect(engine)
+    if not inspector.has_table("product"):
+        # Пустую БД создаст первичный импорт вместе со служебными таблицами
+        return []
+    tables = [model.__table__ for model in (CatalogVersion, DepartmentAisle)
+              if not inspector.has_table(model.__tablename__)]
+    if tables:
+        SQLModel.metadata.create_all(engine, tables=tables)
+        logger.info(f"Созданы служебные таблицы каталога: {[table.name for table in tables]}")
+    return [table.name for table in tables]
+
+
+def _import_initial_data(engine: Engine) -> bool:
+    """
+    Первичный импорт, если БД пуста.
+
+    Реплики, стартующие одновременно, ждут advisory lock, и импорт
+    запускает только первая из них.
+
+    Returns:
+        bool: Был ли выполнен импорт
+    """
+    settings = get_settings()
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": IMPORT_LOCK_KEY})
+        try:
+            if _tables_exist(engine):
+                return False
+
+            logger.info("Database is empty. Starting data import...")
+            subprocess.run([
+                sys.executable, "-m", "database.import_fast", str(settings.STARTUP_IMPORT_USERS)
+            ], check=True)
+            logger.info("Data import completed successfully!")
+            return True
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": IMPORT_LOCK_KEY})
+
+
+def _preload_model(engine: Engine) -> None:
+    """Загрузка артефакта модели (или данных из БД) и кеширование популярных товаров"""
+    from services.recommendation_service import RecommendationService
+
+    with Session(engine) as session:
+        service = RecommendationService(session)
+        service.load_latest_model() or service.load_data()
+    logger.info("Популярные товары предзагружены в кеш")
+
+
+def preload_model_with_retries(engine: Engine, state: WarmupState, retries: int, delay: float,
+                               max_delay: float) -> bool:
+    """
+    Этап model: предзагрузка с повторами, ошибка не снимает готовность.
+
+    Returns:
+        bool: Удалась ли предзагрузка
+    """
+    for attempt in range(1, retries + 1):
+        try:
+            with state.stage("model", degrade_on_error=True):
+                _preload_model(engine)
+            return True
+        except Exception as e:
+            if attempt == retries:
+                logger.error(f"Предзагрузка модели не удалась после {retries} попыток: {e}. "
+                             f"API работает без нее")
+                return False
+            pause = _backoff(attempt, delay, max_delay)
+            logger.warning(f"Предзагрузка модели не удалась (попытка {attempt}/{retries}): {e}. "
+                           f"Повтор через {pause:.1f}s")
+            time.sleep(pause)
+    return False
+
+
+def run_warmup(engine: Optional[Engine] = None, state: WarmupState = warmup_state) -> None:
+    """Прогрев: ожидание БД, первичный импорт и загрузка модели"""
+    settings = get_settings()
+    if engine is None:
+        from database.database import engine
+
+    state.reset()
+    state.started_at = time.perf_counter()
+
+    try:
+        with state.stage("database"):
+            wait_for_database(
+                engine,
+                retries=settings.STARTUP_DB_RETRIES,
+                delay=settings.STARTUP_DB_RETRY_DELAY,
+                max_delay=settings.STARTUP_DB_RETRY_MAX_DELAY
+            )
+            ensure_catalog_tables(engine)
+
+        if engine.dialect.name != "postgresql":
+            state.skip("import", f"первичный импорт не поддерживается для {engine.dialect.name}")
+        elif _tables_exist(engine):
+            state.skip("import", "БД уже инициализирована")
+        else:
+            with state.stage("import"):
+                if not _import_initial_data(engine):
+                    logger.info("Импорт выполнен другой репликой")
+
+        preload_model_with_retries(
+            engine,
+            state,
+            retries=settings.STARTUP_MODEL_RETRIES,
+            delay=settings.STARTUP_DB_RETRY_DELAY,
+            max_delay=settings.STARTUP_DB_RETRY_MAX_DELAY
+        )
+    except Exception as e:
+        logger.error(f"Ошибка прогрева приложения: {e}")
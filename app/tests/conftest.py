@@ -16,6 +16,7 @@ from models.user import User
 from models.product import Product
 from models.department import Department
 from models.aisle import Aisle
+from services.catalog_service import clear_catalog_cache
 
 
 @pytest.fixture(name="session")
@@ -27,6 +28,8 @@ def session_fixture():
         poolclass=StaticPool
     )
     SQLModel.metadata.create_all(engine)
+    # Кеши каталога живут на уровне процесса и не должны переживать тест
+    clear_catalog_cache()
 
     with Session(engine) as session:
         # Создаем тестовые данные
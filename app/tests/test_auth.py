@@ -81,4 +81,31 @@ def test_create_test_user(client: TestClient):
         "password": "admin123"
     }
     response = client.post("/auth/login", json=login_data)
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_login_rehashes_outdated_hash(client: TestClient, session: Session):
+    """Тест пересчета хеша с устаревшей стоимостью bcrypt при входе"""
+    from passlib.context import CryptContext
+    from auth.hash_password import settings as hash_settings
+
+    old_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+    user = User(email="legacy@example.com", name="Legacy", password_hash=old_context.hash("legacy123"))
+    session.add(user)
+    session.commit()
+
+    response = client.post("/auth/login", json={"email": "legacy@example.com", "password": "legacy123"})
+    assert response.status_code == 200
+
+    session.refresh(user)
+    assert user.password_hash.startswith(f"$2b${hash_settings.BCRYPT_ROUNDS:02d}$")
+
+
+def test_login_rejected_when_hash_pool_busy(client: TestClient, monkeypatch):
+    """Тест 503 при переполненной очереди хеширования"""
+    from auth.hash_password import settings as hash_settings
+
+    monkeypatch.setattr(hash_settings, "PASSWORD_HASH_QUEUE_LIMIT", 0)
+
+    response = client.post("/auth/login", json={"email": "test@example.com", "password": "password123"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
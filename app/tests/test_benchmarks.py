@@ -0,0 +1,53 @@
+import numpy as np
+from benchmarks.synthetic import SyntheticConfig, generate
+from benchmarks.recommendation_engine import run_scale, compare
+
+
+def test_synthetic_generator_is_deterministic_and_skewed():
+    """Тест генератора: воспроизводимость по seed и перекос популярности по Ципфу"""
+    config = SyntheticConfig(users=300, products=1000, zipf_s=1.2, seed=7)
+    first, second = generate(config), generate(config)
+
+    assert np.array_equal(first.item_product, second.item_product)
+    assert first.order_user.max() == config.users
+    assert first.item_product.min() >= 1 and first.item_product.max() <= config.products
+    # Пара (заказ, товар) встречается один раз, повторы схлопнуты в количество
+    keys = (first.item_order << 32) | first.item_product
+    assert len(np.unique(keys)) == len(keys)
+
+    # Топ-1% товаров собирает заметную долю покупок
+    counts = np.sort(np.bincount(first.item_product, minlength=config.products + 1))[::-1]
+    assert counts[:10].sum() / counts.sum() > 0.2
+
+
+def test_benchmark_runs_on_prebuilt_arrays():
+    """Тест прогона всех этапов бенчмарка на артефакте из массивов"""
+    result = run_scale(SyntheticConfig(users=100, products=200), source="arrays",
+                       sample_size=5, trace_memory=False)
+
+    phases = result["phases"]
+    assert list(phases) == ["load_model", "train_model", "knn_graph", "recommend_tfidf",
+                            "recommend_batch", "get_recommendations"]
+    assert all(stats["seconds"] >= 0 for stats in phases.values())
+
+    assert compare({"tiny": result}, {"tiny": result}) == []
+
+
+def test_compare_flags_slowdown_and_memory_growth():
+    """Тест порогов сравнения: шум игнорируется, замедление и рост памяти - регрессия"""
+    def result(seconds, peak_mb, source="sqlite"):
+        return {"source": source, "phases": {"load_data": {"seconds": seconds, "peak_mb": peak_mb}}}
+
+    baseline = {"small": result(1.0, 20.0)}
+
+    assert compare({"small": result(1.4, 24.0)}, baseline) == []
+    # Кратное замедление быстрого этапа в пределах шума не считается
+    assert compare({"small": result(0.04, 20.0)}, {"small": result(0.01, 20.0)}) == []
+
+    regressions = compare({"small": result(2.0, 40.0)}, baseline)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("small/load_data: время")
+    assert regressions[1].startswith("small/load_data: память")
+
+    # Baseline другого источника данных не сравнивается
+    assert compare({"small": result(2.0, 40.0, source="arrays")}, baseline) == []
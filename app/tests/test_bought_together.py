@@ -0,0 +1,53 @@
+import numpy as np
+from fastapi.testclient import TestClient
+from database.config import get_settings
+from services import bought_together
+
+BASKETS = {1: [1, 2, 3], 2: [1, 2, 99], 3: [1, 2, 4], 4: [3, 4], 5: [3, 4, 5], 6: [5, 5], 7: [6]}
+
+
+def _lines():
+    order_ids = [order for order, products in BASKETS.items() for _ in products]
+    product_ids = [product for products in BASKETS.values() for product in products]
+    return np.array(order_ids), np.array(product_ids)
+
+
+def test_partners_ranked_by_pmi():
+    """Тест индекса: редкие пары отбрасываются, партнеры упорядочены по PMI"""
+    index = bought_together.build_index(*_lines(), top_k=5, min_count=2)
+
+    products, scores = index.partners(1)
+    # 1 и 2 вместе в трех заказах из семи, каждый - в трех: PMI = log(3 * 7 / 9)
+    assert products == [2] and np.isclose(scores[0], np.log(7 / 3))
+    assert index.partners(3)[0] == [4]
+    assert index.partners(6) == ([], []) and index.partners(404) == ([], [])
+
+    # Корзина: партнеры суммируются, товары корзины исключаются
+    products, _ = index.for_cart([1, 3])
+    assert products == [2, 4]
+    assert index.for_cart([1, 2]) == ([], [])
+
+    # Повтор товара в заказе считается один раз, top_k ограничивает строку
+    index = bought_together.build_index(*_lines(), top_k=1, min_count=1)
+    assert index.partners(5)[0] == [3]
+    assert np.diff(index.matrix.indptr).max() == 1
+
+
+def test_bought_together_endpoints(client: TestClient, tmp_path, monkeypatch):
+    """Тест эндпоинтов: товары вне каталога пропускаются, без индекса - 503"""
+    monkeypatch.setattr(get_settings(), "MODEL_ARTIFACT_DIR", str(tmp_path))
+    assert client.get("/products/1/bought-together").status_code == 503
+
+    index = bought_together.build_index(*_lines(), min_count=1)
+    bought_together.save_index(bought_together.index_path(), index)
+
+    # Товар 99 есть в индексе, но не в каталоге
+    assert index.partners(1)[0] == [2, 99]
+    response = client.get("/products/1/bought-together?limit=5")
+    assert response.status_code == 200
+    assert [item["product_id"] for item in response.json()] == [2]
+    assert response.json()[0]["product_name"]
+
+    response = client.post("/products/bought-together", json={"product_ids": [2]})
+    assert response.status_code == 200
+    assert [item["product_id"] for item in response.json()] == [1]
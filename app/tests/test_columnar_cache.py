@@ -0,0 +1,49 @@
+import os
+import pandas as pd
+from database.columnar_cache import convert, read_table, iter_table, cached_path
+
+
+def _write_csv(tmp_path):
+    pd.DataFrame({
+        "product_id": [1, 2, 3],
+        "product_name": ["Salt, Sea", 'Chips "Extra"', "Milk"],
+        "aisle_id": [1, 1, 2],
+        "department_id": [1, 1, 2],
+    }).to_csv(tmp_path / "products.csv", index=False)
+    pd.DataFrame({
+        "order_id": [1, 1, 2, 3, 3],
+        "product_id": [1, 2, 3, 1, 3],
+        "add_to_cart_order": [1, 2, 1, 1, 2],
+        "reordered": [0, 0, 0, 1, 1],
+    }).to_csv(tmp_path / "order_products__prior.csv", index=False)
+
+
+def test_convert_and_read_back(tmp_path):
+    """Тест конвертации CSV в колоночный кеш и чтения с типами int32"""
+    _write_csv(tmp_path)
+    manifest = convert(tmp_path)
+
+    assert manifest["products"]["rows"] == 3
+    assert cached_path(tmp_path, "products") is not None
+
+    products = read_table(tmp_path, "products")
+    assert products["product_name"].tolist() == ["Salt, Sea", 'Chips "Extra"', "Milk"]
+    assert products["product_id"].dtype == "int32"
+
+    chunks = list(iter_table(tmp_path, "order_products__prior", ["order_id", "product_id"], chunksize=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert list(chunks[0].columns) == ["order_id", "product_id"]
+
+
+def test_stale_cache_falls_back_to_csv(tmp_path):
+    """Тест чтения CSV, если исходный файл изменился после конвертации"""
+    _write_csv(tmp_path)
+    convert(tmp_path)
+
+    pd.DataFrame({
+        "product_id": [7], "product_name": ["New"], "aisle_id": [1], "department_id": [1],
+    }).to_csv(tmp_path / "products.csv", index=False)
+    os.utime(tmp_path / "products.csv", (0, 0))
+
+    assert cached_path(tmp_path, "products") is None
+    assert read_table(tmp_path, "products")["product_id"].tolist() == [7]
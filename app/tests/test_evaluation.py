@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+import pytest
+from services.evaluation import build_split, evaluate, metrics_from_hits, _init_worker
+from services import evaluation
+
+
+def _write_exports(data_dir):
+    pd.DataFrame({
+        "order_id": [1, 2, 3, 4, 5, 6, 7],
+        "user_id": [1, 2, 3, 4, 1, 2, 3],
+        "eval_set": ["prior", "prior", "prior", "prior", "train", "train", "train"],
+    }).to_csv(data_dir / "orders.csv", index=False)
+    pd.DataFrame({
+        "order_id": [1, 1, 2, 2, 2, 3, 3, 4, 4],
+        "product_id": [1, 2, 1, 2, 3, 3, 4, 2, 4],
+    }).to_csv(data_dir / "order_products__prior.csv", index=False)
+    # Товар 9 не встречается в prior и не может быть угадан, но входит в recall
+    pd.DataFrame({
+        "order_id": [5, 5, 6, 7],
+        "product_id": [3, 9, 4, 1],
+    }).to_csv(data_dir / "order_products__train.csv", index=False)
+
+
+def test_split_builds_truth_from_train_orders(tmp_path):
+    """Тест истины: последний (train) заказ пользователя по столбцам модели"""
+    _write_exports(tmp_path)
+    split = build_split(tmp_path)
+
+    assert split.test_user_ids.tolist() == [1, 2, 3]
+    assert split.actual_sizes.tolist() == [2, 1, 1]
+    truth = split.truth.toarray()
+    assert truth[0].tolist() == [0, 0, 1, 0]
+    assert truth[2].tolist() == [1, 0, 0, 0]
+
+
+def test_metrics_match_notebook_loop(tmp_path):
+    """Тест векторных метрик против построчного расчета из ноутбука"""
+    _write_exports(tmp_path)
+    split = build_split(tmp_path)
+    k = 2
+
+    result = evaluate(split, k=k, workers=0)
+
+    # Построчный расчет по тем же рекомендациям
+    _init_worker(split.matrix, split.user_ids, split.product_ids)
+    recommended = evaluation._worker_service.generate_recommendations_batch(split.test_user_ids.tolist(),
+                                                                            n_recommendations=k)
+    actual = {1: {3, 9}, 2: {4}, 3: {1}}
+    precisions, recalls, hits = [], [], []
+    for user_id, products in actual.items():
+        common = products & set(recommended[user_id][0][:k])
+        precisions.append(len(common) / k)
+        recalls.append(len(common) / len(products))
+        hits.append(1 if common else 0)
+
+    assert result["tfidf"]["precision@2"] == pytest.approx(np.mean(precisions))
+    assert result["tfidf"]["recall@2"] == pytest.approx(np.mean(recalls))
+    assert result["tfidf"]["hit_rate@2"] == pytest.approx(np.mean(hits))
+    assert result["coverage"] == 1.0
+    assert result["throughput"]["users_per_second"] > 0
+
+
+def test_process_pool_matches_inline(tmp_path):
+    """Тест: пул процессов дает те же метрики, что и расчет в текущем процессе"""
+    _write_exports(tmp_path)
+    split = build_split(tmp_path)
+
+    inline = evaluate(split, k=2, workers=0, batch_size=1)
+    pooled = evaluate(split, k=2, workers=2, batch_size=1)
+
+    assert pooled["tfidf"] == inline["tfidf"]
+    assert pooled["baseline"] == inline["baseline"]
+
+
+def test_metrics_from_hits():
+    """Тест формул Precision/Recall/HitRate"""
+    metrics = metrics_from_hits(np.array([2, 0, 1]), np.array([4, 3, 1]), k=10)
+
+    assert metrics["precision@10"] == pytest.approx(0.1)
+    assert metrics["recall@10"] == pytest.approx((0.5 + 0 + 1) / 3)
+    assert metrics["hit_rate@10"] == pytest.approx(2 / 3)
+
+
+def test_pruning_reduces_model_and_coverage(tmp_path):
+    """Тест оценки с прореживанием: отчет о размере и охват только оставшихся пользователей"""
+    from services.pruning import PruningConfig
+
+    _write_exports(tmp_path)
+    split = build_split(tmp_path)
+
+    result = evaluate(split, k=2, workers=0, pruning=PruningConfig(min_user_items=3))
+
+    assert result["pruning"]["after"]["interactions"] < result["pruning"]["before"]["interactions"]
+    assert result["coverage"] < 1.0
+    assert evaluate(split, k=2, workers=0)["pruning"] is None
@@ -0,0 +1,107 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from database.config import get_settings
+from services import factor_model as factors
+from services.recommendation_service import RecommendationService, idf_weights
+
+
+def _two_groups():
+    """Две группы пользователей с непересекающимися наборами товаров 1-3 и 4-6"""
+    rows = [0, 0, 1, 1, 1, 2, 2, 3, 3, 4, 4, 4, 5, 5]
+    cols = [0, 1, 0, 1, 2, 1, 2, 3, 4, 3, 4, 5, 4, 5]
+    matrix = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(6, 6))
+    return matrix, np.arange(1, 7), np.arange(1, 7)
+
+
+def _fit(matrix, user_ids, product_ids, rank=2):
+    service = RecommendationService(session=None)
+    return factors.fit(service.tfidf_weight(matrix), idf_weights(matrix), user_ids, product_ids, rank=rank)
+
+
+def test_factors_rank_items_of_own_group():
+    """Тест ранжирования: пользователю рекомендуются товары его группы"""
+    model = _fit(*_two_groups())
+
+    assert model.item_factors.dtype == np.float32 and model.item_factors.shape == (6, 2)
+    products, scores = model.recommend(model.user_vector(1), n=3)
+    assert set(products) == {1, 2, 3}
+    assert scores == sorted(scores, reverse=True)
+    assert all(0.0 <= score <= 1.0 for score in scores)
+
+    products, _ = model.recommend(model.user_vector(5), n=2, exclude_cols=[3])
+    assert set(products) == {5, 6}
+
+
+def test_fold_in_matches_training_factors():
+    """Тест fold-in: проекция покупок пользователя совпадает с его фактором"""
+    matrix, user_ids, product_ids = _two_groups()
+    model = _fit(matrix, user_ids, product_ids)
+
+    folded = model.fold_in_products([1, 2, 3])
+    assert np.allclose(folded, model.user_vector(2), atol=1e-5)
+    # Неизвестные модели товары пропускаются
+    assert not np.any(model.fold_in_products([99]))
+    # Повторы товара складываются, как количества в одной строке
+    assert np.allclose(model.fold_in_products([1, 1, 2], [1, 2, 3]), model.fold_in_products([1, 2], [3, 3]))
+
+
+def test_factors_round_trip_with_mmap(tmp_path):
+    """Тест сохранения факторов и загрузки через mmap"""
+    model = _fit(*_two_groups())
+    path = factors.save_factors(factors.factors_path(tmp_path, "v1", 2), model)
+
+    loaded = factors.load_factors(path)
+    assert isinstance(loaded.item_factors, np.memmap)
+    # Индексы id ищут по отображенным массивам, без словарей и копий
+    assert np.shares_memory(loaded.user_index.ids, loaded.user_ids)
+    assert loaded.user_vector(99) is None
+    assert np.array_equal(loaded.user_factors, model.user_factors)
+    assert loaded.recommend(loaded.user_vector(4), n=2) == model.recommend(model.user_vector(4), n=2)
+
+
+def test_service_svd_reuses_saved_factors(tmp_path, monkeypatch):
+    """Тест сервиса: факторы версии артефакта обучаются один раз и переиспользуются"""
+    monkeypatch.setattr(get_settings(), "MODEL_ARTIFACT_DIR", str(tmp_path))
+    matrix, user_ids, product_ids = _two_groups()
+
+    service = RecommendationService(session=None)
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.model_version = "v1"
+    service.train_model()
+    assert service.train_factor_model(rank=2)["loaded"] == "trained"
+
+    products, _ = service.generate_recommendations_svd(6, n_recommendations=3)
+    assert set(products) == {4, 5, 6}
+
+    other = RecommendationService(session=None)
+    other.set_interactions(matrix, user_ids, product_ids)
+    other.model_version = "v1"
+    other.train_model()
+    assert other.train_factor_model(rank=2)["loaded"] == "from_disk"
+    # Пользователь без покупок получает популярные товары
+    assert other.generate_recommendations_svd(42, n_recommendations=2)[1] == [0.5, 0.5]
+
+
+def test_service_refits_factors_for_other_index(tmp_path, monkeypatch):
+    """Тест сервиса: факторы той же версии с другим набором товаров не используются"""
+    monkeypatch.setattr(get_settings(), "MODEL_ARTIFACT_DIR", str(tmp_path))
+    matrix, user_ids, product_ids = _two_groups()
+
+    service = RecommendationService(session=None)
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.model_version = "v1"
+    service.train_model()
+    service.train_factor_model(rank=2)
+
+    # Та же версия без товара 1, как при другом прореживании
+    pruned = RecommendationService(session=None)
+    pruned.set_interactions(matrix[:, 1:], user_ids, product_ids[1:])
+    pruned.model_version = "v1"
+    pruned.train_model()
+    assert pruned.train_factor_model(rank=2)["loaded"] == "trained"
+    assert np.array_equal(pruned.factor_model.product_ids, product_ids[1:])
+    products, _ = pruned.generate_recommendations_svd(6, n_recommendations=3)
+    assert set(products) <= {4, 5, 6}
+
+    # Сохраненные факторы исходного индекса не перезаписаны
+    assert service.train_factor_model(rank=2)["loaded"] == "from_disk"
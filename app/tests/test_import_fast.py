@@ -0,0 +1,26 @@
+import csv
+import io
+import pandas as pd
+from database.import_fast import frame_to_csv, StageStats, stage
+
+
+def test_frame_to_csv_quotes_names():
+    """Тест сериализации строк с запятыми и кавычками для COPY"""
+    df = pd.DataFrame({"id": [1, 2], "name": ['Salt, Sea', 'Chips "Extra"']})
+
+    rows = list(csv.reader(io.StringIO(frame_to_csv(df).decode("utf-8"))))
+
+    assert rows == [["1", "Salt, Sea"], ["2", 'Chips "Extra"']]
+
+
+def test_stage_reports_rows_per_second():
+    """Тест замера скорости этапа импорта"""
+    report = []
+    with stage("test", report) as stats:
+        stats.add(100)
+        stats.add(50)
+
+    assert len(report) == 1
+    assert report[0].rows == 150
+    assert report[0].rows_per_second > 0
+    assert isinstance(report[0], StageStats)
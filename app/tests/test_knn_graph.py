@@ -0,0 +1,87 @@
+import numpy as np
+from scipy.sparse import random as sparse_random, vstack
+from sklearn.preprocessing import normalize
+from database.config import get_settings
+from services import knn_graph
+from services.recommendation_service import RecommendationService
+
+
+def _interactions(users=60, products=40, seed=3):
+    matrix = sparse_random(users, products, density=0.15, format="csr", random_state=seed, dtype=np.float64)
+    matrix.data = np.ceil(matrix.data * 3)
+    return matrix, np.arange(1, users + 1), np.arange(1, products + 1)
+
+
+def _rows(graph):
+    return [
+        (cols.tolist(), np.round(sims, 5).tolist())
+        for cols, sims in (graph.neighbors(row) for row in range(graph.matrix.shape[0]))
+    ]
+
+
+def test_graph_matches_brute_force_and_online_scoring():
+    """Тест графа: соседи совпадают с полным перебором, рекомендации - с расчетом на лету"""
+    matrix, user_ids, product_ids = _interactions()
+    service = RecommendationService(session=None)
+    service.knn_k = 5
+    service.set_interactions(matrix, user_ids, product_ids)
+    # Модель без артефакта: онлайн обучение граф не строит
+    assert "knn_graph" not in service.train_model() and service.knn_graph is None
+    assert service.train_knn_graph()["loaded"] == "built"
+
+    normalized, _, _ = service._scoring_matrices()
+    similarities = (normalized @ normalized.T).toarray()
+    np.fill_diagonal(similarities, -1)
+    cols, sims = service.knn_graph.neighbors(7)
+    assert np.allclose(sims, np.sort(similarities[7])[::-1][:5], atol=1e-6)
+    assert list(sims) == sorted(sims, reverse=True)
+
+    with_graph = {user_id: service.generate_recommendations_tfidf(user_id, k_neighbors=5) for user_id in (1, 8, 30)}
+    service.knn_graph = None
+    for user_id, (products, scores) in with_graph.items():
+        online_products, online_scores = service.generate_recommendations_tfidf(user_id, k_neighbors=5)
+        assert products == online_products
+        assert np.allclose(scores, online_scores, atol=1e-5)
+
+
+def test_incremental_update_matches_rebuild():
+    """Тест обновления графа: измененные и новые строки дают тот же граф, что и полное построение"""
+    matrix, user_ids, _ = _interactions()
+    before = normalize(matrix.astype(np.float32))
+    graph = knn_graph.build_graph(before, user_ids, k=4)
+
+    # Два пользователя меняют покупки, двое появляются
+    changed = matrix.tolil()
+    changed[3, :] = 0
+    changed[3, [0, 1, 2]] = 2
+    changed[10, 5] = 4
+    extra = sparse_random(2, matrix.shape[1], density=0.3, format="lil", random_state=9)
+    after = normalize(vstack([changed.tocsr(), extra.tocsr()]).astype(np.float32)).tocsr()
+    after_ids = np.arange(1, after.shape[0] + 1)
+
+    updated = graph.update(after, after_ids, [3, 10])
+    assert _rows(updated) == _rows(knn_graph.build_graph(after, after_ids, k=4))
+
+
+def test_service_reuses_saved_graph(tmp_path, monkeypatch):
+    """Тест сохранения графа с версией модели и загрузки без пересчета"""
+    monkeypatch.setattr(get_settings(), "MODEL_ARTIFACT_DIR", str(tmp_path))
+    matrix, user_ids, product_ids = _interactions()
+
+    def trained():
+        service = RecommendationService(session=None)
+        service.knn_k = 5
+        service.set_interactions(matrix, user_ids, product_ids)
+        service.model_version = "v1"
+        return service, service.train_model().get("knn_graph")
+
+    # Обучение версии без сохраненного графа его не строит, граф строит офлайн шаг
+    first, stats = trained()
+    assert stats is None and first.knn_graph is None
+    assert first.train_knn_graph()["loaded"] == "built"
+    assert knn_graph.graph_path(tmp_path, "v1", 5).exists()
+
+    second, stats = trained()
+    assert stats["loaded"] == "from_disk"
+    assert _rows(second.knn_graph) == _rows(first.knn_graph)
+    assert second.memory_footprint()["components"]["knn_graph"] > 0
@@ -0,0 +1,21 @@
+import asyncio
+from benchmarks.load_test import run_in_process
+from benchmarks.synthetic import SyntheticConfig
+
+
+def test_load_test_reports_endpoints_with_standins():
+    """Тест короткого прогона нагрузки: перцентили по эндпоинтам и очередь в памяти"""
+    mix = {"browse": 1, "add_to_cart": 1, "order": 1, "recommendations": 1}
+    result = asyncio.run(run_in_process(
+        SyntheticConfig(users=20, products=100), rps=40, duration=1, mix=mix, seed=1
+    ))
+
+    endpoints = result["endpoints"]
+    assert {"GET /products/", "GET /products/{id}", "POST /orders/",
+            "GET /recommendations/?collaborative"} <= set(endpoints)
+    assert result["error_rate"] == 0
+    assert result["dropped_actions"] == 0
+    assert endpoints["GET /products/"]["p99"] >= endpoints["GET /products/"]["p50"] > 0
+
+    # У синтетических пользователей уже есть заказы, поэтому каждый новый ставит задачу
+    assert result["queued_tasks"]["ml_task_queue"] == endpoints["POST /orders/"]["statuses"]["200"]
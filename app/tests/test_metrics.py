@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+from database import instrumentation
+from services.metrics import Histogram, Counter, Registry, rabbitmq_publish_failures, db_pool_checkout_wait
+from services.task_queue import publish_task
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Тест текстового формата гистограммы"""
+    registry = Registry()
+    histogram = registry.register(Histogram("test_seconds", "Тест", ["route"], buckets=(0.1, 1.0)))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(2.0, route="/a")
+    registry.register(Counter("test_events", "Тест")).inc(3)
+
+    text = registry.render()
+
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in text
+    assert 'test_seconds_count{route="/a"} 3' in text
+    assert "test_events_total 3" in text
+
+
+def test_metrics_endpoint_reports_routes_and_db(client: TestClient):
+    """Тест метрик запросов по шаблону маршрута и времени БД"""
+    client.get("/products/1")
+    client.get("/products/999999")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/products/{product_id}",status="200"}' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/products/{product_id}",status="404"}' in text
+    assert 'http_request_db_queries_count{method="GET",route="/products/{product_id}"}' in text
+    assert "db_queries_total" in text
+    assert "redis_circuit_open" in text
+
+
+def test_database_events_reach_metrics():
+    """Тест подписки: события пула из слоя database попадают в метрики services"""
+    before = db_pool_checkout_wait._values.get((), None)
+    count = before.count if before is not None else 0
+
+    instrumentation.notify(instrumentation.POOL_CHECKOUT, 0.002)
+
+    assert db_pool_checkout_wait._values[()].count == count + 1
+
+
+def test_publish_failure_counted(monkeypatch):
+    """Тест счетчика неудачных публикаций в RabbitMQ"""
+    def unavailable(parameters):
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr("services.task_queue.pika.BlockingConnection", unavailable)
+    before = rabbitmq_publish_failures.value(queue="test_queue")
+
+    assert publish_task({"task_type": "test"}, queue="test_queue") is False
+    assert rabbitmq_publish_failures.value(queue="test_queue") == before + 1
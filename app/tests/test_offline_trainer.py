@@ -0,0 +1,68 @@
+import pandas as pd
+from sqlmodel import Session
+from services.offline_trainer import train, build_user_product_matrix
+from services.model_artifact import latest_artifact
+from services.recommendation_service import RecommendationService
+from database.config import get_settings
+from models.orders import Order
+from models.order_item import OrderItem
+
+
+def _write_exports(data_dir):
+    pd.DataFrame({
+        "order_id": [1, 2, 3],
+        "user_id": [1, 1, 2],
+    }).to_csv(data_dir / "orders.csv", index=False)
+    pd.DataFrame({
+        "order_id": [1, 1, 2, 3, 4],
+        "product_id": [1, 2, 1, 2, 1],
+    }).to_csv(data_dir / "order_products__prior.csv", index=False)
+
+
+def test_build_matrix_aggregates_chunks(tmp_path):
+    """Тест агрегации позиций по чанкам (заказ 4 без пользователя пропускается)"""
+    _write_exports(tmp_path)
+
+    matrix, user_ids, product_ids = build_user_product_matrix(tmp_path, chunk_size=2)
+
+    assert user_ids.tolist() == [1, 2]
+    assert product_ids.tolist() == [1, 2]
+    assert matrix.toarray().tolist() == [[2, 1], [0, 1]]
+
+
+def test_service_loads_trained_artifact(tmp_path, session: Session):
+    """Тест загрузки артефакта офлайн обучения сервисом рекомендаций"""
+    _write_exports(tmp_path)
+    stats = train(tmp_path, output_dir=tmp_path / "artifacts")
+
+    path = latest_artifact(tmp_path / "artifacts")
+    assert str(path) == stats["artifact"]
+
+    service = RecommendationService(session)
+    loaded = service.load_model(path)
+
+    assert loaded["interactions"] == 3
+    assert service.model_version == path.stem.split("_", 1)[1]
+    assert service.popular_products[0] == 1
+    assert service.user_products(1) == [1, 2]
+
+
+def test_retrain_reads_db_when_artifact_exists(tmp_path, session: Session, monkeypatch):
+    """Тест: артефакт используется только по запросу, переобучение читает новые заказы из БД"""
+    _write_exports(tmp_path)
+    train(tmp_path, output_dir=tmp_path / "artifacts")
+    monkeypatch.setattr(get_settings(), "MODEL_ARTIFACT_DIR", str(tmp_path / "artifacts"))
+
+    session.add(Order(id=30, user_id=1))
+    session.add(OrderItem(order_id=30, product_id=2, quantity=1))
+    session.commit()
+
+    service = RecommendationService(session)
+    service.knn_k = 0
+    assert service.train_model(prefer_artifact=True)["model_version"] is not None
+    assert 2 in service.user_index
+
+    # В БД только пользователь 1: переобучение не берет матрицу артефакта
+    service.retrain_model()
+    assert service.user_index.ids.tolist() == [1]
+    assert service.user_products(1) == [2]
@@ -0,0 +1,154 @@
+import time
+import threading
+from database.redis_client import ResilientRedis
+from services import popular_cache, serialization
+from services.popular_cache import PopularCache
+
+ITEMS = [{"product_id": 1, "product_name": "Банан", "score": 0.5}]
+
+
+class DictRedis:
+    """Redis в памяти: get/setex/set NX/delete и скрипт снятия блокировки"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key], self.ttls[key] = value, ttl
+        return True
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.values:
+                return None
+            self.values[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def eval(self, script, numkeys, key, token):
+        assert script == popular_cache.RELEASE_LOCK
+        with self.lock:
+            if self.values.get(key) == token.encode():
+                return self.delete(key)
+            return 0
+
+
+def _cache():
+    fake = DictRedis()
+    return PopularCache(ResilientRedis(client=fake)), fake
+
+
+def _drain_refresher():
+    popular_cache._refresher.submit(lambda: None).result()
+
+
+def test_concurrent_misses_load_once():
+    """Тест single-flight: одновременные промахи вызывают пересчет один раз"""
+    cache, fake = _cache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return ITEMS
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and results == [ITEMS] * 8
+    assert cache.read() == (ITEMS, True) and cache.lock_key not in fake.values
+    # Жесткий срок с разбросом
+    assert cache.hard_ttl * 0.89 <= fake.ttls[cache.key] <= cache.hard_ttl * 1.11
+
+
+def test_stale_value_served_while_refreshing():
+    """Тест stale-while-revalidate: устаревший список отдается, обновление одно и в фоне"""
+    cache, fake = _cache()
+    # Запись без конверта считается устаревшей
+    fake.setex(cache.key, 60, serialization.dumps(ITEMS))
+    refreshed = [{"product_id": 2, "product_name": "Молоко", "score": 0.5}]
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return refreshed
+
+    assert cache.get(loader) == ITEMS
+    assert cache.get(loader) in (ITEMS, refreshed)
+    _drain_refresher()
+    assert len(calls) == 1 and cache.read() == (refreshed, True)
+
+    cache.mark_stale()
+    assert cache.read() == (refreshed, False)
+
+
+def test_miss_waits_for_other_process():
+    """Тест: при чужой блокировке промах ждет значение, а не пересчитывает"""
+    cache, fake = _cache()
+    cache.wait = 1.0
+    fake.set(cache.lock_key, "other", nx=True)
+    threading.Timer(0.1, lambda: cache.write(ITEMS)).start()
+
+    assert cache.get(lambda: [{"product_id": 404}]) == ITEMS
+    assert fake.values[cache.lock_key] == b"other"
+
+
+def test_expired_lock_taken_by_other_process_is_kept():
+    """Тест: после истечения своей блокировки пересчет не снимает чужую"""
+    cache, fake = _cache()
+
+    def loader():
+        # Наша блокировка истекла, ее взял другой процесс
+        fake.delete(cache.lock_key)
+        fake.set(cache.lock_key, "other", nx=True)
+        return ITEMS
+
+    assert cache.get(loader) == ITEMS
+    assert fake.values[cache.lock_key] == b"other"
+
+
+def test_waiting_route_does_not_block_event_loop(auth_client, monkeypatch):
+    """Тест: ожидание чужого пересчета идет в пуле потоков, остальные запросы обслуживаются"""
+    import asyncio
+    import httpx
+    from main import app
+    from services import recommendation_service as recommendation_module
+
+    fake = DictRedis()
+    monkeypatch.setattr(recommendation_module, "redis_client", ResilientRedis(client=fake))
+    cache = PopularCache(ResilientRedis(client=fake))
+    fake.set(cache.lock_key, "other", nx=True)
+
+    async def scenario():
+        finished = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def call(name, url, delay=0.0):
+                await asyncio.sleep(delay)
+                response = await client.get(url)
+                finished[name] = time.monotonic()
+                return response
+
+            threading.Timer(0.3, lambda: cache.write(ITEMS)).start()
+            popular, health = await asyncio.gather(
+                call("popular", "/recommendations/?model_type=popular"),
+                # /health уходит, когда популярный запрос уже ждет пересчет
+                call("health", "/health", delay=0.1),
+            )
+        return popular, health, finished
+
+    popular, health, finished = asyncio.run(scenario())
+    assert health.status_code == 200 and popular.status_code == 200
+    assert [rec["product_id"] for rec in popular.json()] == [1]
+    assert finished["health"] < finished["popular"]
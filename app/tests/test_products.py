@@ -37,6 +37,15 @@ def test_search_products(client: TestClient):
     assert any("banana" in p["name"].lower() for p in products)
 
 
+def test_search_whitespace_matches_count(client: TestClient):
+    """Тест поиска: пробелы по краям и пустая строка дают те же товары, что и X-Total-Count"""
+    for search, expected in [("banana", 1), ("banana ", 1), ("  ", 2), ("BANANA", 1)]:
+        response = client.get("/products/", params={"search": search})
+        assert response.status_code == 200
+        assert len(response.json()) == expected
+        assert response.headers["X-Total-Count"] == str(expected)
+
+
 def test_filter_by_department(client: TestClient):
     """Тест фильтрации по отделу"""
     response = client.get("/products/?department_id=1")
@@ -53,4 +62,80 @@ def test_get_departments(client: TestClient):
 
     departments = response.json()
     assert len(departments) >= 2
-    assert any(d["name"] == "Produce" for d in departments)
\ No newline at end of file
+    assert any(d["name"] == "Produce" for d in departments)
+
+def test_products_total_count_header(client: TestClient):
+    """Тест заголовка с общим количеством товаров"""
+    response = client.get("/products/?department_id=1")
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == "1"
+
+
+def test_products_cursor_pagination(client: TestClient):
+    """Тест keyset-пагинации по курсору"""
+    first_page = client.get("/products/?limit=1")
+    assert first_page.status_code == 200
+    assert len(first_page.json()) == 1
+    next_cursor = first_page.headers["X-Next-Cursor"]
+
+    second_page = client.get(f"/products/?limit=1&cursor={next_cursor}")
+    assert second_page.status_code == 200
+    products = second_page.json()
+    assert len(products) == 1
+    assert products[0]["id"] > int(next_cursor)
+
+
+def test_departments_etag_not_modified(client: TestClient):
+    """Тест условного запроса справочника отделов по ETag"""
+    response = client.get("/products/departments/list")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    cached = client.get("/products/departments/list", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+
+
+def test_catalog_version_bump_changes_etag(client: TestClient, session):
+    """Тест инвалидации ETag при изменении версии каталога"""
+    from services.catalog_service import bump_catalog_version
+
+    etag = client.get("/products/1").headers["ETag"]
+    bump_catalog_version(session)
+
+    response = client.get("/products/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_catalog_snapshot(client: TestClient):
+    """Тест сжатого снимка каталога"""
+    response = client.get("/products/catalog/snapshot", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+
+    snapshot = response.json()
+    assert len(snapshot["departments"]) >= 2
+    assert any(p[1] == "Organic Banana" for p in snapshot["products"])
+
+
+def test_aisles_by_department(client: TestClient, session):
+    """Тест списка проходов отдела из материализованной связи"""
+    from services.catalog_service import refresh_department_aisles, bump_catalog_version
+
+    assert refresh_department_aisles(session) == 2
+    bump_catalog_version(session)
+
+    response = client.get("/products/aisles/list?department_id=2")
+    assert response.status_code == 200
+    assert response.json() == [{"id": 2, "name": "Milk and Cheese", "product_count": 1}]
+
+
+def test_department_tree(client: TestClient):
+    """Тест дерева категорий"""
+    response = client.get("/products/departments/tree")
+    assert response.status_code == 200
+
+    tree = {d["name"]: d for d in response.json()}
+    assert tree["Produce"]["product_count"] == 1
+    assert tree["Produce"]["aisles"][0]["name"] == "Fresh Vegetables"
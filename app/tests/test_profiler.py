@@ -0,0 +1,116 @@
+import time
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from auth.jwt_handler import create_access_token
+from database.config import get_settings
+from services import profiler
+from services.profiler import StackSampler, span, _request_spans
+
+
+@pytest.fixture(name="admin")
+def admin_fixture(monkeypatch, tmp_path):
+    """Пользователь 1 - администратор, профили пишутся во временный каталог"""
+    monkeypatch.setattr(get_settings(), "ADMIN_USER_IDS", [1])
+    monkeypatch.setattr(get_settings(), "PROFILER_OUTPUT_DIR", str(tmp_path))
+    sampler = StackSampler(interval=0.002, output_dir=str(tmp_path))
+    monkeypatch.setattr(profiler, "_profiler", sampler)
+    yield sampler
+    sampler.stop()
+
+
+def _busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_sampler_collects_collapsed_stacks(tmp_path):
+    """Тест семплирования стеков рабочего потока и записи collapsed файла"""
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy-worker")
+    worker.start()
+    sampler = StackSampler(interval=0.001, output_dir=str(tmp_path))
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    text = sampler.collapsed()
+    assert sampler.samples > 0
+    assert "thread:busy-worker;" in text
+    assert "_busy_loop (tests/test_profiler.py:" in text
+    # Сам семплер в профиль не попадает
+    assert "stack-sampler" not in text
+
+    path = sampler.flush()
+    line = path.read_text().splitlines()[0]
+    stack, count = line.rsplit(" ", 1)
+    assert ";" in stack and int(count) > 0
+    assert sampler.samples == 0
+
+
+def test_span_records_into_request_profile():
+    """Тест спанов: работают как контекстный менеджер и декоратор"""
+    @span("decorated")
+    def work():
+        return 42
+
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        with span("block"):
+            pass
+        assert work() == 42
+    finally:
+        _request_spans.reset(token)
+
+    assert [name for name, _ in spans] == ["block", "decorated"]
+    assert all(seconds >= 0 for _, seconds in spans)
+
+
+def test_admin_profiler_requires_admin(auth_client: TestClient):
+    """Тест запрета профилировщика для обычного пользователя"""
+    assert auth_client.post("/admin/profiler/start").status_code == 403
+
+
+def test_admin_profiler_start_stop(auth_client: TestClient, admin):
+    """Тест включения постоянного профилировщика и записи файла при остановке"""
+    response = auth_client.post("/admin/profiler/start")
+    assert response.status_code == 200
+    assert response.json()["running"] is True
+
+    time.sleep(0.05)
+    auth_client.get("/health")
+
+    response = auth_client.post("/admin/profiler/stop")
+    data = response.json()
+    assert data["running"] is False
+    assert data["file"].endswith(".collapsed")
+    assert auth_client.get("/admin/profiler").json()["samples"] == 0
+
+
+def test_profile_header_returns_request_profile(client: TestClient, admin):
+    """Тест профиля отдельного запроса по заголовку X-Profile"""
+    headers = {"Authorization": f"Bearer {create_access_token('1')}", "X-Profile": "1"}
+
+    response = client.get("/products/1", headers=headers)
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+    assert "total;dur=" in response.headers["Server-Timing"]
+
+    profile = client.get(f"/admin/profiler/requests/{profile_id}", headers=headers).json()
+    assert profile["path"] == "/products/1"
+    assert profile["duration_ms"] > 0
+
+
+def test_profile_header_ignored_for_non_admin(client: TestClient, admin):
+    """Тест: заголовок X-Profile без прав администратора игнорируется"""
+    headers = {"Authorization": f"Bearer {create_access_token('2')}", "X-Profile": "1"}
+
+    response = client.get("/products/1", headers=headers)
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+    response = client.get("/products/1", headers={"X-Profile": "1"})
+    assert "X-Profile-Id" not in response.headers
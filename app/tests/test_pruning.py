@@ -0,0 +1,74 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from services.pruning import PruningConfig, prune_interactions
+from services.recommendation_service import RecommendationService
+from models.orders import Order
+from models.order_item import OrderItem
+
+
+def _matrix():
+    """Пользователи 1-4; товар 10 купил каждый, 40 - только пользователь 4"""
+    dense = np.array([
+        [5, 1, 1, 0],
+        [1, 2, 0, 0],
+        [1, 1, 3, 0],
+        [1, 0, 0, 2],
+    ])
+    return csr_matrix(dense), np.array([1, 2, 3, 4]), np.array([10, 20, 30, 40])
+
+
+def test_pruning_rules_and_report():
+    """Тест правил: сверхпопулярные и редкие товары, обрезка и легкие пользователи"""
+    matrix, user_ids, product_ids = _matrix()
+    result = prune_interactions(matrix, user_ids, product_ids,
+                                PruningConfig(min_product_buyers=2, min_user_items=2, max_product_share=0.9))
+
+    # 10 у 100% покупателей, 40 у одного; у пользователя 4 не осталось товаров
+    assert result.product_ids.tolist() == [20, 30]
+    assert result.user_ids.tolist() == [1, 3]
+    assert result.matrix.toarray().tolist() == [[1, 1], [1, 3]]
+    assert sorted(result.dropped_product_ids.tolist()) == [10, 40]
+    assert result.report["before"]["interactions"] == 10
+    assert result.report["after"]["interactions"] == 4
+    assert result.report["removed"] == {"popular_products": 1, "rare_products": 1, "light_users": 1}
+
+    capped = prune_interactions(matrix, user_ids, product_ids, PruningConfig(max_user_items=1))
+    # У каждого остается товар с наибольшим количеством
+    assert capped.matrix.toarray().tolist() == [[5, 0, 0, 0], [0, 2, 0, 0], [0, 0, 3, 0], [0, 0, 0, 2]]
+
+
+def test_service_keeps_popular_products_when_pruning():
+    """Тест сервиса: удаленные товары остаются в популярных, рекомендации - из оставшихся"""
+    matrix, user_ids, product_ids = _matrix()
+    service = RecommendationService(session=None)
+    service.redis = None
+    service.pruning = PruningConfig(max_product_share=0.9)
+    service.set_interactions(matrix, user_ids, product_ids)
+    stats = service.train_model()
+
+    assert stats["pruning"]["after"]["products"] == 3
+    assert 10 not in service.product_index
+    assert service.popular_products[0] == 10
+    assert service.product_frequency.tolist() == [4, 4, 2]
+
+
+def test_refresh_readds_pruned_product_once(session):
+    """Тест refresh_users: удаленный прореживанием товар после покупки возвращается в индекс без дубля в популярных"""
+    matrix, user_ids, product_ids = _matrix()
+    service = RecommendationService(session)
+    service.redis = None
+    service.pruning = PruningConfig(max_product_share=0.9)
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.train_model()
+    assert 10 not in service.product_index
+
+    session.add(Order(id=60, user_id=4))
+    session.add(OrderItem(order_id=60, product_id=10, quantity=3))
+    session.commit()
+    service.refresh_users([4])
+
+    assert 10 in service.product_index
+    assert service._dropped_products[0].tolist() == []
+    assert len(service.popular_products) == len(set(service.popular_products))
+    assert service.popular_products[0] == 10
+    assert service.product_frequency[service.product_index[10]] >= 4
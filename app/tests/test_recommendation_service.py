@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from sqlmodel import Session
 from services.recommendation_service import RecommendationService
 from models.user import User
@@ -52,4 +53,130 @@ def test_get_popular_products(session: Session):
     )
 
     assert isinstance(popular, list)
-    assert len(popular) > 0
\ No newline at end of file
+    assert len(popular) > 0
+
+def test_refresh_users_adds_new_user(session: Session):
+    """Тест инкрементального обновления модели без полного переобучения"""
+    session.add(Order(id=20, user_id=1))
+    session.add(OrderItem(order_id=20, product_id=1, quantity=1))
+    session.commit()
+
+    service = RecommendationService(session)
+    service.train_model()
+    assert 2 not in service.user_index
+
+    session.add(User(id=2, email="second@example.com", name="Second User"))
+    session.add(Order(id=21, user_id=2))
+    session.add(OrderItem(order_id=21, product_id=2, quantity=3))
+    session.commit()
+
+    stats = service.refresh_users([2])
+
+    assert stats["status"] == "refreshed"
+    assert service.user_product_matrix.shape == (2, 2)
+    user_idx = service.user_index[2]
+    product_idx = service.product_index[2]
+    assert service.user_product_matrix[user_idx, product_idx] == 3
+    assert service.tf_idf_matrix.shape == (2, 2)
+
+
+def test_refresh_of_fork_keeps_serving_model(session: Session):
+    """Тест копии модели: обновление копии не меняет модель, которая отвечает на запросы"""
+    session.add(Order(id=22, user_id=1))
+    session.add(OrderItem(order_id=22, product_id=1, quantity=1))
+    session.commit()
+
+    service = RecommendationService(session)
+    service.train_model()
+    matrix = service.user_product_matrix
+
+    session.add(User(id=2, email="second@example.com", name="Second User"))
+    session.add(Order(id=23, user_id=2))
+    session.add(OrderItem(order_id=23, product_id=2, quantity=3))
+    session.commit()
+
+    fork = service.fork(session)
+    fork.refresh_users([2])
+
+    assert 2 in fork.user_index and 2 in fork.product_index
+    assert 2 not in service.user_index and 2 not in service.product_index
+    assert service.user_product_matrix is matrix and service.user_product_matrix.shape == (1, 1)
+
+
+def test_batch_scoring_matches_single_user(session: Session):
+    """Тест совпадения пакетного скоринга с поштучной генерацией"""
+    baskets = {1: [1, 2], 2: [1, 2, 3], 3: [2, 3], 4: [1, 3]}
+    order_id = 30
+    for user_id, products in baskets.items():
+        if user_id != 1:
+            session.add(User(id=user_id, email=f"user{user_id}@example.com", name=f"User {user_id}"))
+        session.add(Order(id=order_id, user_id=user_id))
+        for product_id in products:
+            session.add(OrderItem(order_id=order_id, product_id=product_id, quantity=user_id))
+        order_id += 1
+    session.commit()
+
+    service = RecommendationService(session)
+    service.train_model()
+    batch = service.generate_recommendations_batch([1, 2, 3, 4, 999], n_recommendations=3)
+
+    for user_id in baskets:
+        products, scores = service.generate_recommendations_tfidf(user_id, n_recommendations=3)
+        assert dict(zip(*batch[user_id])) == pytest.approx(dict(zip(products, scores)))
+    assert batch[999][0] == service.popular_products[:3]
+
+
+def test_compact_model_matches_full_precision():
+    """Тест компактного режима: те же рекомендации при меньшем объеме памяти"""
+    from benchmarks.synthetic import SyntheticConfig, generate, interaction_matrix
+
+    matrix, user_ids, product_ids = interaction_matrix(generate(SyntheticConfig(users=200, products=300)))
+    services = {}
+    for compact in (True, False):
+        service = RecommendationService(session=None, compact=compact)
+        service.redis = None
+        service.set_interactions(matrix, user_ids, product_ids)
+        service.train_model()
+        services[compact] = service
+
+    sample = user_ids[:20].tolist()
+    compact_batch = services[True].generate_recommendations_batch(sample, n_recommendations=5)
+    full_batch = services[False].generate_recommendations_batch(sample, n_recommendations=5)
+    for user_id in sample:
+        assert dict(zip(*compact_batch[user_id])) == pytest.approx(dict(zip(*full_batch[user_id])), abs=1e-5)
+    assert services[True].user_products(sample[0]) == services[False].user_products(sample[0])
+
+    compact_memory = services[True].memory_footprint()
+    full_memory = services[False].memory_footprint()
+    assert services[True].tf_idf_matrix.dtype == np.float32
+    assert compact_memory["components"]["scoring_matrices"] > 0
+    assert compact_memory["total_bytes"] < full_memory["total_bytes"]
+
+
+def test_session_cart_folds_into_user_vector():
+    """Тест рекомендаций по корзине: корзина сразу влияет на соседей, модель не меняется"""
+    from benchmarks.synthetic import SyntheticConfig, generate, interaction_matrix
+
+    matrix, user_ids, product_ids = interaction_matrix(generate(SyntheticConfig(users=200, products=300)))
+    service = RecommendationService(session=None)
+    service.redis = None
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.train_model()
+    interactions = service.user_product_matrix.nnz
+
+    # Пустая корзина - та же формула, что и в пакетном скоринге
+    user_id = int(user_ids[0])
+    batch = service.generate_recommendations_batch([user_id], n_recommendations=5)
+    products, scores = service.generate_recommendations_session(user_id, [], n_recommendations=5)
+    assert dict(zip(*batch[user_id])) == pytest.approx(dict(zip(products, scores)), abs=1e-5)
+
+    # Корзина нового пользователя: рекомендации есть, товаров корзины среди них нет
+    cart = service.user_products(int(user_ids[1]))[:3]
+    products, scores = service.generate_recommendations_session(10 ** 6, cart, n_recommendations=5)
+    assert products and not set(products) & set(cart)
+    assert scores != [0.5] * len(scores)
+    assert service.user_product_matrix.nnz == interactions
+
+    # Неизвестные товары и пустая корзина нового пользователя - популярные
+    products, scores = service.generate_recommendations_session(10 ** 6, [-1], n_recommendations=3)
+    assert products == service.popular_products[:3] and scores == [0.5] * 3
@@ -1,4 +1,5 @@
 from fastapi.testclient import TestClient
+from services.rpc_client import rpc_client, RPCUnavailableError
 
 
 def test_get_recommendations_new_user(auth_client: TestClient):
@@ -36,4 +37,63 @@ def test_generate_recommendations(auth_client: TestClient):
 
     data = response.json()
     assert "status" in data
-    assert "model_type" in data
\ No newline at end of file
+    assert "model_type" in data
+
+def test_realtime_recommendations_from_worker(auth_client: TestClient, monkeypatch):
+    """Тест рекомендаций от воркера инференса"""
+    async def recommend(user_id, count, exclude=None, timeout=None):
+        assert user_id == 1
+        return {"status": "ok", "recommendations": [{
+            "product_id": 1, "product_name": "Organic Milk", "score": 0.9,
+            "aisle_name": "Milk and Cheese", "department_name": "Dairy Eggs"
+        }]}
+
+    monkeypatch.setattr(rpc_client, "recommend", recommend)
+
+    response = auth_client.get("/recommendations/realtime?limit=5")
+    assert response.status_code == 200
+    assert response.headers["X-Recommendation-Source"] == "rpc"
+    assert response.json()[0]["model_type"] == "collaborative"
+
+
+def test_realtime_recommendations_fallback(auth_client: TestClient, monkeypatch):
+    """Тест fallback на популярные товары при недоступном воркере"""
+    async def recommend(user_id, count, exclude=None, timeout=None):
+        raise RPCUnavailableError("timeout")
+
+    monkeypatch.setattr(rpc_client, "recommend", recommend)
+
+    response = auth_client.get("/recommendations/realtime")
+    assert response.status_code == 200
+    assert response.headers["X-Recommendation-Source"] == "popular"
+    assert all(rec["model_type"] == "popular" for rec in response.json())
+
+
+def test_session_recommendations_send_cart(auth_client: TestClient, monkeypatch):
+    """Тест рекомендаций по корзине: товары корзины уходят воркеру"""
+    async def recommend(user_id, count, exclude=None, timeout=None, cart=None):
+        assert cart == [1, 2]
+        return {"status": "ok", "recommendations": [{
+            "product_id": 3, "product_name": "Bananas", "score": 0.8,
+            "aisle_name": "Fresh Fruits", "department_name": "Produce"
+        }]}
+
+    monkeypatch.setattr(rpc_client, "recommend", recommend)
+
+    response = auth_client.post("/recommendations/session?limit=5", json={"product_ids": [1, 2]})
+    assert response.status_code == 200
+    assert response.headers["X-Recommendation-Source"] == "session"
+    assert [rec["product_id"] for rec in response.json()] == [3]
+
+
+def test_session_recommendations_fallback_skips_cart(auth_client: TestClient, monkeypatch):
+    """Тест fallback рекомендаций по корзине: популярные без товаров корзины"""
+    async def recommend(user_id, count, exclude=None, timeout=None, cart=None):
+        raise RPCUnavailableError("timeout")
+
+    monkeypatch.setattr(rpc_client, "recommend", recommend)
+
+    response = auth_client.post("/recommendations/session", json={"product_ids": [1]})
+    assert response.status_code == 200
+    assert response.headers["X-Recommendation-Source"] == "popular"
+    assert all(rec["product_id"] != 1 and rec["model_type"] == "popular" for rec in response.json())
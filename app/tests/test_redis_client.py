@@ -0,0 +1,85 @@
+import time
+import redis
+from database.redis_client import ResilientRedis
+from services import recommendation_service as recommendation_module
+from services.metrics import redis_command_failures
+
+
+class FlakyRedis:
+    """Клиент, который отвечает или падает в зависимости от флага"""
+
+    def __init__(self, error=redis.ConnectionError):
+        self.up = False
+        self.error = error
+        self.calls = 0
+        self.values = {}
+        self.connection_pool = redis.ConnectionPool()
+
+    def _check(self):
+        self.calls += 1
+        if not self.up:
+            raise self.error("down")
+
+    def get(self, key):
+        self._check()
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self._check()
+        self.values[key] = value
+        return True
+
+    def ping(self):
+        self._check()
+        return True
+
+
+def _wait(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    """Тест предохранителя: размыкание после ошибок подряд, быстрый отказ и фоновое восстановление"""
+    flaky = FlakyRedis()
+    client = ResilientRedis(client=flaky, failure_threshold=2, retry_interval=0.02)
+    try:
+        open_before = redis_command_failures.value(command="get", reason="circuit_open")
+
+        assert client.get("key") is None and client.available
+        assert client.setex("key", 10, b"value") is False
+        assert not client.available and client.stats()["circuit_open"] == 1
+
+        # Разомкнутый предохранитель не обращается к Redis
+        calls = flaky.calls
+        assert client.get("key") is None
+        assert flaky.calls == calls
+        assert redis_command_failures.value(command="get", reason="circuit_open") == open_before + 1
+
+        flaky.up = True
+        assert _wait(lambda: client.available)
+        assert client.setex("key", 10, b"value") is True
+        assert client.get("key") == b"value" and client.failures == 0
+    finally:
+        client.close()
+
+
+def test_popular_cache_falls_back_to_db_on_timeouts(session, monkeypatch):
+    """Тест: таймауты Redis считаются отдельно, популярные сохраняются в БД"""
+    flaky = FlakyRedis(error=redis.TimeoutError)
+    client = ResilientRedis(client=flaky, failure_threshold=1, retry_interval=60)
+    monkeypatch.setattr(recommendation_module, "redis_client", client)
+    timeouts_before = redis_command_failures.value(command="setex", reason="timeout")
+    try:
+        service = recommendation_module.RecommendationService(session)
+        service.popular_products = [1, 2]
+        service._update_popular_cache()
+
+        assert redis_command_failures.value(command="setex", reason="timeout") == timeouts_before + 1
+        assert not client.available
+        cached = service._get_popular_from_cache(5)
+        assert [rec["product_id"] for rec in cached] == [1, 2]
+    finally:
+        client.close()
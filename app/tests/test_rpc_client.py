@@ -0,0 +1,50 @@
+import asyncio
+import time
+import pytest
+from services import rpc_client as rpc_module
+from services.rpc_client import RecommendationRPCClient, RPCUnavailableError
+
+
+def test_requests_fail_fast_after_failed_connect(monkeypatch):
+    """Тест RPC клиента: после неудачного подключения запросы не ждут переподключения"""
+    attempts = []
+
+    def connect(params):
+        attempts.append(params)
+        time.sleep(0.3)
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(rpc_module.pika, "BlockingConnection", connect)
+    client = RecommendationRPCClient(queue="test_rpc")
+    client.CONNECT_TIMEOUT = 0.5
+    client.RECONNECT_DELAY = 0.0
+
+    # Первое подключение запрос ждет
+    started = time.perf_counter()
+    with pytest.raises(RPCUnavailableError):
+        client._ensure_started()
+    assert time.perf_counter() - started >= 0.5
+    client._thread.join()
+
+    # Переподключение идет в фоне, запрос сразу получает ошибку
+    started = time.perf_counter()
+    with pytest.raises(RPCUnavailableError):
+        client._ensure_started()
+    assert time.perf_counter() - started < 0.1
+    client._thread.join()
+    assert len(attempts) == 2
+
+
+def test_publish_on_closed_connection_is_unavailable(monkeypatch):
+    """Тест RPC клиента: закрытое при публикации соединение дает RPCUnavailableError, а не 500"""
+    class ClosedConnection:
+        def add_callback_threadsafe(self, callback):
+            raise rpc_module.pika.exceptions.ConnectionWrongStateError("Connection is closed")
+
+    client = RecommendationRPCClient(queue="test_rpc")
+    monkeypatch.setattr(client, "_ensure_started", lambda: None)
+    client._connection = ClosedConnection()
+
+    with pytest.raises(RPCUnavailableError):
+        asyncio.run(client.call({"user_id": 1}, timeout=0.5))
+    assert client._futures == {}
@@ -0,0 +1,61 @@
+import json
+from fastapi.testclient import TestClient
+from database.redis_client import ResilientRedis
+from services import serialization
+from services import recommendation_service as recommendation_module
+from services.rpc_client import rpc_client, RPCUnavailableError
+
+ITEMS = [{"product_id": 1, "product_name": "Банан", "score": 0.5, "aisle_name": None, "department_name": "produce"}]
+
+
+class BytesRedis:
+    """Redis в памяти с ответами в bytes, как у клиента с decode_responses=False"""
+
+    def __init__(self):
+        self.values = {}
+
+    def setex(self, key, ttl, value):
+        assert isinstance(value, bytes)
+        self.values[key] = value
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+
+def test_cache_formats_roundtrip(monkeypatch):
+    """Тест формата кеша: префикс формата, JSON без префикса и работа без orjson/msgpack"""
+    assert serialization.loads(serialization.dumps(ITEMS)) == ITEMS
+    # Значения, записанные до перехода на bytes
+    assert serialization.loads(json.dumps(ITEMS)) == ITEMS
+    assert serialization.loads(json.dumps(ITEMS).encode("utf-8")) == ITEMS
+
+    fast = serialization.json_bytes(ITEMS)
+    monkeypatch.setattr(serialization, "orjson", None)
+    monkeypatch.setattr(serialization, "msgpack", None)
+    assert serialization.json_bytes(ITEMS) == fast
+    stdlib = serialization.dumps(ITEMS)
+    assert stdlib.startswith(serialization.JSON_PREFIX)
+    assert serialization.loads(stdlib) == ITEMS
+
+
+def test_popular_fallback_served_from_bytes_cache(auth_client: TestClient, session, monkeypatch):
+    """Тест: популярные из кеша в bytes отдаются без моделей ответа на каждый элемент"""
+    redis = BytesRedis()
+    monkeypatch.setattr(recommendation_module, "redis_client", ResilientRedis(client=redis))
+
+    service = recommendation_module.RecommendationService(session)
+    service.popular_products = [2, 1]
+    service._update_popular_cache()
+    assert redis.values
+
+    async def recommend(user_id, count, exclude=None, timeout=None, cart=None):
+        raise RPCUnavailableError("timeout")
+
+    monkeypatch.setattr(rpc_client, "recommend", recommend)
+
+    response = auth_client.get("/recommendations/realtime?limit=5")
+    assert response.status_code == 200
+    assert response.headers["X-Recommendation-Source"] == "popular"
+    assert [rec["product_id"] for rec in response.json()] == [2, 1]
+    assert all(rec["model_type"] == "popular" and rec["score"] == 0.5 for rec in response.json())
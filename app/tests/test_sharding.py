@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from benchmarks.synthetic import SyntheticConfig, generate, interaction_matrix, build_artifact
+from services import model_artifact
+from services.recommendation_service import RecommendationService
+from services.sharding import shard_of, ShardModel, ShardCoordinator, LocalTransport
+
+
+CONFIG = SyntheticConfig(users=300, products=400, seed=3)
+
+
+def _service():
+    matrix, user_ids, product_ids = interaction_matrix(generate(CONFIG))
+    service = RecommendationService(session=None)
+    service.redis = None
+    service.set_interactions(matrix, user_ids, product_ids)
+    service.train_model()
+    return service
+
+
+def test_shard_of_spreads_consecutive_ids():
+    """Тест хеширования: последовательные id распределяются по всем шардам"""
+    shards = shard_of(np.arange(1, 1001), 4)
+
+    assert set(shards.tolist()) == {0, 1, 2, 3}
+    assert np.bincount(shards).min() > 200
+    assert np.array_equal(shards, shard_of(np.arange(1, 1001), 4))
+
+
+@pytest.mark.parametrize("n_shards", [1, 3])
+def test_sharded_recommendations_match_single_model(n_shards):
+    """Тест координатора: слияние top-K шардов дает те же рекомендации, что и вся модель"""
+    service = _service()
+    shards = [ShardModel.from_service(service, shard, n_shards) for shard in range(n_shards)]
+    assert sum(len(shard.user_index) for shard in shards) == len(service.user_index)
+
+    coordinator = ShardCoordinator.from_service(service, LocalTransport(shards), n_shards)
+    user_ids = service.user_index.ids[:40].tolist() + [10 ** 6]
+
+    expected = service.generate_recommendations_batch(user_ids, k_neighbors=10, n_recommendations=5)
+    actual = coordinator.recommend_batch(user_ids, k_neighbors=10, n_recommendations=5)
+
+    assert actual[10 ** 6] == expected[10 ** 6]
+    for user_id in user_ids[:-1]:
+        assert dict(zip(*actual[user_id])) == pytest.approx(dict(zip(*expected[user_id])), abs=1e-5)
+
+
+def test_shards_from_artifact_load_only_own_rows(tmp_path, monkeypatch):
+    """Тест загрузки шардов: строки читаются потоком, IDF - по числу покупателей из артефакта"""
+    monkeypatch.setattr(model_artifact, "READ_CHUNK", 1000)
+    path = build_artifact(generate(CONFIG), tmp_path)
+    service = _service()
+    n_shards = 3
+
+    shards = [ShardModel.from_artifact(path, shard, n_shards) for shard in range(n_shards)]
+    for shard in shards:
+        assert shard.normalized.shape[0] == len(shard.user_index) < len(service.user_index)
+        assert set(shard_of(shard.user_index.ids, n_shards).tolist()) == {shard.shard}
+
+    coordinator = ShardCoordinator.from_artifact(path, LocalTransport(shards), n_shards)
+    assert coordinator.popular_products == service.popular_products
+    user_ids = service.user_index.ids[:40].tolist()
+
+    expected = service.generate_recommendations_batch(user_ids, k_neighbors=10, n_recommendations=5)
+    actual = coordinator.recommend_batch(user_ids, k_neighbors=10, n_recommendations=5)
+    for user_id in user_ids:
+        assert dict(zip(*actual[user_id])) == pytest.approx(dict(zip(*expected[user_id])), abs=1e-5)
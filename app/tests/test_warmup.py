@@ -0,0 +1,141 @@
+import pytest
+from fastapi.testclient import TestClient
+from services import warmup
+from services.warmup import WarmupState, wait_for_database, warmup_state, preload_model_with_retries, run_warmup
+from sqlalchemy import inspect
+from models.catalog import CatalogVersion, DepartmentAisle
+
+
+class FlakyEngine:
+    """Движок, недоступный первые failures подключений"""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts = 0
+
+    def connect(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("connection refused")
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement):
+        return None
+
+
+def test_wait_for_database_retries(monkeypatch):
+    """Тест повторного подключения к БД с растущей задержкой"""
+    pauses = []
+    monkeypatch.setattr("services.warmup.time.sleep", pauses.append)
+
+    attempt = wait_for_database(FlakyEngine(failures=3), retries=5, delay=0.5, max_delay=1.0)
+
+    assert attempt == 4
+    assert pauses == [0.5, 1.0, 1.0]
+
+
+def test_wait_for_database_gives_up(monkeypatch):
+    """Тест ошибки после исчерпания попыток"""
+    monkeypatch.setattr("services.warmup.time.sleep", lambda pause: None)
+
+    with pytest.raises(ConnectionError):
+        wait_for_database(FlakyEngine(failures=10), retries=3, delay=0.1, max_delay=1.0)
+
+
+def test_warmup_state_stages():
+    """Тест статусов этапов прогрева"""
+    state = WarmupState()
+    with state.stage("database"):
+        pass
+    state.skip("import", "БД уже инициализирована")
+    assert not state.is_ready()
+
+    with pytest.raises(RuntimeError):
+        with state.stage("model"):
+            raise RuntimeError("нет данных")
+
+    snapshot = state.snapshot()
+    assert snapshot["status"] == "failed"
+    assert snapshot["stages"]["database"]["status"] == "done"
+    assert "duration_ms" in snapshot["stages"]["database"]
+    assert snapshot["stages"]["model"]["error"] == "нет данных"
+
+
+def test_ready_endpoint(client: TestClient):
+    """Тест /ready: 503 до завершения прогрева, 200 после"""
+    warmup_state.reset()
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "warming_up"
+
+    for name in ["database", "import", "model"]:
+        with warmup_state.stage(name):
+            pass
+
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["ready"] is True
+    assert client.get("/health").json() == {"status": "healthy"}
+    warmup_state.reset()
+
+
+def test_model_preload_failure_is_degraded_but_ready(monkeypatch):
+    """Тест этапа model: ошибка дает degraded с готовностью, повтор переводит этап в done"""
+    state = WarmupState()
+    state.skip("database", "тест")
+    state.skip("import", "тест")
+    calls = []
+    snapshots = []
+
+    def preload(engine):
+        calls.append(engine)
+        if len(calls) < 3:
+            raise RuntimeError("redis недоступен")
+
+    monkeypatch.setattr(warmup, "_preload_model", preload)
+    monkeypatch.setattr("services.warmup.time.sleep", lambda pause: snapshots.append(state.snapshot()))
+
+    assert preload_model_with_retries(object(), state, retries=5, delay=0.1, max_delay=1.0)
+
+    assert len(calls) == 3
+    assert [snapshot["status"] for snapshot in snapshots] == ["degraded", "degraded"]
+    assert all(snapshot["ready"] for snapshot in snapshots)
+    assert snapshots[1]["stages"]["model"]["attempts"] == 2
+    assert state.snapshot()["status"] == "ready"
+    assert "error" not in state.snapshot()["stages"]["model"]
+
+    monkeypatch.setattr(warmup, "_preload_model", lambda engine: 1 / 0)
+    state.reset()
+    state.skip("database", "тест")
+    state.skip("import", "тест")
+    assert not preload_model_with_retries(object(), state, retries=2, delay=0.1, max_delay=1.0)
+    assert state.snapshot()["status"] == "degraded"
+    assert state.is_ready()
+
+
+def test_app_starts_on_schema_without_catalog_tables(client: TestClient, session, monkeypatch):
+    """Тест БД без catalog_version и department_aisle: каталог работает до и после прогрева"""
+    engine = session.get_bind()
+    DepartmentAisle.__table__.drop(engine)
+    CatalogVersion.__table__.drop(engine)
+    session.rollback()
+
+    # До прогрева версия каталога считается нулевой
+    response = client.get("/products/")
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == "2"
+
+    monkeypatch.setattr(warmup, "_preload_model", lambda engine: None)
+    state = WarmupState()
+    run_warmup(engine, state)
+
+    assert state.snapshot()["stages"]["database"]["status"] == "done"
+    assert {"catalog_version", "department_aisle"} <= set(inspect(engine).get_table_names())
+    assert client.get("/products/departments/tree").status_code == 200
+    assert client.get("/products/?search=yogurt").status_code == 200
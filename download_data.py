@@ -100,6 +100,20 @@ def download_dataset():
         return False
 
 
+def convert_columnar():
+    """Конвертирует CSV в колоночный кеш data/columnar/ для быстрого импорта"""
+    print("\n🗜️ Конвертируем CSV в колоночный формат...")
+    try:
+        sys.path.insert(0, str(Path(__file__).parent / "app"))
+        from database.columnar_cache import convert
+        convert("data")
+        return True
+    except Exception as e:
+        print(f"⚠️ Конвертация не выполнена: {e}")
+        print("Импорт будет читать CSV. Повторить: python app/database/columnar_cache.py data")
+        return False
+
+
 def main():
     """Основная функция"""
     print("🛒 Smart Shop - Загрузка данных")
@@ -114,6 +128,7 @@ def main():
 
     # Загружаем датасет
     if download_dataset():
+        convert_columnar()
         print("\n✅ Готово! Данные находятся в папке data/")
         print("Теперь можно запускать docker-compose up -d")
         return 0
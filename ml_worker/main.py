@@ -1,6 +1,8 @@
 from rmq.rmqconf import RabbitMQConfig
 from rmq.rmqworker import MLWorker
 from rmq.rpcworker import RPCWorker
+from rmq.shardworker import ShardWorker
+import os
 import sys
 import pika
 import time
@@ -17,7 +19,22 @@ logger = logging.getLogger(__name__)
 
 def create_worker(mode: str, config: RabbitMQConfig):
     """Create appropriate worker instance based on mode."""
-    return MLWorker(config) if mode == 'ml' else RPCWorker(config)
+    if mode == 'ml':
+        return MLWorker(config)
+    if mode == 'shard':
+        return ShardWorker(
+            config,
+            shard=int(os.getenv('SHARD_INDEX', '0')),
+            n_shards=int(os.getenv('SHARD_COUNT', '1'))
+        )
+    return RPCWorker(
+        config,
+        batch_window_ms=int(os.getenv('RPC_BATCH_WINDOW_MS', '5')),
+        max_batch_size=int(os.getenv('RPC_MAX_BATCH_SIZE', '64')),
+        shard_count=int(os.getenv('SHARD_COUNT', '0')),
+        shard_timeout_ms=int(os.getenv('SHARD_TIMEOUT_MS', '400')),
+        model_reload_interval=int(os.getenv('MODEL_RELOAD_INTERVAL', '3600'))
+    )
 
 
 def run_worker(worker):
@@ -43,7 +60,9 @@ def run_worker(worker):
 
 
 def main():
-    mode = 'ml'  # Изменено на ml для обработки ML задач
+    # ml - фоновые задачи обновления модели, rpc - инференс рекомендаций,
+    # shard - шард модели для rpc воркера в шардированном режиме
+    mode = os.getenv('WORKER_MODE', 'ml')
     logger.info(f"Starting worker in {mode} mode")
 
     worker = None
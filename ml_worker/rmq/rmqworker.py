@@ -173,6 +173,32 @@ class MLWorker:
                 "order_id": order_id
             }
 
+    def refresh_model_async(self, user_ids: list) -> dict:
+        """
+        Инкрементальное обновление модели после дельта-импорта.
+
+        Модель держит RPC воркер, поэтому задача пересылается в его очередь:
+        он обновляет строки пользователей в памяти и сохраняет их
+        рекомендации. Своей модели этот воркер не держит.
+        """
+        try:
+            self.channel.queue_declare(queue=self.config.rpc_queue_name)
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=self.config.rpc_queue_name,
+                body=json.dumps({"task_type": "refresh_model", "user_ids": list(user_ids)}).encode()
+            )
+            logger.info(f"Model refresh for {len(user_ids)} users forwarded to {self.config.rpc_queue_name}")
+            return {"status": "forwarded", "user_ids": len(user_ids)}
+
+        except Exception as e:
+            logger.error(f"Error forwarding model refresh: {e}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "user_ids": len(user_ids)
+            }
+
     def process_message(self, ch, method, properties, body):
         """
         Обработка полученного сообщения из очереди.
@@ -201,6 +227,9 @@ class MLWorker:
                     data.get('ordered_products', [])
                 )
                 result_str = json.dumps(result)
+            elif task_type == 'refresh_model':
+                result = self.refresh_model_async(data.get('user_ids', []))
+                result_str = json.dumps(result, default=str)
             else:
                 # Для остальных задач используем старый обработчик
                 result_str = do_task(data.get('question', str(data)))
@@ -1,11 +1,15 @@
 import pika
 import time
+import json
 import logging
+import threading
 from rmq.rmqconf import RabbitMQConfig
-from llm import do_task
-from typing import Optional
+from rmq.rmqworker import engine
+from rmq.shardworker import ShardRPCTransport
+from typing import Dict, List, Optional, Tuple
 from pika.adapters.blocking_connection import BlockingChannel
 from pika.spec import Basic, BasicProperties
+from sqlmodel import Session
 
 # Настраиваем общий уровень логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -17,17 +21,49 @@ logger = logging.getLogger(__name__)
 
 class RPCWorker:
     """
-    Рабочий класс для обработки RPC задач из RabbitMQ.
-    Обеспечивает обработку текстовых запросов через RPC механизм.
+    Сервис инференса рекомендаций через RPC механизм RabbitMQ.
+
+    Держит обученную модель в памяти. Запросы, пришедшие в пределах окна
+    batch_window_ms, собираются в пакет и оцениваются одним разреженным
+    матричным произведением. Ответы уходят в reply_to с исходным correlation_id.
+
+    При shard_count > 0 воркер работает координатором: модель держат шарды
+    (ShardWorker), а он сливает их частичные top-K соседей.
+
+    Запрос с корзиной (cart) оценивается отдельно: товары корзины
+    добавляются к вектору пользователя без переобучения модели.
+
+    Сообщение {"task_type": "refresh_model", "user_ids": [...]} без reply_to
+    (его пересылает MLWorker после дельта-импорта) обновляет строки этих
+    пользователей в модели и сохраняет их новые рекомендации в БД. Обновление
+    идет в отдельном потоке на копии модели, а запросы тем временем
+    обслуживает прежняя модель; копия подменяет ее в потоке соединения.
     """
 
-    def __init__(self, config: RabbitMQConfig, max_retries: int = 3):
+    # Рекомендаций на пользователя, сохраняемых после обновления модели
+    REFRESH_RECOMMENDATIONS = 20
+
+    # Как часто проверять появление нового артефакта модели (сек)
+    MODEL_CHECK_INTERVAL = 30
+
+    # Ожидание подмены модели обновленной копией в потоке соединения (сек)
+    SWAP_TIMEOUT = 30
+
+    def __init__(self, config: RabbitMQConfig, max_retries: int = 3,
+                 batch_window_ms: int = 5, max_batch_size: int = 64,
+                 shard_count: int = 0, shard_timeout_ms: int = 400, model_reload_interval: int = 3600):
         """
         Инициализация RPC обработчика с заданной конфигурацией.
 
         Аргументы:
             config: Объект конфигурации RabbitMQ
             max_retries: Максимальное количество попыток переподключения
+            batch_window_ms: Окно сбора пакета в миллисекундах
+            max_batch_size: Максимальный размер пакета
+            shard_count: Число шардов модели (0 - вся модель в этом процессе)
+            shard_timeout_ms: Ожидание ответов шардов в миллисекундах
+            model_reload_interval: Без артефакта модель переобучается из БД раз
+                в столько секунд (0 - только при старте)
         """
         self.config = config
         # Соединение с RabbitMQ
@@ -35,6 +71,24 @@ class RPCWorker:
         # Канал для работы с RabbitMQ
         self.channel: Optional[BlockingChannel] = None
         self.max_retries = max_retries
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        # Запросы текущего пакета: (delivery_tag, properties, body)
+        self.pending: List[Tuple[int, BasicProperties, bytes]] = []
+        self._flush_scheduled = False
+        # Модель и сессия живут все время работы воркера
+        self.session: Optional[Session] = None
+        self.recommendation_service = None
+        self._model_checked_at = 0.0
+        self._model_loaded_at = 0.0
+        self.model_reload_interval = model_reload_interval
+        self.shard_count = shard_count
+        self.shard_transport = ShardRPCTransport(config, shard_timeout_ms / 1000) if shard_count else None
+        self.coordinator = None
+        # Пользователи, ожидающие фонового обновления модели, и поток обновления
+        self._refresh_pending: set = set()
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread: Optional[threading.Thread] = None
 
     def connect(self) -> None:
         """
@@ -71,22 +125,208 @@ class RPCWorker:
                 else:
                     raise
 
-    def process_text(self, text: str) -> str:
+    def _get_service(self):
+        """
+        Сервис рекомендаций с обученной моделью.
+
+        Перезагружается при новом артефакте, а без артефактов (модель из БД) -
+        раз в model_reload_interval, чтобы учесть заказы и пользователей,
+        появившиеся после старта.
+        """
+        from services.recommendation_service import RecommendationService
+        from services.model_artifact import latest_artifact
+        from database.config import get_settings
+
+        service = self.recommendation_service
+        now = time.monotonic()
+        if service is not None and now - self._model_checked_at < self.MODEL_CHECK_INTERVAL:
+            return service
+        self._model_checked_at = now
+
+        if service is not None:
+            latest = latest_artifact(get_settings().MODEL_ARTIFACT_DIR)
+            if latest is None:
+                if not self.model_reload_interval or now - self._model_loaded_at < self.model_reload_interval:
+                    return service
+                logger.info(f"Артефакта модели нет, переобучаем из БД "
+                            f"(модели {now - self._model_loaded_at:.0f}s)")
+            elif latest.stem.endswith(str(service.model_version)):
+                return service
+            else:
+                logger.info(f"Найден новый артефакт модели {latest.name}, перезагружаем")
+
+        if self.session is not None:
+            self.session.close()
+        # expire_on_commit=False: товары в кэше модели должны пережить коммиты
+        self.session = Session(engine, expire_on_commit=False)
+        service = RecommendationService(self.session)
+        if self.shard_count:
+            # Матрицу держат шарды, координатору нужны популярность и каталог товаров
+            from services.sharding import ShardCoordinator
+            latest = latest_artifact(get_settings().MODEL_ARTIFACT_DIR)
+            if latest is None:
+                raise ValueError("Шардированный режим требует артефакт модели (services.offline_trainer)")
+            self.coordinator = ShardCoordinator.from_artifact(latest, self.shard_transport, self.shard_count)
+            service.model_version = self.coordinator.model_version
+            logger.info(f"Координатор {self.shard_count} шардов, модель {service.model_version}")
+            try:
+                missing = self.shard_transport.missing_shards(self.shard_count)
+            except Exception as e:
+                missing = []
+                logger.warning(f"Не удалось проверить очереди шардов: {e}")
+            if missing:
+                logger.error(f"Шарды {missing} не запущены: число сервисов ml_shard_N "
+                             f"должно совпадать с SHARD_COUNT={self.shard_count}")
+        else:
+            logger.info(f"Модель загружена: {service.train_model(prefer_artifact=True)}")
+        self.recommendation_service = service
+        self._model_loaded_at = now
+        return service
+
+    def schedule_refresh(self, user_ids: List[int]) -> None:
+        """Постановка пользователей в фоновое обновление; идущее обновление заберет их следующим"""
+        with self._refresh_lock:
+            self._refresh_pending.update(user_ids)
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh_loop, name="model-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            with self._refresh_lock:
+                user_ids, self._refresh_pending = sorted(self._refresh_pending), set()
+                if not user_ids:
+                    self._refresh_thread = None
+                    return
+            try:
+                logger.info(f"Модель обновлена: {self.refresh_model(user_ids)}")
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении модели: {e}")
+
+    def refresh_model(self, user_ids: List[int]) -> Dict:
+        """
+        Инкрементальное обновление модели, которая обслуживает запросы.
+
+        Выполняется в потоке обновления на копии модели (fork) со своей
+        сессией: строки пользователей перечитываются из БД (refresh_users),
+        их рекомендации пересчитываются одним пакетом и сохраняются в БД,
+        откуда их читает GET /recommendations/. Готовая копия подменяет
+        модель в потоке соединения, между обработкой пакетов.
+        """
+        from models.recommendation import ModelType
+
+        service = self.recommendation_service
+        if service is None:
+            return {"status": "skipped", "reason": "model_not_loaded", "user_ids": len(user_ids)}
+        if self.coordinator is not None:
+            # Шарды держат срез артефакта: новые заказы попадут в следующий артефакт
+            return {"status": "skipped", "reason": "sharded", "user_ids": len(user_ids)}
+
+        session = Session(engine, expire_on_commit=False)
+        try:
+            updated = service.fork(session)
+            stats = updated.refresh_users(user_ids)
+            batch = updated.generate_recommendations_batch(user_ids, n_recommendations=self.REFRESH_RECOMMENDATIONS)
+            saved = 0
+            for user_id, (product_ids, scores) in batch.items():
+                recommendations = updated._get_product_details(product_ids, scores)
+                if recommendations:
+                    updated.save_recommendations_to_db(user_id, recommendations, ModelType.COLLABORATIVE)
+                    saved += 1
+        except Exception:
+            session.close()
+            raise
+        stats["recommendations_saved"] = saved
+
+        connection = self.connection
+        if connection is None or not connection.is_open:
+            session.close()
+            return stats
+        # Следующее обновление должно начаться с этой копии, поэтому ждем подмены
+        swapped = threading.Event()
+        connection.add_callback_threadsafe(lambda: self._swap_service(service, updated, swapped))
+        if not swapped.wait(self.SWAP_TIMEOUT):
+            logger.warning("Подмена модели не выполнена за отведенное время")
+        return stats
+
+    def _swap_service(self, previous, updated, swapped: threading.Event) -> None:
+        """Подмена модели обновленной копией (в потоке соединения)"""
+        try:
+            self._replace_service(previous, updated)
+        finally:
+            swapped.set()
+
+    def _replace_service(self, previous, updated) -> None:
+        if self.recommendation_service is not previous:
+            # Модель успела перезагрузиться из нового артефакта или БД
+            updated.session.close()
+            logger.info("Обновленная копия модели устарела и отброшена")
+            return
+        old_session, self.session = self.session, updated.session
+        self.recommendation_service = updated
+        if old_session is not None:
+            old_session.close()
+
+    def score_batch(self, requests: List[Dict]) -> List[Dict]:
         """
-        Обработка входящего текста.
+        Оценка пакета запросов одним вызовом модели.
 
         Аргументы:
-            text: Входящий текст для обработки
+            requests: Запросы вида {"user_id", "count", "exclude", "cart"}
 
         Возвращает:
-            str: Обработанный текст
+            List[Dict]: Ответы в порядке запросов
         """
-        return do_task(text)
+        service = self._get_service()
+        depth = max(request["count"] + len(request["exclude"]) for request in requests)
+        scored: List[Optional[Tuple[List[int], List[float]]]] = [None] * len(requests)
+        plain = []
+        for idx, request in enumerate(requests):
+            # Шарды не хранят количества покупок и IDF: в шардированном режиме
+            # корзина только исключается из ответа
+            if request["cart"] and self.coordinator is None:
+                scored[idx] = service.generate_recommendations_session(
+                    request["user_id"], request["cart"], n_recommendations=depth
+                )
+            else:
+                plain.append(idx)
+
+        if plain:
+            user_ids = [requests[idx]["user_id"] for idx in plain]
+            if self.coordinator is not None:
+                batch = self.coordinator.recommend_batch(user_ids, n_recommendations=depth)
+            else:
+                batch = service.generate_recommendations_batch(user_ids, n_recommendations=depth)
+            for idx in plain:
+                scored[idx] = batch[requests[idx]["user_id"]]
+
+        responses = []
+        for request, (product_ids, scores) in zip(requests, scored):
+            pairs = [(pid, score) for pid, score in zip(product_ids, scores)
+                     if pid not in request["exclude"]][:request["count"]]
+            responses.append({
+                "status": "ok",
+                "user_id": request["user_id"],
+                "model_version": service.model_version,
+                "recommendations": service._get_product_details(
+                    [pid for pid, _ in pairs], [score for _, score in pairs]
+                )
+            })
+        return responses
+
+    def _reply(self, props: BasicProperties, response: Dict) -> None:
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=props.reply_to,
+            properties=pika.BasicProperties(correlation_id=props.correlation_id),
+            body=json.dumps(response, default=str).encode()
+        )
 
     def on_request(self, ch: BlockingChannel, method: Basic.Deliver,
-                  props: BasicProperties, body: bytes) -> None:
+                   props: BasicProperties, body: bytes) -> None:
         """
-        Обработчик входящих RPC запросов.
+        Обработчик входящих RPC запросов: добавляет запрос в текущий пакет.
 
         Аргументы:
             ch: Канал RabbitMQ
@@ -94,24 +334,75 @@ class RPCWorker:
             props: Свойства сообщения
             body: Тело сообщения
         """
-        try:
-            text = body.decode()
-            logger.info(f"Получен RPC запрос: {text}")
+        self.pending.append((method.delivery_tag, props, body))
 
-            response = self.process_text(text)
+        if len(self.pending) >= self.max_batch_size:
+            self.flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.connection.call_later(self.batch_window, self._scheduled_flush)
 
-            # Отправляем ответ обратно
-            ch.basic_publish(
-                exchange='',
-                routing_key=props.reply_to,
-                properties=pika.BasicProperties(correlation_id=props.correlation_id),
-                body=response.encode()
-            )
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            logger.error(f"Ошибка при обработке RPC запроса: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag)
-            time.sleep(0.5)  # Небольшая задержка перед следующей попыткой
+    def _scheduled_flush(self) -> None:
+        self._flush_scheduled = False
+        self.flush()
+
+    def flush(self) -> None:
+        """Оценка накопленного пакета и отправка ответов"""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+
+        now = time.time()
+        requests, targets, expired = [], [], 0
+        refresh_ids: List[int] = []
+        for delivery_tag, props, body in batch:
+            try:
+                data = json.loads(body.decode())
+                if data.get("task_type") == "refresh_model":
+                    refresh_ids.extend(int(user_id) for user_id in data.get("user_ids") or [])
+                    continue
+                cart = [int(product_id) for product_id in data.get("cart") or []]
+                request = {
+                    "user_id": int(data["user_id"]),
+                    "count": int(data.get("count", 10)),
+                    "exclude": set(data.get("exclude") or []) | set(cart),
+                    "cart": cart
+                }
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(props, {"status": "error", "error": f"Некорректный запрос: {e}"})
+                continue
+
+            # Клиент уже не ждет ответа
+            deadline = data.get("deadline")
+            if deadline is not None and deadline < now:
+                expired += 1
+                continue
+
+            requests.append(request)
+            targets.append(props)
+
+        if requests:
+            started = time.perf_counter()
+            try:
+                responses = self.score_batch(requests)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке RPC пакета: {e}")
+                responses = [{"status": "error", "error": str(e)}] * len(requests)
+
+            for props, response in zip(targets, responses):
+                self._reply(props, response)
+            logger.info(f"Пакет из {len(requests)} запросов обработан за "
+                        f"{(time.perf_counter() - started) * 1000:.1f} ms")
+
+        if expired:
+            logger.warning(f"Пропущено {expired} запросов с истекшим дедлайном")
+
+        if refresh_ids:
+            # Обновление не задерживает запросы реального времени
+            self.schedule_refresh(refresh_ids)
+
+        # Все сообщения пакета - последние неподтвержденные, подтверждаем разом
+        self.channel.basic_ack(delivery_tag=max(tag for tag, _, _ in batch), multiple=True)
 
     def start_consuming(self) -> None:
         """Запуск прослушивания RPC запросов."""
@@ -119,8 +410,15 @@ class RPCWorker:
             if not self.channel:
                 self.connect()
 
-            # Настраиваем очередь и начинаем прослушивание
-            self.channel.basic_qos(prefetch_count=1)
+            # Модель загружается до приема запросов, иначе первые клиенты уйдут по таймауту
+            try:
+                self._get_service()
+            except Exception as e:
+                logger.error(f"Не удалось загрузить модель: {e}")
+
+            # Настраиваем очередь и начинаем прослушивание,
+            # запас prefetch нужен, чтобы пакет успевал набираться
+            self.channel.basic_qos(prefetch_count=self.max_batch_size * 2)
             self.channel.basic_consume(
                 queue=self.config.rpc_queue_name,
                 on_message_callback=self.on_request
@@ -138,6 +436,11 @@ class RPCWorker:
     def cleanup(self) -> None:
         """Безопасное закрытие соединений."""
         try:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
+            if self.shard_transport is not None:
+                self.shard_transport.close()
             if self.channel and not self.channel.is_closed:
                 self.channel.close()
             if self.connection and not self.connection.is_closed:
@@ -0,0 +1,237 @@
+# ml_worker/rmq/shardworker.py
+import pika
+import time
+import uuid
+import json
+import logging
+from rmq.rmqconf import RabbitMQConfig
+from typing import Dict, List, Optional
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.spec import Basic, BasicProperties
+
+# Настраиваем общий уровень логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+logger = logging.getLogger(__name__)
+
+
+def shard_queue(config: RabbitMQConfig, shard: int) -> str:
+    """Очередь запросов шарда"""
+    return f"{config.rpc_queue_name}_shard_{shard}"
+
+
+class ShardRPCTransport:
+    """
+    Scatter-gather запросов координатора к шардам через RabbitMQ.
+
+    Использует собственное соединение: координатор вызывает gather из
+    обработчика сообщений RPCWorker, а обрабатывать события соединения,
+    на котором выполняется обработчик, из него самого нельзя.
+    """
+
+    def __init__(self, config: RabbitMQConfig, timeout: float = 0.4):
+        self.config = config
+        self.timeout = timeout
+        self.connection: Optional[pika.BlockingConnection] = None
+        self.channel: Optional[BlockingChannel] = None
+        self.callback_queue: Optional[str] = None
+        self.responses: Dict[str, Dict] = {}
+        # correlation_id запросов, чьи ответы еще ждут: опоздавшие ответы не сохраняются
+        self._pending: set = set()
+
+    def _ensure_connected(self) -> None:
+        if self.connection is not None and self.connection.is_open:
+            return
+        self.connection = pika.BlockingConnection(self.config.get_connection_params())
+        self.channel = self.connection.channel()
+        result = self.channel.queue_declare(queue='', exclusive=True)
+        self.callback_queue = result.method.queue
+        self.channel.basic_consume(
+            queue=self.callback_queue,
+            on_message_callback=self._on_response,
+            auto_ack=True
+        )
+
+    def _on_response(self, ch, method, props: BasicProperties, body: bytes) -> None:
+        if props.correlation_id not in self._pending:
+            logger.debug(f"Ответ шарда после таймаута отброшен: {props.correlation_id}")
+            return
+        self.responses[props.correlation_id] = json.loads(body.decode())
+
+    def gather(self, requests: Dict[int, Dict]) -> Dict[int, Dict]:
+        """
+        Отправка запросов всем шардам сразу и ожидание всех ответов.
+
+        Raises:
+            TimeoutError: Какой-то шард не ответил за timeout
+        """
+        self._ensure_connected()
+        pending = {}
+        for shard, request in requests.items():
+            correlation_id = uuid.uuid4().hex
+            pending[correlation_id] = shard
+            self._pending.add(correlation_id)
+            self.channel.basic_publish(
+                exchange='',
+                routing_key=shard_queue(self.config, shard),
+                properties=pika.BasicProperties(
+                    reply_to=self.callback_queue,
+                    correlation_id=correlation_id,
+                    expiration=str(max(1, int(self.timeout * 1000)))
+                ),
+                body=json.dumps(request).encode()
+            )
+
+        deadline = time.monotonic() + self.timeout
+        while any(correlation_id not in self.responses for correlation_id in pending):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                missing = sorted(shard for correlation_id, shard in pending.items()
+                                 if correlation_id not in self.responses)
+                for correlation_id in pending:
+                    self._pending.discard(correlation_id)
+                    self.responses.pop(correlation_id, None)
+                raise TimeoutError(f"Шарды {missing} не ответили за {self.timeout:.2f}s")
+            self.connection.process_data_events(time_limit=remaining)
+
+        self._pending.difference_update(pending)
+        return {shard: self.responses.pop(correlation_id) for correlation_id, shard in pending.items()}
+
+    def missing_shards(self, n_shards: int) -> List[int]:
+        """
+        Шарды, у очереди которых нет подписчика.
+
+        Сервисы ml_shard_N в docker-compose.yaml перечислены явно, поэтому
+        при SHARD_COUNT больше их числа часть очередей никто не слушает.
+        """
+        self._ensure_connected()
+        missing = []
+        for shard in range(n_shards):
+            # Пассивное объявление несуществующей очереди закрывает канал, поэтому канал отдельный
+            channel = self.connection.channel()
+            try:
+                result = channel.queue_declare(queue=shard_queue(self.config, shard), passive=True)
+                if result.method.consumer_count == 0:
+                    missing.append(shard)
+            except pika.exceptions.ChannelClosedByBroker:
+                missing.append(shard)
+            finally:
+                if channel.is_open:
+                    channel.close()
+        return missing
+
+    def close(self) -> None:
+        if self.connection is not None and self.connection.is_open:
+            self.connection.close()
+
+
+class ShardWorker:
+    """
+    Шард модели рекомендаций.
+
+    Держит строки TF-IDF модели своих пользователей (хеш id по числу шардов)
+    и отвечает координатору векторами пользователей и локальным top-K соседей.
+    """
+
+    # Как часто проверять появление нового артефакта модели (сек)
+    MODEL_CHECK_INTERVAL = 30
+
+    def __init__(self, config: RabbitMQConfig, shard: int, n_shards: int, max_retries: int = 3):
+        self.config = config
+        self.shard = shard
+        self.n_shards = n_shards
+        self.max_retries = max_retries
+        self.queue = shard_queue(config, shard)
+        self.connection: Optional[pika.BlockingConnection] = None
+        self.channel: Optional[BlockingChannel] = None
+        self.model = None
+        self._model_checked_at = 0.0
+
+    def connect(self) -> None:
+        """Подключение к RabbitMQ с повторными попытками"""
+        for attempt in range(self.max_retries):
+            try:
+                self.connection = pika.BlockingConnection(self.config.get_connection_params())
+                self.channel = self.connection.channel()
+                self.channel.queue_declare(queue=self.queue)
+                logger.info(f"Шард {self.shard}/{self.n_shards} подключен к RabbitMQ")
+                return
+            except Exception as e:
+                logger.error(f"Попытка подключения {attempt + 1} не удалась: {e}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(2 ** attempt)
+                else:
+                    raise
+
+    def _get_model(self):
+        """Строки шарда из последнего артефакта, перезагружаются при новой версии"""
+        from services.sharding import ShardModel
+        from services.model_artifact import latest_artifact
+        from database.config import get_settings
+
+        now = time.monotonic()
+        if self.model is not None and now - self._model_checked_at < self.MODEL_CHECK_INTERVAL:
+            return self.model
+        self._model_checked_at = now
+
+        latest = latest_artifact(get_settings().MODEL_ARTIFACT_DIR)
+        if latest is None:
+            if self.model is None:
+                raise ValueError("Шардированный режим требует артефакт модели (services.offline_trainer)")
+            return self.model
+        if self.model is not None and latest.stem.endswith(str(self.model.model_version)):
+            return self.model
+
+        started = time.perf_counter()
+        self.model = ShardModel.from_artifact(latest, self.shard, self.n_shards)
+        logger.info(f"Шард {self.shard}: {len(self.model.user_index)} пользователей модели "
+                    f"{self.model.model_version} загружены за {time.perf_counter() - started:.1f}s")
+        return self.model
+
+    def on_request(self, ch: BlockingChannel, method: Basic.Deliver,
+                   props: BasicProperties, body: bytes) -> None:
+        """Обработка запроса координатора и ответ в reply_to"""
+        try:
+            response = self._get_model().handle(json.loads(body.decode()))
+        except Exception as e:
+            logger.error(f"Ошибка шарда {self.shard}: {e}")
+            response = {"status": "error", "shard": self.shard, "error": str(e)}
+
+        ch.basic_publish(
+            exchange='',
+            routing_key=props.reply_to,
+            properties=pika.BasicProperties(correlation_id=props.correlation_id),
+            body=json.dumps(response).encode()
+        )
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    def start_consuming(self) -> None:
+        """Загрузка строк шарда и прослушивание очереди"""
+        try:
+            if not self.channel:
+                self.connect()
+            try:
+                self._get_model()
+            except Exception as e:
+                logger.error(f"Не удалось загрузить шард модели: {e}")
+
+            self.channel.basic_qos(prefetch_count=4)
+            self.channel.basic_consume(queue=self.queue, on_message_callback=self.on_request)
+            logger.info(f"Шард {self.shard} слушает очередь {self.queue}")
+            self.channel.start_consuming()
+        except KeyboardInterrupt:
+            logger.info("Завершение работы шарда...")
+        except Exception as e:
+            logger.error(f"Ошибка во время прослушивания: {e}")
+        finally:
+            self.cleanup()
+
+    def cleanup(self) -> None:
+        try:
+            if self.channel and not self.channel.is_closed:
+                self.channel.close()
+            if self.connection and not self.connection.is_closed:
+                self.connection.close()
+            logger.info("Соединения успешно закрыты")
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии соединений: {e}")